@@ -6,6 +6,7 @@ Validates content before loading into RLM storage.
 
 import json
 import sys
+from pathlib import Path
 
 
 def estimate_tokens(content: str) -> int:
@@ -13,8 +14,8 @@ def estimate_tokens(content: str) -> int:
     return len(content) // 4
 
 
-def validate_content(content: str) -> dict:
-    """Validate content for RLM loading."""
+def validate_content(content: str, appending: bool = False) -> dict:
+    """Validate content for RLM loading (or appending to a loaded context)."""
     issues = []
     warnings = []
     
@@ -26,7 +27,7 @@ def validate_content(content: str) -> dict:
     # Check size
     tokens = estimate_tokens(content)
     
-    if tokens < 100:
+    if tokens < 100 and not appending:
         warnings.append(f"Content is very short ({tokens} tokens). RLM is optimized for large contexts.")
     
     if tokens > 50_000_000:  # 50M tokens
@@ -55,6 +56,20 @@ def validate_content(content: str) -> dict:
     }
 
 
+def validate_path(path: str, tool_name: str) -> dict:
+    """Validate a path-based load (rlm_load_file / rlm_load_directory / rlm_append)."""
+    target = Path(path).expanduser()
+    issues = []
+    
+    if tool_name.endswith("rlm_load_directory"):
+        if not target.is_dir():
+            issues.append(f"Directory not found: {path}")
+    elif not target.is_file():
+        issues.append(f"File not found: {path}")
+    
+    return {"valid": len(issues) == 0, "issues": issues, "warnings": []}
+
+
 def main():
     """Validate RLM load operation."""
     try:
@@ -66,10 +81,20 @@ def main():
     # Get tool input
     tool_input = input_data.get("tool_input", {})
     arguments = input_data.get("arguments", tool_input)
+    
+    # File and directory loads stream from disk; only check the path exists
+    if "path" in arguments:
+        result = validate_path(arguments["path"], input_data.get("tool_name", ""))
+        if not result["valid"]:
+            print(f"RLM Load blocked: {', '.join(result['issues'])}", file=sys.stderr)
+            sys.exit(2)
+        print(json.dumps({"validated": True, "path": arguments["path"]}))
+        sys.exit(0)
+    
     content = arguments.get("content", "")
     
-    # Validate
-    result = validate_content(content)
+    # Validate (appends are usually small, which is fine)
+    result = validate_content(content, input_data.get("tool_name", "").endswith("rlm_append"))
     
     if not result["valid"]:
         # Block the operation
@@ -4,7 +4,7 @@ RLM (Recursive Language Model) MCP Server Package
 Implements MIT's RLM technique for infinite context processing.
 """
 
-from .rlm_server import RLMServer, ContextStore, SearchResult, RecursiveQuery
+from .rlm_server import RLMServer, ContextStore, SearchResult, RecursiveQuery, InvertedIndex
 
-__all__ = ["RLMServer", "ContextStore", "SearchResult", "RecursiveQuery"]
+__all__ = ["RLMServer", "ContextStore", "SearchResult", "RecursiveQuery", "InvertedIndex"]
 __version__ = "1.0.0"
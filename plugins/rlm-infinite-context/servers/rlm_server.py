@@ -11,18 +11,55 @@ symbolically interact with.
 """
 
 import asyncio
+import codecs
+import fnmatch
+import heapq
+import itertools
 import json
 import logging
+import math
+import mmap
+import multiprocessing
+import multiprocessing.connection
 import os
 import re
 import sys
-from dataclasses import dataclass, field, asdict
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict, replace
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Optional
-from collections import defaultdict
+from typing import Any, Iterable, Iterator, Optional
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict, defaultdict
+from functools import partial
+from operator import itemgetter
 import hashlib
 
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+# Optional: vectorised TF-IDF scoring, and LSA (truncated SVD) on top of it
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    from scipy.sparse import csc_matrix
+    from scipy.sparse.linalg import svds
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
 # Configure logging to stderr (MCP requirement)
 logging.basicConfig(
     level=logging.INFO,
@@ -31,18 +68,1618 @@ logging.basicConfig(
 )
 logger = logging.getLogger("rlm-server")
 
+# Bytes read per block when streaming files from disk
+READ_BLOCK_SIZE = 1 << 20
+
+# Regex scans decode content in segments of about this many bytes; each
+# segment reads a little before (lookbehind, ^) and after (matches crossing
+# the segment end) its own range
+SCAN_SEGMENT_SIZE = 8 << 20
+SCAN_LOOKBACK = 256
+SCAN_MARGIN = 64 << 10
+
+# With RLM_WORKERS > 1, scans of at least this many bytes run in a process
+# pool, split into about this many shards per worker to even out the load
+PARALLEL_SCAN_MIN_BYTES = 4 << 20
+SHARDS_PER_WORKER = 4
+
+# Time budget of the regex scans of one query (RLM_REGEX_TIMEOUT_MS; 0 =
+# unbounded, scanning in-process). Guard processes stream the matches found
+# so far back to the server in batches of at most this many matches or
+# seconds; a batch pending when a scan is killed is lost
+REGEX_TIMEOUT_MS = 5000
+GUARD_BATCH = 256
+GUARD_FLUSH_SECONDS = 0.05
+
+# Longest JSON-RPC line accepted on stdin (rlm_load carries content inline)
+MAX_REQUEST_BYTES = 1 << 30
+# Requests and responses larger than this are decoded and encoded in the
+# executor, so a big inline load or chunk does not stall the event loop
+OFFLOAD_JSON_BYTES = 256 << 10
+
+# Default memory cap of the query-result cache (RLM_CACHE_MB)
+CACHE_MB = 64
+
+# Approximate heap cost of a loaded context, for RLM_MAX_MEMORY_MB: per chunk
+# record, per inverted-index posting and per trigram posting (measured with
+# tracemalloc, vocabulary and dict overhead included)
+CHUNK_RECORD_BYTES = 480
+POSTING_BYTES = 40
+TRIGRAM_POSTING_BYTES = 5
+# and per entry of the vector index's dicts (chunk norms, term columns)
+VECTOR_ENTRY_BYTES = 100
+
+# Recursive-search selections remembered per server (LRU)
+MAX_VIEWS = 256
+
+# Search cursors (rlm_search_next): seconds a cursor lives after its last
+# use, and how many are kept at most
+CURSOR_TTL = 600
+MAX_CURSORS = 256
+
+# Heading lines indexed for rlm_outline: markdown, book sections, code
+# definitions and HTML headings
+OUTLINE_PATTERN = re.compile(
+    r'^(?:(?P<md>#{1,6})[ \t]+(?P<md_title>[^\n]+)'
+    r'|(?P<book>Part|Chapter|Section)[ \t]+(?:[IVXLC]+|\d+(?:\.\d+)*)\b[^\n]*'
+    r'|(?P<indent>[ \t]*)(?:async[ \t]+def|def|class)[ \t]+(?P<code>\w+)'
+    r'|[ \t]*<h(?P<h>[1-6])[^>]*>(?P<h_title>[^\n]*?)</h[1-6]>)',
+    re.MULTILINE
+)
+BOOK_LEVELS = {"Part": 1, "Chapter": 1, "Section": 2}
+OUTLINE_PAGE_SIZE = 100
+
+# Match offsets included per search result
+MAX_RESULT_MATCHES = 10
+
+# Snippet mode: characters shown on each side of a match, and the token
+# budget for the snippets of one result
+SNIPPET_RADIUS = 160
+SNIPPET_TOKENS = 200
+
+# Vector search: most chunks returned per query, and the default number of
+# LSA dimensions (RLM_LSA_DIMS; 0 = plain TF-IDF, LSA needs NumPy and SciPy)
+VECTOR_MAX_RESULTS = 1000
+LSA_DIMS = 0
+
+# Boolean queries (search_type="boolean"): the structure that makes `auto`
+# treat a query as one (balanced quoted phrases, or an operator between
+# operands in parentheses, NEAR/n between words, a file:/ext: field; bare
+# uppercase words like "404 NOT FOUND" are prose), query syntax, the NEAR
+# distance (words allowed between the operands) when none is given, and the
+# fields that filter on file metadata
+BOOLEAN_PHRASES = re.compile(r'[^"]*(?:"[^"]*\w[^"]*"[^"]*)+')
+BOOLEAN_STRUCTURE = re.compile(
+    r'\([^()]*\S\s+(?:AND|OR|NOT|NEAR(?:/\d+)?)\s+[^()]*\S[^()]*\)'
+    r'|\S\s+NEAR/\d+\s+\S|(?:^|[\s(])(?:file|ext):(?!//)[^\s()]')
+QUERY_TOKEN = re.compile(
+    r'\s*(?:"(?P<phrase>[^"]*)"?'
+    r'|(?P<paren>[()])'
+    r'|(?P<op>AND|OR|NOT|NEAR(?:/(?P<distance>\d+))?)(?=[\s()"]|$)'
+    r'|(?P<field>file|ext):(?:"(?P<quoted>[^"]*)"|(?P<value>[^\s()"]+))'
+    r'|(?P<word>[^\s()"]+))'
+)
+NEAR_DISTANCE = 10
+
+# Query planner (search_type="auto"). A section reference is a heading
+# keyword and one name or number. Literal strings never contain these regex
+# constructs: escapes like \d, classes with ranges, escapes or negation,
+# repeated wildcards or classes, counted repeats, alternation between words,
+# anchors, flagged groups. Prose does not either, so they make any query a
+# regex; a single token is also one with a repeated group, a bare `|` or an
+# optional character mid-token. Words may end in a prefix `*` or sentence
+# punctuation.
+SECTION_QUERY = re.compile(
+    r'(?:chapter|section|part|appendix|def|class|function)\s+[\w.]+', re.IGNORECASE)
+STRONG_REGEX_SIGNAL = re.compile(
+    r'\\[A-Za-z]|\[(?:\^|[^\]]*[-\\])[^\]]*\]|[.\]][*+?{]|\{\d+(?:,\d*)?\}|\w\|\w'
+    r'|^\^|\$$|\(\?')
+REGEX_SIGNAL = re.compile(STRONG_REGEX_SIGNAL.pattern + r'|\||\)[*+?{]|\w\?(?=\S)')
+WORDS_QUERY = re.compile(r"[\w\s'*-]*[?!.,;:]*")
+# Planner cost units, about a microsecond each: reading one posting entry,
+# and per KB of chunk text a substring check (decode, lowercase, find) or a
+# regex scan
+PLAN_POSTING_COST = 1
+PLAN_VERIFY_COST = 3
+PLAN_SCAN_COST = 30
+
+# rlm_multi_search: most patterns per call, and hits listed per pattern
+MAX_MULTI_PATTERNS = 100
+MULTI_HITS = 10
+
+# Word terms used for indexing (identifiers like rlm_search stay whole)
+TERM_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lowercase word terms."""
+    return TERM_PATTERN.findall(text.lower())
+
+
+class InvertedIndex:
+    """
+    Term -> posting list index over the chunks of one context.
+
+    Each posting list maps chunk_id -> term frequency, so a keyword lookup
+    only touches the chunks that actually contain the term instead of
+    scanning every chunk of the context. Chunk lengths are kept alongside
+    the postings for BM25 length normalisation.
+    """
+
+    # BM25 parameters (Robertson/Sparck Jones defaults)
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.postings: dict[str, dict[int, int]] = {}
+        self.chunk_lengths: dict[int, int] = {}
+        self.total_length = 0
+        self._vocabulary: Optional[list[str]] = None
+
+    def add_chunk(self, chunk_id: int, text: str) -> Counter:
+        """Index a chunk's terms. Returns the chunk's term frequencies."""
+        term_freqs = Counter(tokenize(text))
+        self.add_term_freqs(chunk_id, term_freqs)
+        return term_freqs
+
+    def remove_chunk(self, chunk_id: int, term_freqs: dict[str, int]):
+        """Drop a chunk's postings (e.g. when it is re-opened by an append)."""
+        for term in term_freqs:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(chunk_id, None)
+                if not posting:
+                    del self.postings[term]
+        self.total_length -= self.chunk_lengths.pop(chunk_id, 0)
+        self._vocabulary = None
+
+    def add_term_freqs(self, chunk_id: int, term_freqs: dict[str, int]):
+        """Index a chunk from precomputed term frequencies."""
+        for term, count in term_freqs.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+            posting[chunk_id] = count
+        length = sum(term_freqs.values())
+        self.chunk_lengths[chunk_id] = length
+        self.total_length += length
+        self._vocabulary = None
+
+    def lookup(self, term: str) -> dict[int, int]:
+        """Posting list for an exact term."""
+        return self.postings.get(term, {})
+
+    def expand(self, term: str) -> list[str]:
+        """
+        Resolve a term to the indexed terms it matches: the term itself
+        plus every indexed term it is a prefix of ("auth" -> "authentication").
+        """
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        vocabulary = self._vocabulary
+        matched = []
+        i = bisect_left(vocabulary, term)
+        while i < len(vocabulary) and vocabulary[i].startswith(term):
+            matched.append(vocabulary[i])
+            i += 1
+        return matched
+
+    def containing(self, fragment: str) -> list[str]:
+        """Indexed terms a fragment occurs in ("token" -> "access_token", "tokens")."""
+        return [term for term in self.postings if fragment in term]
+
+    def idf(self, term: str) -> float:
+        """BM25 inverse document frequency (never negative)."""
+        doc_count = len(self.chunk_lengths)
+        doc_freq = len(self.postings.get(term, ()))
+        return math.log(1 + (doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def bm25(self, terms: list[str]) -> dict[int, float]:
+        """
+        Score chunks against query terms with Okapi BM25.
+        
+        Only the postings of the query terms are walked, so the cost depends
+        on how common the terms are rather than on the size of the context.
+        """
+        if not self.chunk_lengths:
+            return {}
+        avg_length = self.total_length / len(self.chunk_lengths) or 1
+        scores: dict[int, float] = defaultdict(float)
+        for term in terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = self.idf(term)
+            for chunk_id, tf in posting.items():
+                norm = self.K1 * (1 - self.B + self.B * self.chunk_lengths[chunk_id] / avg_length)
+                scores[chunk_id] += idf * tf * (self.K1 + 1) / (tf + norm)
+        return scores
+
+
+class TrigramIndex:
+    """
+    Trigram -> posting list index used to prefilter regex searches.
+    
+    In the style of Google Code Search: a regex is reduced to the trigrams
+    any match must contain (see regex_trigram_query) and only chunks whose
+    postings satisfy that query are handed to `re`. Trigrams come from the
+    lowercased chunk text, so the filter also holds for IGNORECASE patterns.
+    Postings are arrays of ascending chunk ids.
+    """
+    
+    # Trigrams found in more than this share of chunks barely narrow the
+    # candidates, so they are ignored when evaluating a query
+    COMMON_RATIO = 0.5
+    
+    def __init__(self):
+        self.postings: dict[str, array] = {}
+        self.chunk_count = 0
+    
+    @staticmethod
+    def trigrams(text: str) -> set[str]:
+        text = text.lower()
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+    
+    def add_chunk(self, chunk_id: int, text: str):
+        """Index a chunk; ids must be added in ascending order."""
+        for gram in self.trigrams(text):
+            posting = self.postings.get(gram)
+            if posting is None:
+                posting = self.postings[gram] = array('I')
+            posting.append(chunk_id)
+        self.chunk_count += 1
+    
+    def remove_last_chunk(self, chunk_id: int, text: str):
+        """Drop the highest-numbered chunk (re-opened by an append)."""
+        for gram in self.trigrams(text):
+            posting = self.postings.get(gram)
+            if posting and posting[-1] == chunk_id:
+                posting.pop()
+                if not posting:
+                    del self.postings[gram]
+        self.chunk_count -= 1
+    
+    def candidates(self, query) -> Optional[set[int]]:
+        """
+        Evaluate a trigram query to the chunk ids that may match.
+        
+        Returns None when the query does not constrain the chunks. A chunk
+        also qualifies when a trigram is found in its successor, so matches
+        that cross one chunk boundary are not filtered out; queries never
+        require what a match may only reach further on (see
+        regex_trigram_query).
+        """
+        if isinstance(query, str):
+            posting = self.postings.get(query, ())
+            if len(posting) > self.COMMON_RATIO * self.chunk_count:
+                return None
+            matched = set(posting)
+            matched.update(chunk_id - 1 for chunk_id in posting if chunk_id)
+            return matched
+        
+        op, items = query
+        if op == "or":
+            union = set()
+            for item in items:
+                matched = self.candidates(item)
+                if matched is None:
+                    return None
+                union |= matched
+            return union
+        
+        # AND: most selective trigrams first, stop once nothing is left
+        result = None
+        for item in sorted(items, key=self.estimate):
+            matched = self.candidates(item)
+            if matched is None:
+                continue
+            result = matched if result is None else result & matched
+            if not result:
+                break
+        return result
+    
+    def estimate(self, query) -> int:
+        """Rough candidate count of a query, for evaluation order."""
+        if isinstance(query, str):
+            return len(self.postings.get(query, ()))
+        return self.chunk_count
+
+
+class VectorIndex:
+    """
+    TF-IDF vectors of a context's chunks, for `vector` search.
+    
+    Built from the inverted index on first use: a term weighs
+    (1 + log tf) * idf in a chunk and chunk vectors are L2-normalised, so
+    the cosine similarity to a query is a sum over the postings of the
+    query's terms, and chunks sharing none of them are never touched. With
+    NumPy the weights are held column-wise (CSC: per term, a slice of chunk
+    ids and weights) and a query is a few gathers, a bincount and an
+    argpartition; without it the same sums run over the posting dicts.
+    
+    With `lsa_dims` > 0 (NumPy and SciPy) the matrix is also reduced with a
+    truncated SVD and chunks are ranked in that latent space instead, where
+    terms that occur in similar chunks stand in for each other.
+    """
+    
+    def __init__(self, index: InvertedIndex, chunk_count: int, lsa_dims: int = 0):
+        self.index = index
+        self.chunk_count = chunk_count
+        self.doc_count = len(index.chunk_lengths)
+        self.norms: dict[int, float] = {}
+        self.columns: Optional[dict[str, int]] = None
+        self.latent = None
+        if NUMPY_AVAILABLE:
+            self.build_matrix(lsa_dims)
+            return
+        
+        norms: dict[int, float] = defaultdict(float)
+        for posting in index.postings.values():
+            idf = self.idf(len(posting))
+            for chunk_id, tf in posting.items():
+                norms[chunk_id] += ((1 + math.log(tf)) * idf) ** 2
+        self.norms = {chunk_id: math.sqrt(n) for chunk_id, n in norms.items()}
+    
+    def idf(self, doc_freq: int) -> float:
+        """Smoothed inverse document frequency."""
+        return math.log((1 + self.doc_count) / (1 + doc_freq)) + 1
+    
+    def build_matrix(self, lsa_dims: int):
+        """Lay out the normalised weights as CSC arrays, plus the LSA factors."""
+        postings = list(self.index.postings.values())
+        self.columns = {term: i for i, term in enumerate(self.index.postings)}
+        lengths = np.fromiter(map(len, postings), dtype=np.int64, count=len(postings))
+        self.indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.indptr[1:])
+        total = int(self.indptr[-1])
+        self.rows = np.fromiter(itertools.chain.from_iterable(postings),
+                                dtype=np.int32, count=total)
+        tf = np.fromiter(itertools.chain.from_iterable(p.values() for p in postings),
+                         dtype=np.float32, count=total)
+        idf = (np.log((1 + self.doc_count) / (1 + lengths)) + 1).astype(np.float32)
+        weights = (1 + np.log(tf)) * np.repeat(idf, lengths)
+        norms = np.sqrt(np.bincount(self.rows, weights=weights * weights,
+                                    minlength=self.chunk_count))
+        norms[norms == 0] = 1
+        self.weights = (weights / norms[self.rows]).astype(np.float32)
+        
+        dims = min(lsa_dims, self.chunk_count - 1, len(postings) - 1)
+        if dims > 0 and SCIPY_AVAILABLE:
+            matrix = csc_matrix((self.weights, self.rows, self.indptr),
+                                shape=(self.chunk_count, len(postings)))
+            u, s, vt = svds(matrix, k=dims)
+            latent = u * s
+            lengths = np.linalg.norm(latent, axis=1)
+            lengths[lengths == 0] = 1
+            self.latent = (latent / lengths[:, None]).astype(np.float32)
+            self.components = vt.astype(np.float32)
+    
+    @property
+    def nbytes(self) -> int:
+        """Approximate heap size."""
+        if self.columns is None:
+            return len(self.norms) * VECTOR_ENTRY_BYTES
+        size = (len(self.columns) * VECTOR_ENTRY_BYTES + self.indptr.nbytes
+                + self.rows.nbytes + self.weights.nbytes)
+        if self.latent is not None:
+            size += self.latent.nbytes + self.components.nbytes
+        return size
+    
+    def search(self, terms: list[str], chunk_ids: Optional[set[int]] = None,
+               limit: int = VECTOR_MAX_RESULTS) -> dict[int, float]:
+        """
+        Cosine similarity of the best `limit` chunks (optionally among
+        `chunk_ids`) to a query made of indexed terms; zero scores are left out.
+        """
+        query = {term: self.idf(len(self.index.postings[term]))
+                 for term in dict.fromkeys(terms) if term in self.index.postings}
+        if not query:
+            return {}
+        query_norm = math.sqrt(sum(w * w for w in query.values()))
+        
+        if self.columns is None:
+            scores: dict[int, float] = defaultdict(float)
+            for term, idf in query.items():
+                # chunk weight (1 + log tf) * idf, query weight idf
+                weight = idf * idf / query_norm
+                for chunk_id, tf in self.index.postings[term].items():
+                    if chunk_ids is None or chunk_id in chunk_ids:
+                        scores[chunk_id] += (1 + math.log(tf)) * weight / self.norms[chunk_id]
+            if len(scores) > limit:
+                return dict(heapq.nlargest(limit, scores.items(), key=itemgetter(1)))
+            return scores
+        
+        columns = [self.columns[term] for term in query]
+        query_weights = np.fromiter(query.values(), dtype=np.float32) / query_norm
+        if self.latent is not None:
+            point = self.components[:, columns] @ query_weights
+            length = np.linalg.norm(point)
+            if not length:
+                return {}
+            scores = self.latent @ (point / length)
+        else:
+            spans = [slice(self.indptr[c], self.indptr[c + 1]) for c in columns]
+            scores = np.bincount(
+                np.concatenate([self.rows[span] for span in spans]),
+                weights=np.concatenate([self.weights[span] * w
+                                        for span, w in zip(spans, query_weights)]),
+                minlength=self.chunk_count)
+        hits = np.flatnonzero(scores > 0)
+        if chunk_ids is not None:
+            hits = hits[np.isin(hits, np.fromiter(chunk_ids, dtype=np.int64))]
+        if len(hits) > limit:
+            hits = hits[np.argpartition(scores[hits], -limit)[-limit:]]
+        return dict(zip(hits.tolist(), scores[hits].tolist()))
+
+
+def boolean_structure(query: str) -> bool:
+    """Whether `auto` should run a query as boolean (see BOOLEAN_STRUCTURE)."""
+    return bool(BOOLEAN_PHRASES.fullmatch(query) or BOOLEAN_STRUCTURE.search(query))
+
+
+def parse_boolean_query(query: str) -> tuple:
+    """
+    Parse a boolean query into a tree of tuples: ("word", term),
+    ("prefix", stem), ("phrase", terms), ("near", left, right, distance),
+    ("field", name, value), ("not", item), ("and", items), ("or", items).
+    
+    Operators are uppercase and juxtaposition means AND:
+    
+        or   := and ("OR" and)*
+        and  := not ["AND"] not ...
+        not  := "NOT" not | near
+        near := atom ("NEAR" | "NEAR/n") atom ...
+        atom := "(" or ")" | '"' words '"' | file:glob | ext:py | word | word*
+    
+    Words are split like indexed text, so `rate-limit` is the phrase
+    "rate limit". Raises ValueError for malformed queries.
+    """
+    tokens = []
+    position = 0
+    query = query.rstrip()
+    while position < len(query):
+        match = QUERY_TOKEN.match(query, position)
+        if match is None or match.end() == position:
+            raise ValueError(f"unexpected input at {query[position:position + 20]!r}")
+        position = match.end()
+        tokens.append(match)
+    tokens.append(None)
+    at = 0
+    
+    def peek(kind: str, value: Optional[str] = None) -> bool:
+        token = tokens[at]
+        return (token is not None and token.group(kind) is not None
+                and (value is None or token.group(kind) == value))
+    
+    def words(text: str) -> tuple:
+        terms = tokenize(text)
+        if not terms:
+            raise ValueError(f"{text!r} contains no searchable words")
+        return ("word", terms[0]) if len(terms) == 1 else ("phrase", tuple(terms))
+    
+    def atom() -> tuple:
+        nonlocal at
+        token = tokens[at]
+        at += 1
+        if token is None:
+            raise ValueError("query ends where a word, phrase or group was expected")
+        if token.group("paren") == "(":
+            item = disjunction()
+            if not peek("paren", ")"):
+                raise ValueError("missing closing parenthesis")
+            at += 1
+            return item
+        if token.group("phrase") is not None:
+            return words(token.group("phrase"))
+        if token.group("field") is not None:
+            value = token.group("quoted") if token.group("quoted") is not None else token.group("value")
+            return ("field", token.group("field"), value)
+        word = token.group("word")
+        if word is None:
+            raise ValueError(f"unexpected {token.group().strip()!r}")
+        if word.endswith("*"):
+            stem = tokenize(word[:-1])
+            if len(stem) != 1:
+                raise ValueError(f"{word!r}: wildcards apply to a single word")
+            return ("prefix", stem[0])
+        return words(word)
+    
+    def proximity() -> tuple:
+        nonlocal at
+        item = atom()
+        while peek("op") and tokens[at].group("op").startswith("NEAR"):
+            distance = tokens[at].group("distance")
+            at += 1
+            right = atom()
+            for side in (item, right):
+                if side[0] not in ("word", "prefix", "phrase", "near"):
+                    raise ValueError("NEAR joins words and phrases only")
+            item = ("near", item, right, int(distance) if distance else NEAR_DISTANCE)
+        return item
+    
+    def negation() -> tuple:
+        nonlocal at
+        if peek("op", "NOT"):
+            at += 1
+            return ("not", negation())
+        return proximity()
+    
+    def conjunction() -> tuple:
+        nonlocal at
+        items = [negation()]
+        while tokens[at] is not None and not peek("op", "OR") and not peek("paren", ")"):
+            if peek("op", "AND"):
+                at += 1
+            items.append(negation())
+        return items[0] if len(items) == 1 else ("and", items)
+    
+    def disjunction() -> tuple:
+        nonlocal at
+        items = [conjunction()]
+        while peek("op", "OR"):
+            at += 1
+            items.append(conjunction())
+        return items[0] if len(items) == 1 else ("or", items)
+    
+    if tokens[0] is None:
+        raise ValueError("empty query")
+    tree = disjunction()
+    if tokens[at] is not None:
+        raise ValueError(f"unexpected {tokens[at].group().strip()!r}")
+    return tree
+
+
+def boolean_terms(node: tuple, negated: bool = False) -> list[str]:
+    """The words and prefixes a boolean query looks for (outside NOT)."""
+    kind = node[0]
+    if kind in ("word", "prefix"):
+        return [] if negated else [node[1]]
+    if kind == "phrase":
+        return [] if negated else list(node[1])
+    if kind == "near":
+        return boolean_terms(node[1], negated) + boolean_terms(node[2], negated)
+    if kind == "not":
+        return boolean_terms(node[1], not negated)
+    if kind in ("and", "or"):
+        return [term for item in node[1] for term in boolean_terms(item, negated)]
+    return []
+
+
+class PositionalIndex:
+    """
+    Term -> chunk -> word positions, for phrase and NEAR queries.
+    
+    Positions are word ordinals within a chunk (as `tokenize` splits it),
+    held in arrays. Matching which chunks contain the words stays with the
+    inverted index; positions are only read for the chunks that do.
+    """
+    
+    # Approximate heap bytes per (term, chunk) entry and per position
+    ENTRY_BYTES = 120
+    POSITION_BYTES = 4
+    
+    def __init__(self):
+        self.postings: dict[str, dict[int, array]] = {}
+        self.entry_count = 0
+        self.position_count = 0
+    
+    @property
+    def nbytes(self) -> int:
+        return self.entry_count * self.ENTRY_BYTES + self.position_count * self.POSITION_BYTES
+    
+    def add_chunk(self, chunk_id: int, text: str):
+        """Index the word positions of a chunk."""
+        terms = tokenize(text)
+        for position, term in enumerate(terms):
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+            positions = posting.get(chunk_id)
+            if positions is None:
+                positions = posting[chunk_id] = array('I')
+                self.entry_count += 1
+            positions.append(position)
+        self.position_count += len(terms)
+    
+    def remove_chunk(self, chunk_id: int, text: str):
+        """Drop a chunk's positions (e.g. when it is re-opened by an append)."""
+        for term in set(tokenize(text)):
+            posting = self.postings.get(term)
+            if posting is not None and chunk_id in posting:
+                self.position_count -= len(posting.pop(chunk_id))
+                self.entry_count -= 1
+                if not posting:
+                    del self.postings[term]
+    
+    def positions(self, term: str, chunk_id: int) -> Iterable[int]:
+        return self.postings.get(term, {}).get(chunk_id, ())
+    
+    def spans(self, node: tuple, chunk_id: int) -> list[tuple[int, int]]:
+        """
+        Word ranges [start, end) of a chunk matched by a positional query
+        node: ("any", terms), ("phrase", terms) or ("near", ...).
+        """
+        kind = node[0]
+        if kind == "any":
+            starts = sorted(p for term in node[1] for p in self.positions(term, chunk_id))
+            return [(p, p + 1) for p in starts]
+        if kind == "phrase":
+            terms = node[1]
+            following = [set(self.positions(term, chunk_id)) for term in terms[1:]]
+            return [(p, p + len(terms)) for p in self.positions(terms[0], chunk_id)
+                    if all(p + i in later for i, later in enumerate(following, 1))]
+        _, left, right, distance = node
+        right_spans = self.spans(right, chunk_id)
+        found = set()
+        for left_start, left_end in self.spans(left, chunk_id):
+            for right_start, right_end in right_spans:
+                # At most `distance` words between the two, in either order
+                if right_start - left_end <= distance and left_start - right_end <= distance:
+                    found.add((min(left_start, right_start), max(left_end, right_end)))
+        return sorted(found)
+
+
+# Repeat operators (POSSESSIVE_REPEAT only exists on Python 3.11+)
+_REPEAT_OPS = {
+    op for op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT,
+                  getattr(sre_constants, "POSSESSIVE_REPEAT", None))
+    if op is not None
+}
+
+
+def regex_trigram_query(pattern: str, flags: int = 0) -> Optional[tuple]:
+    """
+    Reduce a regex to the trigrams any match must contain.
+    
+    Literal runs become ("and", [trigrams]), alternations ("or", [...]) and
+    required repeats/groups are folded in. Trigrams containing a newline are
+    dropped: chunks break at newlines, so only newline-free trigrams are
+    guaranteed to sit inside a single chunk. Nothing after an unbounded
+    repeat that can match a newline (`[\s\S]*`, `\s+`) is required either:
+    the rest of the match may lie any number of chunks past the chunk it
+    starts in. Returns None when nothing can be required (no literals of
+    three or more characters before such a repeat): scan everything.
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except (re.error, OverflowError, RecursionError):
+        return None
+    return _sequence_query(parsed, parsed.state.flags)[0]
+
+
+def regex_literal(pattern: str) -> Optional[str]:
+    """The string a pattern matches if it is nothing but literals (`foo\.bar`)."""
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (re.error, OverflowError, RecursionError):
+        return None
+    chars = []
+    for op, value in parsed:
+        if op is not sre_constants.LITERAL:
+            return None
+        chars.append(chr(value))
+    return "".join(chars)
+
+
+def nested_quantifier(pattern: str, flags: int = 0) -> bool:
+    """
+    Whether a pattern repeats something that itself repeats a variable
+    number of times, like `(a+)+` or `(\w+\s?)*`: the nesting that lets
+    backtracking blow up exponentially on a near miss. A repeat whose body
+    ends each iteration at a character its inner repeat cannot match, like
+    `(\w+\.)+` or `([^,]*,)+`, splits a text one way only and is allowed.
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except (re.error, OverflowError, RecursionError):
+        return False
+    return _nested_repeat(parsed, False, parsed.state.flags)
+
+
+def _nested_repeat(items, repeated: bool, flags: int) -> bool:
+    for op, av in items:
+        if op in _REPEAT_OPS:
+            low, high, body = av
+            if op is getattr(sre_constants, "POSSESSIVE_REPEAT", None):
+                # Gives nothing back, so only nesting inside it can explode
+                if _nested_repeat(body, False, flags):
+                    return True
+            elif repeated and high > 1 and high != low:
+                return True
+            elif high > 1 and _separated(body, flags):
+                continue
+            elif _nested_repeat(body, repeated or high > 1, flags):
+                return True
+        elif op is sre_constants.SUBPATTERN:
+            if _nested_repeat(av[-1], repeated, flags):
+                return True
+        elif op is getattr(sre_constants, "ATOMIC_GROUP", None):
+            if _nested_repeat(av, False, flags):
+                return True
+        elif op is sre_constants.BRANCH:
+            if any(_nested_repeat(alt, repeated, flags) for alt in av[1]):
+                return True
+    return False
+
+
+def _separated(body, flags: int) -> bool:
+    """
+    Whether a repeated body is one variable repeat of a single character
+    plus required single characters, one of which that repeat cannot
+    match: every iteration then ends at that character.
+    """
+    repeats, required = [], []
+    for op, av in _flatten_groups(body):
+        if op is sre_constants.AT:
+            continue
+        if op in _REPEAT_OPS:
+            low, high, inner = av
+            inner = list(_flatten_groups(inner))
+            chars = _char_set(*inner[0], flags) if len(inner) == 1 else None
+            if chars is None:
+                return False
+            (required if low == high and low > 0 else repeats).append(chars)
+        else:
+            chars = _char_set(op, av, flags)
+            if chars is None:
+                return False
+            required.append(chars)
+    return len(repeats) == 1 and any(not chars & repeats[0] for chars in required)
+
+
+def _flatten_groups(items):
+    for op, av in items:
+        if op is sre_constants.SUBPATTERN:
+            yield from _flatten_groups(av[-1])
+        else:
+            yield op, av
+
+
+# Characters that single-character items are compared on: only overlaps
+# between their sets are tested, so a sample of the alphabet does
+_SAMPLE_CHARS = frozenset(map(chr, range(256))) | frozenset("\u0100\u2028\u3000\u4e2d")
+_CATEGORY_CLASSES = {
+    getattr(sre_constants, f"CATEGORY_{name}"): re.compile(cls)
+    for name, cls in [("DIGIT", r"\d"), ("NOT_DIGIT", r"\D"), ("SPACE", r"\s"),
+                      ("NOT_SPACE", r"\S"), ("WORD", r"\w"), ("NOT_WORD", r"\W")]
+}
+
+
+def _char_set(op, av, flags: int) -> Optional[frozenset]:
+    """The sample characters a single-character item matches (None for other items)."""
+    if op is sre_constants.LITERAL:
+        chars = {chr(av)}
+    elif op is sre_constants.NOT_LITERAL:
+        chars = _SAMPLE_CHARS - {chr(av)}
+    elif op is sre_constants.ANY:
+        chars = set(_SAMPLE_CHARS)
+    elif op is sre_constants.IN:
+        chars = set()
+        negate = False
+        for item_op, item_av in av:
+            if item_op is sre_constants.NEGATE:
+                negate = True
+            elif item_op is sre_constants.LITERAL:
+                chars.add(chr(item_av))
+            elif item_op is sre_constants.RANGE:
+                chars.update(c for c in _SAMPLE_CHARS if item_av[0] <= ord(c) <= item_av[1])
+            elif item_op is sre_constants.CATEGORY and item_av in _CATEGORY_CLASSES:
+                chars.update(filter(_CATEGORY_CLASSES[item_av].match, _SAMPLE_CHARS))
+            else:
+                return None
+        if negate:
+            chars = _SAMPLE_CHARS - chars
+    else:
+        return None
+    if flags & re.IGNORECASE:
+        chars = chars | {c.swapcase() for c in chars}
+    return frozenset(chars)
+
+
+def _sequence_query(items, flags: int) -> tuple[Optional[tuple], bool]:
+    """The trigram query of a sequence, and whether it holds an unbounded line-spanning repeat."""
+    required = []
+    run = []
+    spanned = False
+    
+    def flush():
+        literal = ''.join(run).lower()
+        run.clear()
+        for i in range(len(literal) - 2):
+            gram = literal[i:i + 3]
+            if '\n' not in gram:
+                required.append(gram)
+    
+    def walk(items):
+        nonlocal spanned
+        for op, av in items:
+            if spanned:
+                return
+            if op is sre_constants.LITERAL:
+                run.append(chr(av))
+            elif op is sre_constants.AT:
+                continue  # zero-width anchors do not break a literal run
+            elif op is sre_constants.SUBPATTERN:
+                walk(av[-1])
+            elif op is getattr(sre_constants, "ATOMIC_GROUP", None):
+                walk(av)
+            else:
+                flush()
+                if op in _REPEAT_OPS:
+                    body, spanned = _sequence_query(av[2], flags)
+                    if body and av[0] >= 1:
+                        required.append(body)
+                    spanned = spanned or (av[1] == sre_constants.MAXREPEAT
+                                          and _matches_newline(av[2], flags))
+                elif op is sre_constants.BRANCH:
+                    alternatives = [_sequence_query(alt, flags) for alt in av[1]]
+                    if all(query for query, _ in alternatives):
+                        required.append(("or", [query for query, _ in alternatives]))
+                    spanned = any(alt_spanned for _, alt_spanned in alternatives)
+    
+    walk(items)
+    flush()
+    return ("and", required) if required else None, spanned
+
+
+def _matches_newline(items, flags: int) -> bool:
+    """Whether some item of a sequence can consume a newline."""
+    for op, av in items:
+        if op is sre_constants.ANY:
+            if flags & re.DOTALL:
+                return True
+        elif op in _REPEAT_OPS:
+            if _matches_newline(av[2], flags):
+                return True
+        elif op is sre_constants.SUBPATTERN:
+            if _matches_newline(av[-1], flags):
+                return True
+        elif op is getattr(sre_constants, "ATOMIC_GROUP", None):
+            if _matches_newline(av, flags):
+                return True
+        elif op is sre_constants.BRANCH:
+            if any(_matches_newline(alt, flags) for alt in av[1]):
+                return True
+        elif op in (sre_constants.LITERAL, sre_constants.NOT_LITERAL, sre_constants.IN):
+            chars = _char_set(op, av, flags)
+            if chars is None or "\n" in chars:
+                return True
+        elif op is sre_constants.GROUPREF:
+            return True
+    return False
+
+
+def span_text(data: Any, span: tuple, lookback: int = SCAN_LOOKBACK,
+              margin: int = SCAN_MARGIN) -> tuple[str, int, int]:
+    """
+    Decode one planned span (see RLMServer.plan_scan) of UTF-8 `data` with
+    `lookback` bytes before it and `margin` after. Returns (text, offset,
+    accept): the span starts at `offset` in the text, and matches are
+    accepted up to `accept`, where the next scanned span takes over.
+    """
+    _, _, start, limit, start_char, limit_char = span
+    lookback = data[max(0, start - lookback):start].decode("utf-8", errors="replace")
+    text = lookback + data[start:limit + margin].decode("utf-8", errors="replace")
+    offset = len(lookback)
+    return text, offset, offset + (limit_char - start_char)
+
+
+def scan_span(data: Any, compiled: re.Pattern, span: tuple, starts: list[int],
+              base: int = 0) -> Iterator[tuple[int, tuple[int, int]]]:
+    """
+    Run a pattern over one planned span (see RLMServer.plan_scan) of UTF-8
+    `data`, yielding (chunk_id, (start_char, end_char)) per match.
+    
+    `starts[i - base]` is the character start offset of chunk i; each match
+    is attributed to the chunk it starts in by bisecting them.
+    """
+    first, last, _, _, start_char, _ = span
+    text, offset, accept = span_text(data, span)
+    
+    for match in compiled.finditer(text, offset):
+        if match.start() >= accept:
+            break
+        position = start_char + match.start() - offset
+        index = bisect_right(starts, position, first - base, last - base + 1) - 1
+        chunk_id = max(index, first - base) + base
+        yield chunk_id, (position, position + match.end() - match.start())
+
+
+def find_all(text: str, needle: str, start: int = 0) -> Iterator[int]:
+    """Offsets of the non-overlapping occurrences of a literal, as re.finditer finds them."""
+    step = max(len(needle), 1)
+    position = text.find(needle, start)
+    while position >= 0:
+        yield position
+        position = text.find(needle, position + step)
+
+
+# Content files mapped by this pool worker: path -> ((inode, size), mmap)
+_worker_maps: dict[str, tuple[tuple[int, int], mmap.mmap]] = {}
+
+
+def _scan_shard(path: str, version: tuple[int, int], compiled: re.Pattern,
+                spans: list[tuple[tuple, list[int]]]) -> list[tuple[int, list]]:
+    """
+    Process-pool entry point: scan a shard of spans of a content file.
+    
+    Workers memory-map the file themselves, so shards share the page cache
+    instead of shipping content between processes. Returns (chunk_id,
+    matches) pairs in chunk order.
+    """
+    data = _worker_map(path, version)
+    hits: dict[int, list[tuple[int, int]]] = defaultdict(list)
+    for span, starts in spans:
+        for chunk_id, match in scan_span(data, compiled, span, starts, span[0]):
+            hits[chunk_id].append(match)
+    return list(hits.items())
+
+
+def _worker_map(path: str, version: tuple[int, int]) -> mmap.mmap:
+    """A worker's mapping of a content file, re-opened when the file changed."""
+    cached = _worker_maps.get(path)
+    if cached is None or cached[0] != version:
+        if cached is not None:
+            cached[1].close()
+        with open(path, "rb") as f:
+            cached = _worker_maps[path] = (version, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    return cached[1]
+
+
+def _guard_main(conn):
+    """
+    Regex guard process: run (path, version, compiled, spans) jobs from
+    `conn`, streaming (chunk_id, match) batches back as they are found and
+    None when a job is done (or the exception that stopped it). A first
+    None reports the process ready.
+    """
+    conn.send(None)
+    while True:
+        try:
+            path, version, compiled, spans = conn.recv()
+        except EOFError:
+            return
+        try:
+            data = _worker_map(path, version)
+            batch = []
+            flushed = time.monotonic()
+            for span, starts in spans:
+                for hit in scan_span(data, compiled, span, starts, span[0]):
+                    batch.append(hit)
+                    if len(batch) >= GUARD_BATCH or time.monotonic() - flushed >= GUARD_FLUSH_SECONDS:
+                        conn.send(batch)
+                        batch = []
+                        flushed = time.monotonic()
+            conn.send(batch)
+            conn.send(None)
+        except Exception as e:
+            conn.send(e)
+
+
+class RegexGuard:
+    """
+    A spawned process that runs regex scans for RLMServer.scan_guarded.
+    
+    A match that backtracks catastrophically never returns to the
+    interpreter, so no thread can stop it; a process can be killed. Matches
+    are streamed back while the scan runs, so whatever was found before the
+    kill is kept.
+    """
+    
+    def __init__(self):
+        context = multiprocessing.get_context("spawn")
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_guard_main, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+        # Wait out the interpreter start-up, so it is not charged to a scan
+        self.conn.recv()
+    
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class QueryCache:
+    """
+    LRU cache of ranked search results, bounded by an estimate of the bytes
+    they hold (mostly the materialised chunk text).
+    
+    Keys are (context_id, normalized query, search_type, top_k,
+    file_pattern). Cached result lists are shared and must not be mutated.
+    """
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[tuple, tuple[list, int]] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def footprint(results: list) -> int:
+        """Approximate memory held by a result list."""
+        return sum(200 + len(r.content) + 64 * len(r.matches) for r in results)
+    
+    def get(self, key: tuple) -> Optional[list]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+    
+    def peek(self, key: tuple) -> Optional[list]:
+        """Look up an entry without counting it or refreshing its recency."""
+        entry = self.entries.get(key)
+        return entry[0] if entry else None
+    
+    def put(self, key: tuple, results: list):
+        size = self.footprint(results)
+        if size > self.max_bytes:
+            return
+        self.discard(key)
+        self.entries[key] = (results, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.size -= evicted
+    
+    def discard(self, key: tuple):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+    
+    def keys_for(self, context_id: str) -> list[tuple]:
+        return [key for key in self.entries if key[0] == context_id]
+    
+    def drop_context(self, context_id: str):
+        """Forget every entry of a context (reloaded or cleared)."""
+        for key in self.keys_for(context_id):
+            self.discard(key)
+    
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+
+class Outline:
+    """
+    Heading index of a context, built in one pass as chunks are emitted.
+    
+    Entries are [position, level, type, title, chunk_id, file_id] in
+    document order, `position` being the absolute character offset of the
+    heading line. Lines are scanned once, from where the previous chunk
+    ended, so headings in overlap regions are not reported twice. An
+    entry's parent is the closest earlier entry of a lower level in the
+    same file, so each subtree is a contiguous run of entries.
+    """
+    
+    def __init__(self, entries: Optional[list] = None, position: int = 0):
+        self.entries = entries or []
+        self.position = position
+        self._parents: Optional[list] = None
+    
+    def add_chunk(self, chunk: dict, text: str):
+        skip = max(self.position - chunk["start_char"], 0)
+        for match in OUTLINE_PATTERN.finditer(text, skip):
+            if match["md"]:
+                level, kind, title = len(match["md"]), "markdown", match["md_title"].strip().rstrip("#").strip()
+            elif match["book"]:
+                level, kind, title = BOOK_LEVELS[match["book"]], "book", match[0].strip()
+            elif match["code"]:
+                indent = len(match["indent"].expandtabs(4))
+                level, kind, title = 1 + indent // 4, "code", match["code"]
+            else:
+                level, kind = int(match["h"]), "html"
+                title = re.sub(r"<[^>]+>", "", match["h_title"]).strip()
+            self.entries.append([chunk["start_char"] + match.start(), level, kind, title[:100],
+                                 chunk["id"], chunk.get("file")])
+        self.position = max(self.position, chunk["end_char"])
+        self._parents = None
+    
+    def truncate(self, position: int):
+        """Forget headings from `position` on, so they are scanned again."""
+        while self.entries and self.entries[-1][0] >= position:
+            self.entries.pop()
+        self.position = position
+        self._parents = None
+    
+    @property
+    def parents(self) -> list[Optional[int]]:
+        if self._parents is None:
+            parents = []
+            stack: list[int] = []
+            for i, (_, level, _, _, _, file_id) in enumerate(self.entries):
+                while stack and (self.entries[stack[-1]][1] >= level
+                                 or self.entries[stack[-1]][5] != file_id):
+                    stack.pop()
+                parents.append(stack[-1] if stack else None)
+                stack.append(i)
+            self._parents = parents
+        return self._parents
+    
+    def subtree(self, root: int) -> range:
+        """Indexes of the descendants of entry `root`."""
+        parents = self.parents
+        end = root + 1
+        ancestors = {root}
+        while end < len(self.entries) and parents[end] in ancestors:
+            ancestors.add(end)
+            end += 1
+        return range(root + 1, end)
+
+
+def truncate_last_line(path: Path):
+    """Remove the final newline-terminated line of a file in place."""
+    with open(path, 'rb+') as f:
+        pos = f.seek(0, os.SEEK_END) - 1  # skip the final newline
+        while pos > 0:
+            block_start = max(0, pos - 65536)
+            f.seek(block_start)
+            newline = f.read(pos - block_start).rfind(b"\n")
+            if newline != -1:
+                f.truncate(block_start + newline + 1)
+                return
+            pos = block_start
+        f.truncate(0)
+
+
+def build_snippets(text: str, base: int, spans: list[tuple[int, int]],
+                   radius: int, budget: int) -> tuple[list[dict], bool]:
+    """
+    Cut windows of `radius` characters around match spans (offsets into
+    `text`), merging windows that overlap or touch.
+    
+    No new window is started once `budget` characters are used; returns
+    the snippets and whether any match was left out. Snippet offsets are
+    absolute (`base` + offset), highlights relative to the snippet text.
+    """
+    windows = []
+    used = 0
+    truncated = False
+    for start, end in sorted(spans):
+        start = min(max(start, 0), len(text))
+        end = min(max(end, start), len(text))
+        low, high = max(start - radius, 0), min(end + radius, len(text))
+        if windows and low <= windows[-1][1]:
+            last = windows[-1]
+            used += max(high - last[1], 0)
+            last[1] = max(last[1], high)
+            last[2].append((start, end))
+        elif used >= budget:
+            truncated = True
+            break
+        else:
+            windows.append([low, high, [(start, end)]])
+            used += high - low
+    
+    return [
+        {
+            "start": base + low,
+            "end": base + high,
+            "text": text[low:high],
+            "highlights": [[start - low, end - low] for start, end in marks if end > start]
+        }
+        for low, high, marks in windows
+    ], truncated
+
+
+# Chunking strategies: `lines` packs lines greedily; `prose` and `code`
+# prefer to break before headings / top-level definitions, then at
+# paragraph (blank-line) boundaries; `auto` picks per file extension;
+# `cdc` places content-defined boundaries that survive edits elsewhere
+CHUNK_STRATEGIES = ("auto", "lines", "prose", "code", "cdc")
+CODE_EXTENSIONS = {
+    ".py", ".pyi", ".js", ".jsx", ".ts", ".tsx", ".go", ".rs", ".java", ".kt",
+    ".scala", ".c", ".h", ".cc", ".cpp", ".hpp", ".cs", ".rb", ".php", ".swift",
+    ".sh", ".lua", ".r", ".sql"
+}
+HEADING_LINE = re.compile(r'#{1,6}\s|(?:Part|Chapter|Section)\s+\S|<h[1-6][\s>]')
+DEFINITION_LINE = re.compile(
+    r'(?:async\s+def|def|class|function|export|func|fn|pub\s+fn|impl|struct|interface)\b|@'
+)
+# A structural break is only taken if the chunk is at least this full
+MIN_CHUNK_FILL = 0.5
+# Content-defined chunks: no cut below this fill; past it a line ends the
+# chunk with probability line_size / (CDC_SPREAD * chunk_size)
+CDC_MIN_FILL = 0.25
+CDC_SPREAD = 0.5
+# Bits each line shifts the rolling hash by; it covers the last 32 / 4 lines
+CDC_SHIFT = 4
+
+
+def resolve_strategy(strategy: str, label: Optional[str]) -> str:
+    """The concrete strategy for a source (`auto` looks at its extension)."""
+    if strategy != "auto":
+        return strategy
+    if label is not None and Path(label).suffix.lower() in CODE_EXTENSIONS:
+        return "code"
+    return "prose"
+
+
+class ChunkBuilder:
+    """
+    Incremental single-pass chunker.
+    
+    Text can be fed in arbitrary pieces (e.g. blocks streamed from a file).
+    Complete lines are grouped into overlapping chunks of about `chunk_size`
+    characters; each chunk is emitted as (record, text) as soon as it is
+    complete, so only the chunk being built is held in memory. Records carry
+    byte offsets (`start`/`end`), character offsets into the stream and the
+    1-based line numbers of their first and last line within the segment.
+    
+    Every line is classified once as it arrives. When a chunk overflows,
+    the structured strategies break before its last heading or top-level
+    definition (else paragraph start) past MIN_CHUNK_FILL, and the lines
+    after that break carry over into the next chunk.
+    
+    The `cdc` strategy cuts where a rolling hash over the last few lines
+    hits a threshold (FastCDC-style, at line granularity), so boundaries
+    depend only on nearby content: an edit moves at most the chunks around
+    it. The hash restarts at every cut and such chunks never overlap.
+    `state`/`resume` carry a segment across an append, so appended and
+    fully re-chunked content split identically with every strategy.
+    Each record carries a `hash` of its text for reuse across reloads.
+    """
+    
+    # Line break preference: none, paragraph start, heading/definition
+    PLAIN, PARAGRAPH, STRUCTURE = 0, 1, 2
+    
+    def __init__(self, chunk_size: int, overlap: int, first_id: int = 0,
+                 start: int = 0, start_char: int = 0, strategy: str = "lines",
+                 start_line: int = 1):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.strategy = strategy
+        self.next_id = first_id
+        self.position = start
+        self.char_position = start_char
+        self.line_number = start_line - 1
+        # (text, char_size, byte_size, break kind, line number)
+        self.lines: list[tuple[str, int, int, int, int]] = []
+        self.current_size = 0
+        self.previous_blank = False
+        self.rolling = 0
+        self.partial: list[str] = []  # pieces of the unterminated last line
+    
+    def feed(self, text: str) -> list[tuple[dict, str]]:
+        """Add text; returns the chunks completed by it."""
+        emitted = []
+        if '\n' not in text:
+            self.partial.append(text)
+            return emitted
+        
+        lines = text.split('\n')
+        self.partial.append(lines[0])
+        lines[0] = ''.join(self.partial)
+        self.partial = [lines.pop()]
+        for line in lines:
+            self._add_line(line, emitted)
+        return emitted
+    
+    def state(self) -> dict:
+        """
+        Everything the builder holds between lines, as JSON. Taken before
+        end_segment, it lets an append resume the segment exactly where a
+        single pass over the whole text would be (see resume).
+        """
+        return {
+            "strategy": self.strategy,
+            "next_id": self.next_id,
+            "position": self.position,
+            "char_position": self.char_position,
+            "line_number": self.line_number,
+            "lines": list(self.lines),
+            "current_size": self.current_size,
+            "previous_blank": self.previous_blank,
+            "rolling": self.rolling,
+            "partial": ''.join(self.partial)
+        }
+    
+    @classmethod
+    def resume(cls, chunk_size: int, overlap: int, state: dict) -> "ChunkBuilder":
+        """A builder continuing from a `state()` snapshot."""
+        builder = cls(chunk_size, overlap, first_id=state["next_id"], start=state["position"],
+                      start_char=state["char_position"], strategy=state["strategy"])
+        builder.line_number = state["line_number"]
+        builder.lines = [tuple(line) for line in state["lines"]]
+        builder.current_size = state["current_size"]
+        builder.previous_blank = state["previous_blank"]
+        builder.rolling = state["rolling"]
+        builder.partial = [state["partial"]]
+        return builder
+    
+    def end_segment(self) -> list[tuple[dict, str]]:
+        """
+        Finish the current document or file.
+        
+        The pending partial line becomes the last line, the final chunk is
+        emitted (unless a content-defined cut just did so on that line), and
+        the next chunk starts fresh (no overlap across segments, line numbers
+        restart at 1). The segment's last line is counted with a newline, so
+        a separator byte must follow it in storage if another segment is
+        appended.
+        """
+        emitted = []
+        self._add_line(''.join(self.partial), emitted)
+        self.partial = []
+        if self.lines:
+            emitted.append(self._emit(len(self.lines)))
+        self.lines = []
+        self.current_size = 0
+        self.line_number = 0
+        self.previous_blank = False
+        self.rolling = 0
+        return emitted
+    
+    def _classify(self, line: str) -> int:
+        blank = not line.strip()
+        kind = self.PLAIN
+        if self.strategy in ("prose", "code") and not blank:
+            pattern = DEFINITION_LINE if self.strategy == "code" else HEADING_LINE
+            if pattern.match(line):
+                kind = self.STRUCTURE
+            elif self.previous_blank:
+                kind = self.PARAGRAPH
+        self.previous_blank = blank
+        return kind
+    
+    def _break_index(self, incoming: int) -> int:
+        """Where to end the overflowing chunk (lines[:index] are emitted)."""
+        if self.strategy in ("lines", "cdc") or incoming == self.STRUCTURE:
+            return len(self.lines)
+        best = {}
+        size = 0
+        minimum = self.chunk_size * MIN_CHUNK_FILL
+        for i, line in enumerate(self.lines):
+            if i and line[3] and size >= minimum:
+                best[line[3]] = i
+            size += line[1]
+        if self.STRUCTURE in best:
+            return best[self.STRUCTURE]
+        if incoming == self.PARAGRAPH:
+            return len(self.lines)
+        return best.get(self.PARAGRAPH, len(self.lines))
+    
+    def _add_line(self, line: str, emitted: list):
+        line_size = len(line) + 1  # +1 for newline
+        if line.isascii():
+            line_bytes = line_size
+        else:
+            line_bytes = len(line.encode("utf-8", errors="replace")) + 1
+        kind = self._classify(line)
+        self.line_number += 1
+        
+        # Check if adding this line exceeds chunk size
+        if self.current_size + line_size > self.chunk_size and self.lines:
+            cut = self._break_index(kind)
+            emitted.append(self._emit(cut))
+            carried = self.lines[cut:]
+            
+            # Keep overlap from the tail of the emitted lines
+            overlap_lines = []
+            overlap_size = 0
+            for prev in reversed(self.lines[:cut]):
+                if overlap_size + prev[1] - 1 < self.overlap:
+                    overlap_lines.append(prev)
+                    overlap_size += prev[1]
+                else:
+                    break
+            overlap_lines.reverse()
+            
+            self.lines = overlap_lines + carried
+            self.current_size = overlap_size + sum(c[1] for c in carried)
+            self.rolling = 0
+        
+        self.lines.append((line, line_size, line_bytes, kind, self.line_number))
+        self.current_size += line_size
+        self.char_position += line_size
+        self.position += line_bytes
+        
+        if self.strategy == "cdc":
+            self.rolling = ((self.rolling << CDC_SHIFT)
+                            + zlib.crc32(line.encode("utf-8", errors="replace"))) & 0xFFFFFFFF
+            # rolling / 2**32 < line_size / (CDC_SPREAD * chunk_size)
+            if (self.current_size >= self.chunk_size * CDC_MIN_FILL
+                    and self.rolling * CDC_SPREAD * self.chunk_size < line_size << 32):
+                emitted.append(self._emit(len(self.lines)))
+                self.lines = []
+                self.current_size = 0
+                self.rolling = 0
+    
+    def _emit(self, cut: int) -> tuple[dict, str]:
+        """Emit lines[:cut] as a chunk."""
+        lines = self.lines[:cut]
+        rest = self.lines[cut:]
+        end_char = self.char_position - sum(line[1] for line in rest)
+        end = self.position - sum(line[2] for line in rest)
+        start_char = end_char - sum(line[1] for line in lines)
+        start = end - sum(line[2] for line in lines)
+        end_char -= 1  # exclude the final newline
+        text = '\n'.join(line[0] for line in lines)
+        chunk = {
+            "id": self.next_id,
+            "start": start,
+            "end": end - 1,
+            "start_char": start_char,
+            "end_char": end_char,
+            "start_line": lines[0][4],
+            "end_line": lines[-1][4],
+            "tokens": (end_char - start_char) // 4,
+            "hash": hashlib.blake2b(text.encode("utf-8", errors="replace"),
+                                    digest_size=8).hexdigest()
+        }
+        self.next_id += 1
+        return chunk, text
+
+
+class ChunkReuse:
+    """
+    The chunks of a context's previous version, by content hash.
+    
+    When a context is loaded again under the same name, each new chunk
+    whose text is unchanged takes over its old term frequencies instead of
+    being tokenized again; `mapping` records new id -> old chunk record so
+    cached results can follow them.
+    """
+    
+    def __init__(self, context_id: str, chunks_file: Path):
+        self.context_id = context_id
+        self.table: dict[str, list[tuple[dict, Optional[dict]]]] = defaultdict(list)
+        self.mapping: dict[int, dict] = {}
+        with open(chunks_file) as f:
+            for line in f:
+                chunk = json.loads(line)
+                term_freqs = chunk.pop("tf", None)
+                if "hash" in chunk:
+                    self.table[chunk["hash"]].append((chunk, term_freqs))
+        for entries in self.table.values():
+            entries.reverse()  # duplicates are taken in document order
+    
+    def take(self, chunk: dict) -> Optional[dict]:
+        """Map a chunk to an identical old one; returns its stored term frequencies, if any."""
+        entries = self.table.get(chunk["hash"])
+        if not entries:
+            return None
+        old, term_freqs = entries.pop()
+        self.mapping[chunk["id"]] = old
+        return term_freqs
+
 
 @dataclass
 class ContextStore:
-    """Manages stored contexts for RLM processing."""
+    """
+    Manages stored contexts for RLM processing.
+    
+    The content itself is not held as a string: it lives UTF-8 encoded in
+    the context's `.txt` file, memory-mapped on first use. Chunks are byte
+    ranges into that file and their text is only materialised when it is
+    actually returned.
+    
+    Contexts discovered on disk at startup are registered with
+    `loaded=False`; their chunks and index are read back on first access.
+    """
     id: str
     name: str
-    content: str
     token_estimate: int
     created_at: str
+    path: Path
     metadata: dict = field(default_factory=dict)
     chunks: list = field(default_factory=list)
+    index: Optional[InvertedIndex] = field(default=None, repr=False)
+    trigrams: Optional[TrigramIndex] = field(default=None, repr=False)
+    vectors: Optional[VectorIndex] = field(default=None, repr=False)
+    positions: Optional[PositionalIndex] = field(default=None, repr=False)
+    outline: Optional[Outline] = field(default=None, repr=False)
+    buffer: Any = field(default=None, repr=False)
+    loaded: bool = True
+    stored_chunk_count: int = 0
+    # Estimated heap bytes while loaded, and the last access (monotonic clock)
+    resident_bytes: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+    # Held while chunks/index are read or changed from executor threads
+    lock: Any = field(default_factory=threading.RLock, repr=False, compare=False)
+    _starts: list = field(default_factory=list, repr=False)
+    
+    @property
+    def chunk_count(self) -> int:
+        """Number of chunks, known even before the context is loaded."""
+        return len(self.chunks) if self.loaded else self.stored_chunk_count
+    
+    @property
+    def data(self) -> Any:
+        """Raw UTF-8 content, mapped on first access (an empty file cannot be mapped)."""
+        if self.buffer is None:
+            with open(self.path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    self.buffer = b""
+                else:
+                    self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.buffer
+    
+    @property
+    def content(self) -> str:
+        """The full content as a string (materialises everything)."""
+        return self.read(0, len(self.data))
+    
+    def chunk_starts(self) -> list[int]:
+        """Sorted chunk start offsets (characters), for bisecting positions."""
+        # Appends reset the cache when they re-open chunks, and otherwise
+        # only add chunks, so a length check is enough to detect staleness
+        if len(self._starts) != len(self.chunks):
+            self._starts = [c["start_char"] for c in self.chunks]
+        return self._starts
+    
+    def read(self, start: int, end: int) -> str:
+        """Decode the content between two byte offsets."""
+        return self.data[start:end].decode("utf-8", errors="replace")
+    
+    def chunk_text(self, chunk: dict) -> str:
+        """Materialise the text of a chunk."""
+        return self.read(chunk["start"], chunk["end"])
+    
+    def measure(self) -> int:
+        """Re-estimate the heap bytes held by the chunks and indexes."""
+        size = len(self.chunks) * CHUNK_RECORD_BYTES
+        if self.index is not None:
+            size += sum(map(len, self.index.postings.values())) * POSTING_BYTES
+        if self.trigrams is not None:
+            size += sum(map(len, self.trigrams.postings.values())) * TRIGRAM_POSTING_BYTES
+        if self.vectors is not None:
+            size += self.vectors.nbytes
+        if self.positions is not None:
+            size += self.positions.nbytes
+        self.resident_bytes = size
+        return size
+    
+    def spill(self):
+        """
+        Drop the chunks, indexes and mapping, leaving the on-disk form
+        (content, chunk records, manifest) to re-hydrate from.
+        """
+        self.stored_chunk_count = len(self.chunks)
+        self.chunks = []
+        self.index = None
+        self.trigrams = None
+        self.vectors = None
+        self.positions = None
+        self.outline = None
+        self._starts = []
+        self.close()
+        self.loaded = False
+        self.resident_bytes = 0
     
+    def close(self):
+        """Release the memory map; it is re-opened lazily on next access."""
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+            self.buffer = None
+    
+
+@dataclass(frozen=True)
+class ContextView:
+    """
+    The chunks selected for a recursive search.
+    
+    A view holds ids into its parent context and is searched in place, with
+    no copy of the text and no re-chunking. Result chunk ids are the
+    parent's, so they can be passed to rlm_get_chunk or to a deeper
+    rlm_search_recursive directly.
+    """
+    id: str
+    context_id: str
+    chunk_ids: frozenset
+
 
 @dataclass
 class SearchResult:
@@ -55,7 +1692,50 @@ class SearchResult:
     match_count: int
     context_before: str = ""
     context_after: str = ""
+    matches: list = field(default_factory=list)
+    file: Optional[str] = None
+    
+
+@dataclass
+class SearchCursor:
+    """
+    The not yet returned results of a search, paged out by rlm_search_next.
+    
+    `heap` holds (rank key, SearchResult) pairs in heap order, so each page
+    costs O(page log n) rather than a full sort. It is None for a cursor
+    opened on a cached first page; the search then runs once more on the
+    first rlm_search_next and skips the `returned` results.
+    """
+    id: str
+    context_id: str
+    query_id: str
+    query: str
+    search_type: str
+    file_pattern: Optional[str]
+    view: Optional[ContextView]
+    page_size: int
+    returned: int
+    heap: Optional[list]
+    expires: float = 0.0
+    snippets: Optional[tuple[int, int]] = None
+
+
+@dataclass
+class ScanBudget:
+    """
+    The regex scanning time left to one query (RLM_REGEX_TIMEOUT_MS).
     
+    Shared by every scan the query runs; `timed_out` is set when a scan is
+    cut short and its results are partial.
+    """
+    seconds: float
+    timed_out: bool = False
+
+
+def rank_key(result: SearchResult) -> tuple:
+    """Result order: best score first, then document order."""
+    return (-result.relevance_score, result.chunk_id)
+
 
 @dataclass
 class RecursiveQuery:
@@ -89,6 +1769,47 @@ class RLMServer:
         self.max_depth = int(os.environ.get("RLM_MAX_DEPTH", "10"))
         self.chunk_size = int(os.environ.get("RLM_CHUNK_SIZE", "4000"))
         self.overlap = int(os.environ.get("RLM_OVERLAP", "200"))
+        self.chunk_strategy = os.environ.get("RLM_CHUNK_STRATEGY", "auto")
+        if self.chunk_strategy not in CHUNK_STRATEGIES:
+            logger.warning(f"Unknown RLM_CHUNK_STRATEGY {self.chunk_strategy!r}, using 'auto'")
+            self.chunk_strategy = "auto"
+        
+        # Memory budget for loaded contexts (0 = unlimited); least recently
+        # used contexts beyond it are spilled to their on-disk form
+        self.max_memory = int(float(os.environ.get("RLM_MAX_MEMORY_MB", "0")) * (1 << 20))
+        
+        # Parallel regex scans (opt-in; 0 or 1 scans on the event loop)
+        self.workers = int(os.environ.get("RLM_WORKERS", "0"))
+        self.parallel_min_bytes = PARALLEL_SCAN_MIN_BYTES
+        self.pool = None
+        
+        # Requests are served concurrently: heavy work runs in the executor,
+        # and `lock` guards contexts, queries, stats and active_session (it is
+        # only held briefly, so the event loop may take it)
+        threads = min(32, (os.cpu_count() or 1) + 4)  # the executor's default
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="rlm")
+        self.lock = threading.RLock()
+        
+        # Regex scans run in killable guard processes under a per-query time
+        # budget; 0 scans unguarded. At most one guard per executor thread
+        # is alive, idle ones are reused, and `guard_slots` guards the pool
+        self.regex_timeout = float(os.environ.get("RLM_REGEX_TIMEOUT_MS", REGEX_TIMEOUT_MS)) / 1000
+        self.guard_limit = threads
+        self.guards: list[RegexGuard] = []
+        self.live_guards = 0
+        self.guard_slots = threading.Condition()
+        
+        # Ranked results of repeated searches
+        self.cache = QueryCache(int(float(os.environ.get("RLM_CACHE_MB", CACHE_MB)) * (1 << 20)))
+        # (context_id, chunk ids) -> ContextView, so repeated recursive
+        # selections share an id (and cached results)
+        self.views: OrderedDict[tuple, ContextView] = OrderedDict()
+        # cursor id -> SearchCursor, least recently used first
+        self.cursors: OrderedDict[str, SearchCursor] = OrderedDict()
+        self.cursor_ttl = float(os.environ.get("RLM_CURSOR_TTL", CURSOR_TTL))
+        self.lsa_dims = int(os.environ.get("RLM_LSA_DIMS", LSA_DIMS))
+        if self.lsa_dims and not (NUMPY_AVAILABLE and SCIPY_AVAILABLE):
+            logger.warning("RLM_LSA_DIMS needs numpy and scipy; vector search uses plain TF-IDF")
         
         # In-memory stores
         self.contexts: dict[str, ContextStore] = {}
@@ -100,137 +1821,1112 @@ class RLMServer:
             "total_queries": 0,
             "total_tokens_processed": 0,
             "max_depth_reached": 0,
-            "contexts_loaded": 0
+            "contexts_loaded": 0,
+            "contexts_spilled": 0,
+            "chunks_reused": 0,
+            "regex_timeouts": 0
         }
         
-        logger.info(f"RLM Server initialized. Data dir: {self.data_dir}")
+        self.restore_contexts()
+        
+        logger.info(f"RLM Server initialized. Data dir: {self.data_dir}")
+        
+    def restore_contexts(self):
+        """
+        Register contexts persisted by earlier sessions.
+        
+        Only the small `{id}.json` manifests are read here; content, chunks
+        and index stay on disk until the context is first accessed.
+        """
+        for manifest_file in self.data_dir.glob("*.json"):
+            context_id = manifest_file.stem
+            content_file = self.data_dir / f"{context_id}.txt"
+            if context_id in self.contexts or not content_file.exists():
+                continue
+            try:
+                with open(manifest_file) as f:
+                    manifest = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"Skipping unreadable context manifest {manifest_file}: {e}")
+                continue
+            
+            self.contexts[context_id] = ContextStore(
+                id=context_id,
+                name=manifest.get("name", "default"),
+                token_estimate=manifest.get("token_estimate", 0),
+                created_at=manifest.get("created_at", ""),
+                metadata=manifest.get("metadata", {}),
+                path=content_file,
+                loaded=False,
+                stored_chunk_count=manifest.get("chunk_count", 0)
+            )
+        
+        if self.contexts:
+            logger.info(f"Registered {len(self.contexts)} persisted contexts")
+    
+    def get_context(self, context_id: str = None) -> Optional[ContextStore]:
+        """
+        Look up a context (the active session by default), loading it from
+        disk on first access.
+        """
+        with self.lock:
+            context_id = context_id or self.active_session
+            context = self.contexts.get(context_id) if context_id else None
+        if context is None:
+            return None
+        context.last_used = time.monotonic()
+        if not context.loaded:
+            with context.lock:
+                hydrated = self.hydrate(context)
+            if hydrated:
+                self.enforce_memory_budget(keep=context.id)
+        return context
+    
+    def hydrate(self, context: ContextStore) -> bool:
+        """
+        Load a restored or spilled context back into memory (the caller
+        holds its lock). Work that takes the lock calls this first, since
+        the context may have been spilled after it was looked up.
+        """
+        if context.loaded:
+            return False
+        self.load_persisted(context)
+        context.measure()
+        return True
+    
+    def enforce_memory_budget(self, keep: Optional[str] = None):
+        """
+        Spill least recently used contexts until the loaded ones fit in
+        RLM_MAX_MEMORY_MB. `keep` (the context being served) and contexts
+        busy in another thread are skipped.
+        """
+        if self.max_memory <= 0:
+            return
+        with self.lock:
+            loaded = sorted((c for c in self.contexts.values() if c.loaded),
+                            key=lambda c: c.last_used)
+        total = sum(c.resident_bytes for c in loaded)
+        for context in loaded:
+            if total <= self.max_memory:
+                break
+            if context.id == keep or not context.lock.acquire(blocking=False):
+                continue
+            try:
+                if context.loaded:
+                    total -= context.resident_bytes
+                    context.spill()
+                    logger.info(f"Spilled context {context.id} to disk (memory budget)")
+                    with self.lock:
+                        self.stats["contexts_spilled"] += 1
+            finally:
+                context.lock.release()
+    
+    async def run_blocking(self, func, *args, **kwargs) -> Any:
+        """
+        Run CPU- or disk-heavy work in the executor, keeping the event loop
+        free to answer cheap calls while it runs.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+    
+    def load_persisted(self, context: ContextStore):
+        """
+        Read a persisted context's chunks and index back from disk.
+        
+        The `{id}.chunks.jsonl` file holds one chunk record per line with its
+        term frequencies, so the index is rebuilt without re-tokenizing.
+        Records without them are tokenized again. If the file is missing
+        altogether, the content is re-chunked.
+        """
+        chunks_file = self.data_dir / f"{context.id}.chunks.jsonl"
+        if chunks_file.exists():
+            context.index = InvertedIndex()
+            context.chunks = []
+            with open(chunks_file) as f:
+                for line in f:
+                    chunk = json.loads(line)
+                    context.chunks.append(chunk)
+                    if "tf" in chunk:
+                        context.index.add_term_freqs(chunk["id"], chunk.pop("tf"))
+                    else:
+                        context.index.add_chunk(chunk["id"], context.chunk_text(chunk))
+        else:
+            settings = self.chunk_settings(context.metadata)
+            context.chunks = self.chunk_content(context.content, settings["chunk_size"],
+                                                settings["strategy"])
+            context.index = self.build_index(context, chunks_file)
         
+        context.loaded = True
+        logger.info(f"Loaded persisted context {context.id} ({len(context.chunks)} chunks)")
+    
     def estimate_tokens(self, text: str) -> int:
         """Rough token estimation (4 chars per token average)."""
         return len(text) // 4
     
     def generate_id(self, content: str) -> str:
         """Generate a unique ID for content."""
-        return hashlib.sha256(content[:1000].encode()).hexdigest()[:12]
+        return hashlib.sha256(content.encode("utf-8", errors="replace")).hexdigest()[:16]
     
-    def chunk_content(self, content: str) -> list[dict]:
+    def chunk_content(self, content: str, chunk_size: Optional[int] = None,
+                      strategy: Optional[str] = None) -> list[dict]:
         """
         Split content into overlapping chunks for efficient searching.
         Uses semantic boundaries when possible.
+        
+        Chunks are offset ranges rather than copies: `start`/`end` are byte
+        offsets into the UTF-8 encoded content, `start_char`/`end_char` the
+        matching character positions.
+        """
+        settings = self.chunk_settings({}, chunk_size, strategy)
+        builder = ChunkBuilder(settings["chunk_size"], settings["overlap"],
+                               strategy=resolve_strategy(settings["strategy"], None))
+        emitted = builder.feed(content) + builder.end_segment()
+        return [chunk for chunk, _ in emitted]
+    
+    def chunk_settings(self, metadata: dict, chunk_size: Optional[int] = None,
+                       strategy: Optional[str] = None) -> dict:
+        """
+        Chunking parameters of a context: those recorded in its metadata at
+        load time, else the given overrides, else the server defaults.
+        """
+        if "chunking" in metadata:
+            return metadata["chunking"]
+        size = chunk_size or self.chunk_size
+        strategy = strategy or self.chunk_strategy
+        return {
+            "chunk_size": size,
+            "overlap": 0 if strategy == "cdc" else min(self.overlap, size // 2),
+            "strategy": strategy
+        }
+    
+    def check_chunking(self, chunk_size: Optional[int], strategy: Optional[str]) -> Optional[str]:
+        """Validate per-load chunking options; returns an error message or None."""
+        if chunk_size is not None and (not isinstance(chunk_size, int) or chunk_size < 1):
+            return "chunk_size must be a positive integer."
+        if strategy is not None and strategy not in CHUNK_STRATEGIES:
+            return f"Unknown strategy {strategy!r}; use one of {', '.join(CHUNK_STRATEGIES)}."
+        return None
+    
+    def ingest(self, sources: Iterable[tuple[Optional[str], Iterable[str]]],
+               name: str, metadata: Optional[dict] = None,
+               chunk_size: Optional[int] = None, strategy: Optional[str] = None,
+               reuse: Optional[ChunkReuse] = None) -> ContextStore:
+        """
+        Stream text sources into a new persisted context.
+        
+        Each source is (file label or None, iterable of text pieces). Pieces
+        are written to the content file, chunked and indexed as they arrive,
+        so only one block and the chunk being built are in memory at a time.
+        Chunks never span two sources; labelled sources are recorded in
+        metadata["files"] with their byte and chunk ranges. The chunking
+        settings are recorded in metadata["chunking"] for later appends.
+        
+        The context id is a hash of everything written (content, separators
+        and file labels), computed while streaming. With `reuse` (a previous
+        version of the context), unchanged chunks keep their old term
+        frequencies and are mapped to their old ids, and the trigram index
+        is left to be built on the first regex search.
         """
+        metadata = dict(metadata or {})
+        settings = self.chunk_settings({}, chunk_size, strategy)
+        metadata["chunking"] = settings
+        files = []
+        digest = hashlib.sha256()
+        builder = ChunkBuilder(settings["chunk_size"], settings["overlap"])
+        index = InvertedIndex()
+        trigrams = TrigramIndex() if reuse is None else None
+        outline = Outline()
         chunks = []
-        lines = content.split('\n')
-        current_chunk = []
-        current_size = 0
-        chunk_start = 0
-        char_position = 0
-        
-        for i, line in enumerate(lines):
-            line_size = len(line) + 1  # +1 for newline
-            
-            # Check if adding this line exceeds chunk size
-            if current_size + line_size > self.chunk_size and current_chunk:
-                chunk_text = '\n'.join(current_chunk)
-                chunks.append({
-                    "id": len(chunks),
-                    "content": chunk_text,
-                    "start_char": chunk_start,
-                    "end_char": char_position,
-                    "start_line": chunk_start,
-                    "tokens": self.estimate_tokens(chunk_text)
-                })
+        tail = None
+        
+        tmp_name = f".ingest-{uuid.uuid4().hex}"
+        tmp_content = self.data_dir / f"{tmp_name}.txt.tmp"
+        tmp_chunks = self.data_dir / f"{tmp_name}.chunks.jsonl.tmp"
+        try:
+            with open(tmp_content, 'wb') as out, open(tmp_chunks, 'w') as chunk_out:
+                def store(emitted: list[tuple[dict, str]], file_id: Optional[int]):
+                    self.store_chunks(emitted, index, trigrams, chunks, chunk_out,
+                                      file_id, reuse)
+                    for chunk, text in emitted:
+                        outline.add_chunk(chunk, text)
                 
-                # Keep overlap
-                overlap_lines = []
-                overlap_size = 0
-                for prev_line in reversed(current_chunk):
-                    if overlap_size + len(prev_line) < self.overlap:
-                        overlap_lines.insert(0, prev_line)
-                        overlap_size += len(prev_line) + 1
-                    else:
+                for label, pieces in sources:
+                    if builder.position:
+                        out.write(b"\n")  # separator counted by end_segment
+                        digest.update(b"\n")
+                    if label is not None:
+                        digest.update(label.encode("utf-8", errors="replace") + b"\0")
+                    file_id = len(files) if label is not None else None
+                    builder.strategy = resolve_strategy(settings["strategy"], label or name)
+                    segment_start = builder.position
+                    first_chunk = builder.next_id
+                    
+                    for piece in pieces:
+                        encoded = piece.encode("utf-8", errors="replace")
+                        digest.update(encoded)
+                        out.write(encoded)
+                        store(builder.feed(piece), file_id)
+                    tail = builder.state()
+                    store(builder.end_segment(), file_id)
+                    
+                    if file_id is not None:
+                        files.append({
+                            "path": label,
+                            "start": segment_start,
+                            "end": builder.position - 1,
+                            "chunks": [first_chunk, builder.next_id - 1]
+                        })
+            
+            context_id = digest.hexdigest()[:16]
+            content_file = self.data_dir / f"{context_id}.txt"
+            chunks_file = self.data_dir / f"{context_id}.chunks.jsonl"
+            # Replacing (rather than rewriting) keeps an existing mapping of
+            # the same context valid on its old inode.
+            os.replace(tmp_content, content_file)
+            os.replace(tmp_chunks, chunks_file)
+            self.save_outline(context_id, outline)
+            if tail is not None:
+                self.save_tail(context_id, tail)
+        finally:
+            tmp_content.unlink(missing_ok=True)
+            tmp_chunks.unlink(missing_ok=True)
+        
+        if files:
+            metadata["files"] = files
+        
+        return ContextStore(
+            id=context_id,
+            name=name,
+            token_estimate=max(builder.char_position - 1, 0) // 4,
+            created_at=datetime.now().isoformat(),
+            metadata=metadata,
+            chunks=chunks,
+            index=index,
+            trigrams=trigrams,
+            outline=outline,
+            path=content_file
+        )
+    
+    def load_sources(self, sources: Iterable[tuple[Optional[str], Iterable[str]]],
+                     name: str, metadata: Optional[dict], chunk_size: Optional[int],
+                     strategy: Optional[str], keep_previous: bool = False) -> tuple[ContextStore, int]:
+        """
+        Ingest and register a context for the load tools. Returns the
+        context and how many chunks were reused from a previous version.
+        
+        If a context of the same name is loaded, it is treated as the
+        previous version: unchanged chunks reuse its term frequencies and
+        its cached results are carried over where they still hold. The
+        previous version is then retired, unless `keep_previous` is set.
+        """
+        reuse = self.previous_version(name)
+        context = self.ingest(sources, name, metadata, chunk_size, strategy, reuse)
+        carried = self.carry_over_results(reuse, context) if reuse else []
+        self.register_context(context)
+        
+        reused = len(reuse.mapping) if reuse else 0
+        with self.lock:
+            for key, results in carried:
+                self.cache.put(key, results)
+            self.stats["chunks_reused"] += reused
+        if reuse and not keep_previous and reuse.context_id != context.id:
+            self.retire_context(reuse.context_id)
+        return context, reused
+    
+    def retire_context(self, context_id: str):
+        """Unregister a version superseded by a reload and delete its files."""
+        with self.lock:
+            previous = self.contexts.pop(context_id, None)
+            if previous is None:
+                return
+            self.forget_context(context_id)
+        self.release_contexts([previous])
+    
+    def previous_version(self, name: str) -> Optional[ChunkReuse]:
+        """Reuse table of the most recent context named `name`, if any."""
+        with self.lock:
+            candidates = [c for c in self.contexts.values() if c.name == name]
+        if not candidates:
+            return None
+        previous = max(candidates, key=lambda c: c.created_at)
+        with previous.lock:
+            try:
+                return ChunkReuse(previous.id, self.data_dir / f"{previous.id}.chunks.jsonl")
+            except (OSError, ValueError, KeyError):
+                return None
+    
+    def carry_over_results(self, reuse: ChunkReuse,
+                           context: ContextStore) -> list[tuple[tuple, list[SearchResult]]]:
+        """
+        Cached results of the previous version that are still exact for the
+        new one, re-keyed and moved to the new chunk ids and offsets.
+        
+        Keyword entries hold when every result chunk was reused and no new
+        chunk contains a keyword; regex and section entries when a scan of
+        the new chunks (and the chunk before each) finds no match there, as
+        in survives_append. BM25, file-filtered and view entries are not
+        carried. Nothing is carried if reused chunks changed order, since
+        ties are ranked by chunk id.
+        """
+        with self.lock:
+            cached = {key: self.cache.peek(key) for key in self.cache.keys_for(reuse.context_id)}
+        if not cached or not reuse.mapping:
+            return []
+        old_ids = [reuse.mapping[i]["id"] for i in sorted(reuse.mapping)]
+        if any(a >= b for a, b in zip(old_ids, old_ids[1:])):
+            return []
+        new_ids = {old["id"]: new_id for new_id, old in reuse.mapping.items()}
+        changed = set(range(len(context.chunks))) - reuse.mapping.keys()
+        suspect = changed | {chunk_id - 1 for chunk_id in changed if chunk_id}
+        
+        carried = []
+        for key, results in cached.items():
+            _, query, search_type, top_k, file_pattern, view_id = key
+            if (results is None or file_pattern or view_id is not None
+                    or search_type not in ("keyword", "regex", "section")
+                    or any(r.chunk_id not in new_ids for r in results)):
+                continue
+            moved = [replace(r, chunk_id=new_ids[r.chunk_id]) for r in results]
+            if search_type == "keyword":
+                if any(chunk_id in changed
+                       for kw in self.split_keywords(query)
+                       for chunk_id in self.match_keyword(context, kw)):
+                    continue
+            else:
+                if any(r.chunk_id in suspect for r in moved):
+                    continue
+                if search_type == "regex":
+                    pattern, flags = query, re.IGNORECASE
+                else:
+                    pattern, flags = self.section_regex(query), re.MULTILINE | re.IGNORECASE
+                budget = self.scan_budget()
+                try:
+                    if suspect and (self.scan_regex(context, re.compile(pattern, flags), suspect, budget)
+                                    or budget and budget.timed_out):
+                        continue
+                except re.error:
+                    continue
+            
+            for r in moved:
+                chunk = context.chunks[r.chunk_id]
+                delta = chunk["start_char"] - reuse.mapping[r.chunk_id]["start_char"]
+                r.start_char, r.end_char = chunk["start_char"], chunk["end_char"]
+                r.matches = [(start + delta, end + delta) for start, end in r.matches]
+            carried.append(((context.id,) + key[1:], moved))
+        return carried
+    
+    def store_chunks(self, emitted: list[tuple[dict, str]], index: InvertedIndex,
+                     trigrams: Optional[TrigramIndex], chunks: list[dict], chunk_out,
+                     file_id: Optional[int] = None, reuse: Optional[ChunkReuse] = None):
+        """Index freshly built chunks and append their records to the chunks file."""
+        for chunk, text in emitted:
+            if file_id is not None:
+                chunk["file"] = file_id
+            if trigrams is not None:
+                trigrams.add_chunk(chunk["id"], text)
+            term_freqs = reuse and reuse.take(chunk)
+            if term_freqs is None:
+                term_freqs = index.add_chunk(chunk["id"], text)
+            else:
+                index.add_term_freqs(chunk["id"], term_freqs)
+            chunk_out.write(json.dumps({**chunk, "tf": term_freqs}) + "\n")
+            chunks.append(chunk)
+    
+    def stream_file(self, path: Path) -> Iterator[str]:
+        """Yield a file's text in decoded blocks of READ_BLOCK_SIZE bytes."""
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        with open(path, 'rb') as f:
+            while block := f.read(READ_BLOCK_SIZE):
+                yield decoder.decode(block)
+        yield decoder.decode(b"", final=True)
+    
+    def is_binary(self, path: Path) -> bool:
+        """Heuristic binary check: a NUL byte in the first block."""
+        with open(path, 'rb') as f:
+            return b"\x00" in f.read(8192)
+    
+    def register_context(self, context: ContextStore):
+        """Make a freshly ingested context active and write its manifest."""
+        with self.lock:
+            previous = self.contexts.get(context.id)
+            self.contexts[context.id] = context
+            self.active_session = context.id
+            self.stats["contexts_loaded"] += 1
+            self.forget_context(context.id)
+        if previous is not None:
+            with previous.lock:
+                previous.close()
+        self.save_manifest(context)
+        context.measure()
+        self.enforce_memory_budget(keep=context.id)
+    
+    def forget_context(self, context_id: str):
+        """Drop cached results, views and cursors of a reloaded or cleared context (hold `lock`)."""
+        self.cache.drop_context(context_id)
+        for key in [key for key in self.views if key[0] == context_id]:
+            del self.views[key]
+        self.drop_cursors(context_id)
+    
+    def drop_cursors(self, context_id: str):
+        """Invalidate the search cursors over a context (hold `lock`)."""
+        for cursor_id in [c.id for c in self.cursors.values() if c.context_id == context_id]:
+            del self.cursors[cursor_id]
+    
+    def save_manifest(self, context: ContextStore):
+        """Write the small `{id}.json` manifest used to restore the context."""
+        context_file = self.data_dir / f"{context.id}.json"
+        with open(context_file, 'w') as f:
+            json.dump({
+                "id": context.id,
+                "name": context.name,
+                "token_estimate": context.token_estimate,
+                "chunk_count": len(context.chunks),
+                "created_at": context.created_at,
+                "metadata": context.metadata
+            }, f, indent=2)
+    
+    def save_outline(self, context_id: str, outline: Outline):
+        """Persist the heading index as `{id}.outline.json`."""
+        with open(self.data_dir / f"{context_id}.outline.json", 'w') as f:
+            json.dump({"position": outline.position, "entries": outline.entries}, f)
+    
+    def save_tail(self, context_id: str, state: dict):
+        """Persist the chunker state before the end of the content as `{id}.tail.json`."""
+        with open(self.data_dir / f"{context_id}.tail.json", 'w') as f:
+            json.dump(state, f)
+    
+    def load_tail(self, context_id: str) -> Optional[dict]:
+        """The saved chunker state to append from (None for contexts saved without one)."""
+        try:
+            with open(self.data_dir / f"{context_id}.tail.json") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+    
+    def context_outline(self, context: ContextStore) -> Outline:
+        """
+        The heading index of a context (the caller holds its lock), read
+        from disk on first use. Contexts stored without one get it built
+        once from their chunks.
+        """
+        if context.outline is None:
+            outline_file = self.data_dir / f"{context.id}.outline.json"
+            if outline_file.exists():
+                with open(outline_file) as f:
+                    stored = json.load(f)
+                context.outline = Outline(stored["entries"], stored["position"])
+            else:
+                context.outline = Outline()
+                for chunk in context.chunks:
+                    context.outline.add_chunk(chunk, context.chunk_text(chunk))
+                self.save_outline(context.id, context.outline)
+        return context.outline
+    
+    def chunk_file(self, context: ContextStore, chunk: dict) -> Optional[str]:
+        """Path of the file a chunk came from (directory/file loads only)."""
+        if "file" not in chunk:
+            return None
+        return context.metadata["files"][chunk["file"]]["path"]
+    
+    def chunks_in_files(self, context: ContextStore, file_pattern: str) -> set[int]:
+        """Chunk ids belonging to files whose path matches a glob pattern."""
+        matched = set()
+        for entry in context.metadata.get("files", []):
+            if fnmatch.fnmatch(entry["path"], file_pattern):
+                first, last = entry["chunks"]
+                matched.update(range(first, last + 1))
+        return matched
+    
+    def make_result(self, chunk: dict, relevance: float, match_count: int) -> SearchResult:
+        """Build a search result for a chunk; its content is filled in on return."""
+        return SearchResult(
+            chunk_id=chunk["id"],
+            content="",
+            start_char=chunk["start_char"],
+            end_char=chunk["end_char"],
+            relevance_score=relevance,
+            match_count=match_count
+        )
+    
+    def build_index(self, context: ContextStore,
+                    chunks_file: Optional[Path] = None) -> InvertedIndex:
+        """
+        Build the inverted term index over a context's chunks.
+        
+        When `chunks_file` is given, every chunk record is also written there
+        (one JSON line each, with its term frequencies) so the context can be
+        restored after a restart without re-tokenizing.
+        """
+        index = InvertedIndex()
+        out = open(chunks_file, 'w') if chunks_file else None
+        try:
+            for chunk in context.chunks:
+                term_freqs = index.add_chunk(chunk["id"], context.chunk_text(chunk))
+                if out:
+                    out.write(json.dumps({**chunk, "tf": term_freqs}) + "\n")
+        finally:
+            if out:
+                out.close()
+        return index
+    
+    def scan_spans(self, context: ContextStore, chunk_ids: Optional[set[int]] = None,
+                   segment_size: int = SCAN_SEGMENT_SIZE) -> list[tuple[int, int]]:
+        """
+        Group the chunks to scan into (first_id, last_id) runs of consecutive
+        chunks, splitting runs at about `segment_size` bytes.
+        """
+        ids = range(len(context.chunks)) if chunk_ids is None else sorted(chunk_ids)
+        spans = []
+        first = prev = None
+        size = 0
+        for chunk_id in ids:
+            if first is not None and (chunk_id != prev + 1 or size >= segment_size):
+                spans.append((first, prev))
+                first = None
+            if first is None:
+                first = chunk_id
+                size = 0
+            chunk = context.chunks[chunk_id]
+            size += chunk["end"] - chunk["start"]
+            prev = chunk_id
+        if first is not None:
+            spans.append((first, prev))
+        return spans
+    
+    def plan_scan(self, context: ContextStore, chunk_ids: Optional[set[int]] = None,
+                  segment_size: int = SCAN_SEGMENT_SIZE) -> list[tuple]:
+        """
+        Turn scan_spans runs into (first_id, last_id, start, limit,
+        start_char, limit_char) tuples for scan_span. Each span accepts
+        matches from its first chunk up to where the next scanned span
+        takes over (or the end of its last chunk).
+        """
+        chunks = context.chunks
+        plan = []
+        for first, last in self.scan_spans(context, chunk_ids, segment_size):
+            following = last + 1
+            if following < len(chunks) and (chunk_ids is None or following in chunk_ids):
+                limit, limit_char = chunks[following]["start"], chunks[following]["start_char"]
+            else:
+                limit, limit_char = chunks[last]["end"], chunks[last]["end_char"]
+            plan.append((first, last, chunks[first]["start"], limit,
+                         chunks[first]["start_char"], limit_char))
+        return plan
+    
+    def scan_regex(self, context: ContextStore, compiled: re.Pattern,
+                   chunk_ids: Optional[set[int]] = None,
+                   budget: Optional[ScanBudget] = None) -> dict[int, list[tuple[int, int]]]:
+        """
+        Run a compiled pattern over the context's content in one pass.
+        
+        Content is decoded in large segments rather than per chunk, so the
+        overlap between chunks is scanned once and matches that cross a
+        chunk boundary are found. Each match is attributed to the chunk it
+        starts in by bisecting the sorted chunk start offsets. Large scans
+        are spread over the process pool when RLM_WORKERS is set.
+        
+        With a `budget`, the scan runs in guard processes and stops when the
+        budget runs out (see scan_guarded).
+        
+        Returns chunk_id -> [(start_char, end_char), ...] with absolute
+        character offsets.
+        """
+        plan = self.plan_scan(context, chunk_ids)
+        size = sum(span[3] - span[2] for span in plan)
+        parallel = self.workers > 1 and size >= self.parallel_min_bytes
+        if budget is not None:
+            if parallel:
+                plan = self.plan_scan(context, chunk_ids, self.shard_size(size))
+            return self.scan_guarded(context, compiled, plan, budget,
+                                     self.workers if parallel else 1)
+        if parallel:
+            return self.scan_parallel(context, compiled, chunk_ids, size)
+        
+        data = context.data
+        starts = context.chunk_starts()
+        hits: dict[int, list[tuple[int, int]]] = defaultdict(list)
+        for span in plan:
+            for chunk_id, match in scan_span(data, compiled, span, starts):
+                hits[chunk_id].append(match)
+        return hits
+    
+    def scan_literals(self, context: ContextStore, patterns: list[str], case_sensitive: bool,
+                      chunk_ids: Optional[set[int]] = None) -> list[dict[int, list[int]]]:
+        """
+        Find every occurrence of several literal strings in one pass.
+        
+        Each planned span is decoded (and lowercased) once and shared by all
+        patterns, which are then located with str.find: in CPython that
+        outruns both a per-character automaton and a regex alternation.
+        
+        Returns, per pattern, chunk_id -> [start_char, ...].
+        """
+        starts = context.chunk_starts()
+        data = context.data
+        needles = patterns if case_sensitive else [p.lower() for p in patterns]
+        # Literals need no lookback, and past the span only their own length
+        margin = max(len(p.encode("utf-8")) for p in patterns)
+        found = [defaultdict(list) for _ in patterns]
+        for span in self.plan_scan(context, chunk_ids):
+            first, last, _, _, start_char, _ = span
+            text, offset, accept = span_text(data, span, 0, margin)
+            haystack = text if case_sensitive else text.lower()
+            for hits, pattern, needle in zip(found, patterns, needles):
+                if len(haystack) == len(text):
+                    positions = find_all(haystack, needle, offset)
+                else:
+                    # Lowercasing changed the length, so offsets need the original
+                    compiled = re.compile(re.escape(pattern), re.IGNORECASE)
+                    positions = (m.start() for m in compiled.finditer(text, offset))
+                for position in positions:
+                    if position >= accept:
                         break
-                
-                current_chunk = overlap_lines
-                current_size = overlap_size
-                chunk_start = char_position - overlap_size
+                    char = start_char + position - offset
+                    index = bisect_right(starts, char, first, last + 1) - 1
+                    hits[max(index, first)].append(char)
+        return found
+    
+    def scan_parallel(self, context: ContextStore, compiled: re.Pattern,
+                      chunk_ids: Optional[set[int]], size: int) -> dict[int, list[tuple[int, int]]]:
+        """
+        scan_regex across the process pool.
+        
+        Spans are cut small enough to give every worker several shards and
+        dealt out round-robin; each shard comes back in chunk order and the
+        partial results are merged with a heap.
+        """
+        plan = self.plan_scan(context, chunk_ids, self.shard_size(size))
+        shards = self.deal_spans(context, plan, self.workers * SHARDS_PER_WORKER)
+        version = self.content_version(context)
+        partials = self.get_pool().starmap(
+            _scan_shard, [(str(context.path), version, compiled, shard) for shard in shards])
+        return dict(heapq.merge(*partials, key=itemgetter(0)))
+    
+    def shard_size(self, size: int) -> int:
+        """Span size giving every worker several shards of a `size`-byte scan."""
+        return min(SCAN_SEGMENT_SIZE, max(size // (self.workers * SHARDS_PER_WORKER), 1))
+    
+    @staticmethod
+    def deal_spans(context: ContextStore, plan: list[tuple], count: int) -> list[list]:
+        """Deal planned spans round-robin into `count` shards of (span, chunk starts)."""
+        starts = context.chunk_starts()
+        shards = [[] for _ in range(min(len(plan), count))]
+        for i, span in enumerate(plan):
+            shards[i % len(shards)].append((span, starts[span[0]:span[1] + 1]))
+        return shards
+    
+    @staticmethod
+    def content_version(context: ContextStore) -> tuple[int, int]:
+        """(inode, size) of the content file, so workers notice appends."""
+        stat = os.stat(context.path)
+        return (stat.st_ino, stat.st_size)
+    
+    def scan_guarded(self, context: ContextStore, compiled: re.Pattern, plan: list[tuple],
+                     budget: ScanBudget, guard_count: int) -> dict[int, list[tuple[int, int]]]:
+        """
+        scan_regex in killable guard processes, bounded by `budget`.
+        
+        The spans are dealt out to `guard_count` guards (at most
+        `guard_limit`), which stream their matches back. Guards still
+        scanning when the budget runs out are killed (and replaced on next
+        use); the matches received so far are returned and the budget is
+        marked timed out.
+        """
+        hits: dict[int, list[tuple[int, int]]] = defaultdict(list)
+        shards = self.deal_spans(context, plan, min(guard_count, self.guard_limit))
+        if not shards or budget.timed_out:
+            return hits
+        version = self.content_version(context)
+        guards = self.take_guards(len(shards))
+        running = {guard.conn: guard for guard in guards}
+        try:
+            for guard, shard in zip(guards, shards):
+                guard.conn.send((str(context.path), version, compiled, shard))
             
-            current_chunk.append(line)
-            current_size += line_size
-            char_position += line_size
-        
-        # Add final chunk
-        if current_chunk:
-            chunk_text = '\n'.join(current_chunk)
-            chunks.append({
-                "id": len(chunks),
-                "content": chunk_text,
-                "start_char": chunk_start,
-                "end_char": char_position,
-                "start_line": chunk_start,
-                "tokens": self.estimate_tokens(chunk_text)
-            })
-        
-        return chunks
+            started = time.monotonic()
+            deadline = started + budget.seconds
+            while running:
+                remaining = deadline - time.monotonic()
+                ready = multiprocessing.connection.wait(list(running), remaining) if remaining > 0 else []
+                if not ready:
+                    break
+                for conn in ready:
+                    message = conn.recv()
+                    if message is None:
+                        self.release_guard(running.pop(conn))
+                    elif isinstance(message, Exception):
+                        self.release_guard(running.pop(conn))
+                        raise message
+                    else:
+                        for chunk_id, match in message:
+                            hits[chunk_id].append(match)
+            budget.seconds = max(budget.seconds - (time.monotonic() - started), 0.0)
+        finally:
+            for guard in running.values():
+                self.retire_guard(guard)
+        
+        if running:
+            budget.timed_out = True
+            logger.warning(f"Regex scan of {compiled.pattern!r} cut short after the time budget")
+            with self.lock:
+                self.stats["regex_timeouts"] += 1
+        return dict(sorted(hits.items()))
+    
+    def take_guards(self, count: int) -> list[RegexGuard]:
+        """
+        `count` guards (at most `guard_limit`): idle ones first, then newly
+        started ones. All are taken at once, waiting for other scans to hand
+        theirs back when the limit is reached, so two scans never hold part
+        of what they need while waiting for each other.
+        """
+        with self.guard_slots:
+            while True:
+                for guard in [g for g in self.guards if not g.process.is_alive()]:
+                    self.guards.remove(guard)
+                    guard.conn.close()
+                    self.live_guards -= 1
+                if len(self.guards) + self.guard_limit - self.live_guards >= count:
+                    break
+                self.guard_slots.wait()
+            taken = [self.guards.pop() for _ in range(min(count, len(self.guards)))]
+            started = count - len(taken)
+            self.live_guards += started
+        try:
+            for _ in range(started):
+                taken.append(RegexGuard())
+                started -= 1
+        except BaseException:
+            for guard in taken:
+                self.release_guard(guard)
+            with self.guard_slots:
+                self.live_guards -= started
+                self.guard_slots.notify_all()
+            raise
+        return taken
+    
+    def release_guard(self, guard: RegexGuard):
+        """Hand an idle guard back to the pool."""
+        with self.guard_slots:
+            self.guards.append(guard)
+            self.guard_slots.notify_all()
+    
+    def retire_guard(self, guard: RegexGuard):
+        """Kill a guard (e.g. one stuck in a scan), freeing its slot."""
+        guard.kill()
+        with self.guard_slots:
+            self.live_guards -= 1
+            self.guard_slots.notify_all()
+    
+    def scan_budget(self) -> Optional[ScanBudget]:
+        """A fresh time budget for the scans of one query (None if unbounded)."""
+        return ScanBudget(self.regex_timeout) if self.regex_timeout > 0 else None
+    
+    def get_pool(self):
+        """The worker pool for parallel scans, started on first use."""
+        with self.lock:
+            if self.pool is None:
+                # spawn rather than fork: the server runs executor threads
+                self.pool = multiprocessing.get_context("spawn").Pool(self.workers)
+                logger.info(f"Started {self.workers} scan workers")
+            return self.pool
+    
+    def shutdown(self):
+        """Stop the executor, the worker pool (if one was started) and the guards."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        with self.guard_slots:
+            guards, self.guards = self.guards, []
+        for guard in guards:
+            self.retire_guard(guard)
+    
+    def regex_candidates(self, context: ContextStore, pattern: str,
+                         flags: int) -> Optional[set[int]]:
+        """
+        Chunks that can contain a match according to the trigram index, or
+        None when the pattern has no usable literals and needs a full scan.
+        """
+        query = regex_trigram_query(pattern, flags)
+        if query is None:
+            return None
+        if context.trigrams is None:
+            # Restored, spilled and chunk-reusing reloads build it on first use
+            context.trigrams = TrigramIndex()
+            for chunk in context.chunks:
+                context.trigrams.add_chunk(chunk["id"], context.chunk_text(chunk))
+            context.measure()
+        return context.trigrams.candidates(query)
+    
+    @staticmethod
+    def restrict(candidates: Optional[set[int]],
+                 chunk_ids: Optional[frozenset]) -> Optional[set[int]]:
+        """Intersect scan candidates (None = all chunks) with a chunk selection."""
+        if chunk_ids is None:
+            return candidates
+        return set(chunk_ids) if candidates is None else candidates & chunk_ids
     
     def search_regex(self, context: ContextStore, pattern: str, 
-                     flags: int = re.IGNORECASE) -> list[SearchResult]:
-        """Search using regex pattern."""
+                     flags: int = re.IGNORECASE,
+                     chunk_ids: Optional[frozenset] = None,
+                     budget: Optional[ScanBudget] = None) -> list[SearchResult]:
+        """Search using regex pattern (within `chunk_ids`, if given)."""
         results = []
         try:
             compiled = re.compile(pattern, flags)
+            candidates = self.restrict(self.regex_candidates(context, pattern, flags), chunk_ids)
             
-            for chunk in context.chunks:
-                matches = list(compiled.finditer(chunk["content"]))
-                if matches:
-                    # Calculate relevance based on match density
-                    relevance = len(matches) / (len(chunk["content"]) / 100)
-                    results.append(SearchResult(
-                        chunk_id=chunk["id"],
-                        content=chunk["content"],
-                        start_char=chunk["start_char"],
-                        end_char=chunk["end_char"],
-                        relevance_score=min(relevance, 1.0),
-                        match_count=len(matches)
-                    ))
+            for chunk_id, matches in self.scan_regex(context, compiled, candidates, budget).items():
+                chunk = context.chunks[chunk_id]
+                # Calculate relevance based on match density
+                length = max(chunk["end_char"] - chunk["start_char"], 1)
+                relevance = len(matches) / (length / 100)
+                result = self.make_result(chunk, min(relevance, 1.0), len(matches))
+                result.matches = matches
+                results.append(result)
         except re.error as e:
             logger.error(f"Regex error: {e}")
             
-        return sorted(results, key=lambda x: x.relevance_score, reverse=True)
+        return results
+    
+    def match_keyword(self, context: ContextStore, keyword: str) -> set[int]:
+        """
+        Find the chunks containing a keyword anywhere (case-insensitive).
+        
+        A keyword of word characters only can just occur inside an indexed
+        term, so the postings of the terms containing it are merged
+        ("token" finds "access_token"). Other keywords ("foo.bar", "c++")
+        are checked as substrings of the chunks the trigram index cannot
+        rule out.
+        """
+        keyword = keyword.lower()
+        if tokenize(keyword) == [keyword]:
+            matched = set()
+            for term in context.index.containing(keyword):
+                matched.update(context.index.lookup(term))
+            return matched
+        
+        candidates = self.regex_candidates(context, re.escape(keyword), re.IGNORECASE)
+        chunks = context.chunks if candidates is None else [context.chunks[c] for c in sorted(candidates)]
+        return {c["id"] for c in chunks if keyword in context.chunk_text(c).lower()}
     
     def search_keyword(self, context: ContextStore, keywords: list[str],
                        match_all: bool = False) -> list[SearchResult]:
         """Search for keywords in context."""
-        results = []
+        if not keywords:
+            return []
         
-        for chunk in context.chunks:
-            content_lower = chunk["content"].lower()
-            matches = sum(1 for kw in keywords if kw.lower() in content_lower)
-            
+        match_counts: dict[int, int] = defaultdict(int)
+        for kw in keywords:
+            for chunk_id in self.match_keyword(context, kw):
+                match_counts[chunk_id] += 1
+        
+        results = []
+        for chunk_id, matches in match_counts.items():
             if match_all and matches < len(keywords):
                 continue
-            if matches == 0:
-                continue
-                
+            
             relevance = matches / len(keywords)
-            results.append(SearchResult(
-                chunk_id=chunk["id"],
-                content=chunk["content"],
-                start_char=chunk["start_char"],
-                end_char=chunk["end_char"],
-                relevance_score=relevance,
-                match_count=matches
-            ))
+            results.append(self.make_result(context.chunks[chunk_id], relevance, matches))
+        
+        return results
+    
+    def search_bm25(self, context: ContextStore, query: str) -> list[SearchResult]:
+        """
+        Rank chunks with BM25 over the inverted index.
+        
+        Query words that are not indexed verbatim are expanded to the indexed
+        words they prefix, each contributing with its own IDF.
+        """
+        terms = self.query_terms(context, query)
+        scores = context.index.bm25(terms)
+        
+        results = []
+        for chunk_id, score in scores.items():
+            match_count = sum(1 for t in terms if chunk_id in context.index.lookup(t))
+            results.append(self.make_result(context.chunks[chunk_id], score, match_count))
+        
+        return results
+    
+    def search_vector(self, context: ContextStore, query: str,
+                      chunk_ids: Optional[set[int]] = None) -> list[SearchResult]:
+        """
+        Rank chunks by the cosine similarity of their TF-IDF vectors to the
+        query's (see VectorIndex), built on the first vector search. Query
+        words are expanded like BM25's.
+        """
+        terms = self.query_terms(context, query)
+        if context.vectors is None:
+            context.vectors = VectorIndex(context.index, len(context.chunks), self.lsa_dims)
+            context.measure()
+        scores = context.vectors.search(terms, chunk_ids)
+        
+        results = []
+        for chunk_id, score in scores.items():
+            match_count = sum(1 for t in terms if chunk_id in context.index.lookup(t))
+            results.append(self.make_result(context.chunks[chunk_id], score, match_count))
+        
+        return results
+    
+    def search_boolean(self, context: ContextStore, query: str,
+                       chunk_ids: Optional[set[int]] = None) -> list[SearchResult]:
+        """
+        Evaluate a boolean query (see parse_boolean_query) by combining
+        posting lists; matches are ranked by BM25 over the query's words.
+        """
+        tree = self.bind_terms(context, parse_boolean_query(query))
+        matched = self.boolean_chunks(context, tree, chunk_ids)
+        terms = self.query_terms(context, " ".join(boolean_terms(tree)))
+        scores = context.index.bm25(terms)
         
-        return sorted(results, key=lambda x: x.relevance_score, reverse=True)
+        results = []
+        for chunk_id in matched:
+            match_count = sum(1 for t in terms if chunk_id in context.index.lookup(t))
+            results.append(self.make_result(context.chunks[chunk_id], scores.get(chunk_id, 0.0),
+                                            match_count))
+        return results
+    
+    @staticmethod
+    def bind_terms(context: ContextStore, node: tuple) -> tuple:
+        """Resolve words and prefixes to ("any", indexed terms) leaves."""
+        kind = node[0]
+        if kind == "word":
+            return ("any", (node[1],))
+        if kind == "prefix":
+            return ("any", tuple(context.index.expand(node[1])))
+        if kind == "near":
+            return ("near", RLMServer.bind_terms(context, node[1]),
+                    RLMServer.bind_terms(context, node[2]), node[3])
+        if kind == "not":
+            return ("not", RLMServer.bind_terms(context, node[1]))
+        if kind in ("and", "or"):
+            return (kind, [RLMServer.bind_terms(context, item) for item in node[1]])
+        return node
+    
+    def boolean_chunks(self, context: ContextStore, node: tuple,
+                       within: Optional[set[int]] = None) -> set[int]:
+        """
+        Chunk ids matching a bound boolean query node, limited to `within`
+        when given. AND evaluates its most selective operands first and
+        narrows the rest to what is left, so positions (phrases, NEAR) are
+        only read for the surviving chunks; only a NOT with nothing positive
+        beside it enumerates all chunks.
+        """
+        kind = node[0]
+        if kind == "any":
+            postings = [context.index.lookup(term) for term in node[1]]
+            if within is not None and len(within) < sum(map(len, postings)):
+                return {c for c in within if any(c in posting for posting in postings)}
+            matched = set().union(*postings)
+        elif kind == "field":
+            pattern = node[2] if node[1] == "file" else f"*.{node[2].lstrip('.')}"
+            matched = self.chunks_in_files(context, pattern)
+        elif kind == "or":
+            matched = set()
+            for item in node[1]:
+                matched |= self.boolean_chunks(context, item, within)
+            return matched
+        elif kind == "not":
+            universe = within if within is not None else set(range(len(context.chunks)))
+            return universe - self.boolean_chunks(context, node[1], within)
+        elif kind == "and":
+            negated = [item[1] for item in node[1] if item[0] == "not"]
+            positive = sorted((item for item in node[1] if item[0] != "not"),
+                              key=lambda item: self.estimate_matches(context, item))
+            if not positive:
+                return self.boolean_chunks(context, ("not", ("or", negated)), within)
+            matched = within
+            for item in positive:
+                matched = self.boolean_chunks(context, item, matched)
+                if not matched:
+                    return set()
+            for item in negated:
+                matched = matched - self.boolean_chunks(context, item, matched)
+            return matched
+        else:
+            # Phrase / NEAR: the chunks holding every word, then a position check
+            if kind == "phrase":
+                matched = within
+                for term in sorted(node[1], key=lambda t: len(context.index.lookup(t))):
+                    matched = self.boolean_chunks(context, ("any", (term,)), matched)
+                    if not matched:
+                        return set()
+            else:
+                matched = self.boolean_chunks(context, node[1], within)
+                matched = self.boolean_chunks(context, node[2], matched) if matched else set()
+            if matched:
+                positions = self.positional_index(context)
+                matched = {c for c in matched if positions.spans(node, c)}
+            return matched
+        return matched if within is None else matched & within
+    
+    def estimate_matches(self, context: ContextStore, node: tuple) -> tuple:
+        """
+        Sort key putting AND operands in evaluation order: posting lists by
+        size, then positional checks, then whatever needs every chunk.
+        """
+        kind = node[0]
+        if kind == "any":
+            return (0, sum(len(context.index.lookup(t)) for t in node[1]))
+        if kind == "phrase":
+            return (1, min(len(context.index.lookup(t)) for t in node[1]))
+        if kind == "near":
+            return (1, min(self.estimate_matches(context, node[1])[1],
+                           self.estimate_matches(context, node[2])[1]))
+        return (2, len(context.chunks))
+    
+    def positional_index(self, context: ContextStore) -> PositionalIndex:
+        """The context's word positions, built on first use (hold the context lock)."""
+        if context.positions is None:
+            context.positions = PositionalIndex()
+            for chunk in context.chunks:
+                context.positions.add_chunk(chunk["id"], context.chunk_text(chunk))
+            context.measure()
+        return context.positions
+    
+    @staticmethod
+    def query_terms(context: ContextStore, query: str) -> list[str]:
+        """
+        Indexed terms of a query: words indexed verbatim, others expanded to
+        the indexed words they prefix.
+        """
+        terms = []
+        for word in dict.fromkeys(tokenize(query)):
+            if context.index.lookup(word):
+                terms.append(word)
+            else:
+                terms.extend(context.index.expand(word))
+        return terms
     
     def search_semantic_sections(self, context: ContextStore, 
-                                 section_pattern: str) -> list[SearchResult]:
+                                 section_pattern: str,
+                                 chunk_ids: Optional[frozenset] = None,
+                                 budget: Optional[ScanBudget] = None) -> list[SearchResult]:
         """
         Search for semantic sections (chapters, functions, etc.)
         Uses heuristics to identify logical document sections.
         """
         results = []
+        combined_pattern = self.section_regex(section_pattern)
         
+        try:
+            flags = re.MULTILINE | re.IGNORECASE
+            compiled = re.compile(combined_pattern, flags)
+            candidates = self.restrict(
+                self.regex_candidates(context, combined_pattern, flags), chunk_ids)
+            
+            for chunk_id, matches in self.scan_regex(context, compiled, candidates, budget).items():
+                result = self.make_result(context.chunks[chunk_id], len(matches) / 10, len(matches))
+                result.matches = matches
+                results.append(result)
+        except re.error:
+            pass
+            
+        return results
+    
+    def section_regex(self, section_pattern: str) -> str:
+        """The combined heading pattern section search runs for a query."""
         # Common section patterns
         patterns = [
             r'^#{1,6}\s+' + section_pattern,  # Markdown headers
@@ -239,27 +2935,7 @@ class RLMServer:
             r'^<' + section_pattern + r'[^>]*>',  # XML/HTML tags
             r'^\d+\.\d*\s+' + section_pattern,  # Numbered sections
         ]
-        
-        combined_pattern = '|'.join(f'({p})' for p in patterns)
-        
-        try:
-            compiled = re.compile(combined_pattern, re.MULTILINE | re.IGNORECASE)
-            
-            for chunk in context.chunks:
-                matches = list(compiled.finditer(chunk["content"]))
-                if matches:
-                    results.append(SearchResult(
-                        chunk_id=chunk["id"],
-                        content=chunk["content"],
-                        start_char=chunk["start_char"],
-                        end_char=chunk["end_char"],
-                        relevance_score=len(matches) / 10,
-                        match_count=len(matches)
-                    ))
-        except re.error:
-            pass
-            
-        return sorted(results, key=lambda x: x.relevance_score, reverse=True)
+        return '|'.join(f'({p})' for p in patterns)
     
     def get_context_window(self, context: ContextStore, chunk_id: int,
                            window_size: int = 1) -> str:
@@ -268,216 +2944,1084 @@ class RLMServer:
         end_idx = min(len(context.chunks), chunk_id + window_size + 1)
         
         chunks = context.chunks[start_idx:end_idx]
-        return '\n'.join(c["content"] for c in chunks)
+        return '\n'.join(context.chunk_text(c) for c in chunks)
     
     # === MCP Tool Implementations ===
     
     async def load_context(self, content: str, name: str = "default",
-                          metadata: dict = None) -> dict:
+                          metadata: dict = None, chunk_size: int = None,
+                          strategy: str = None, keep_previous: bool = False) -> dict:
         """
         Load a large context into RLM storage.
         
         The context is chunked and indexed for efficient recursive searching.
-        This is the first step in the RLM workflow.
+        This is the first step in the RLM workflow. `chunk_size` and
+        `strategy` override the server's chunking defaults for this context.
+        Loading under an existing name replaces that context unless
+        `keep_previous` is set.
+        """
+        if error := self.check_chunking(chunk_size, strategy):
+            return {"error": error}
+        pieces = (content[i:i + READ_BLOCK_SIZE] for i in range(0, len(content), READ_BLOCK_SIZE))
+        context, reused = await self.run_blocking(self.load_sources, [(None, pieces)], name,
+                                                  metadata, chunk_size, strategy, keep_previous)
+        
+        return {
+            "success": True,
+            "context_id": context.id,
+            "name": name,
+            "token_estimate": context.token_estimate,
+            "chunk_count": len(context.chunks),
+            "reused_chunks": reused,
+            "message": f"Context loaded successfully. Use search tools to query {context.token_estimate:,} tokens across {len(context.chunks)} chunks."
+        }
+    
+    async def load_file(self, path: str, name: str = None,
+                        metadata: dict = None, chunk_size: int = None,
+                        strategy: str = None, keep_previous: bool = False) -> dict:
         """
-        context_id = self.generate_id(content)
+        Load a file from disk into RLM storage.
         
-        # Chunk the content
-        chunks = self.chunk_content(content)
+        The file is streamed in blocks and chunked/indexed on the fly, so
+        the content never has to pass through the tool call itself.
+        """
+        file_path = Path(path).expanduser()
+        if not file_path.is_file():
+            return {"error": f"File not found: {path}"}
+        if error := self.check_chunking(chunk_size, strategy):
+            return {"error": error}
         
-        context = ContextStore(
-            id=context_id,
-            name=name,
-            content=content,
-            token_estimate=self.estimate_tokens(content),
-            created_at=datetime.now().isoformat(),
-            metadata=metadata or {},
-            chunks=chunks
+        context, reused = await self.run_blocking(
+            self.load_sources,
+            [(file_path.name, self.stream_file(file_path))],
+            name or file_path.name,
+            {**(metadata or {}), "source": str(file_path.resolve())},
+            chunk_size,
+            strategy,
+            keep_previous
         )
         
-        self.contexts[context_id] = context
-        self.active_session = context_id
-        self.stats["contexts_loaded"] += 1
+        return {
+            "success": True,
+            "context_id": context.id,
+            "name": context.name,
+            "token_estimate": context.token_estimate,
+            "chunk_count": len(context.chunks),
+            "reused_chunks": reused,
+            "message": f"File loaded successfully. Use search tools to query {context.token_estimate:,} tokens across {len(context.chunks)} chunks."
+        }
+    
+    async def load_directory(self, path: str, patterns: list[str] = None,
+                             exclude: list[str] = None, name: str = None,
+                             metadata: dict = None, chunk_size: int = None,
+                             strategy: str = None, keep_previous: bool = False) -> dict:
+        """
+        Load every file under a directory that matches the glob patterns.
+        
+        Files are streamed one after another into a single context; chunks
+        never span files, and each chunk remembers its file so searches can
+        be filtered with `file_pattern`. Binary files are skipped. With the
+        `auto` strategy, each file is chunked as code or prose by extension.
+        """
+        root = Path(path).expanduser()
+        if not root.is_dir():
+            return {"error": f"Directory not found: {path}"}
+        if error := self.check_chunking(chunk_size, strategy):
+            return {"error": error}
         
-        # Save to disk for persistence
-        context_file = self.data_dir / f"{context_id}.json"
-        with open(context_file, 'w') as f:
-            json.dump({
-                "id": context_id,
-                "name": name,
-                "token_estimate": context.token_estimate,
-                "chunk_count": len(chunks),
-                "created_at": context.created_at,
-                "metadata": metadata or {}
-            }, f, indent=2)
+        files, skipped = await self.run_blocking(self.collect_files, root, patterns, exclude)
+        if not files:
+            return {"error": "No matching text files found.", "skipped": skipped[:50]}
+        
+        context, reused = await self.run_blocking(
+            self.load_sources,
+            ((relative, self.stream_file(file_path)) for relative, file_path in files),
+            name or root.resolve().name,
+            {**(metadata or {}), "source": str(root.resolve()), "patterns": patterns or ["**/*"]},
+            chunk_size,
+            strategy,
+            keep_previous
+        )
+        
+        return {
+            "success": True,
+            "context_id": context.id,
+            "name": context.name,
+            "token_estimate": context.token_estimate,
+            "chunk_count": len(context.chunks),
+            "reused_chunks": reused,
+            "file_count": len(files),
+            "skipped_files": len(skipped),
+            "message": f"Loaded {len(files)} files. Use search tools to query {context.token_estimate:,} tokens across {len(context.chunks)} chunks (filter with file_pattern)."
+        }
+    
+    def collect_files(self, root: Path, patterns: Optional[list[str]],
+                      exclude: Optional[list[str]]) -> tuple[list[tuple[str, Path]], list[str]]:
+        """
+        Walk a directory for rlm_load_directory. Returns (relative path,
+        path) pairs of the text files to load, and the skipped empty or
+        binary files.
+        """
+        candidates = set()
+        for pattern in patterns or ["**/*"]:
+            candidates.update(p for p in root.glob(pattern) if p.is_file())
+        
+        files = []
+        skipped = []
+        for file_path in sorted(candidates):
+            relative = file_path.relative_to(root).as_posix()
+            if any(fnmatch.fnmatch(relative, ex) for ex in exclude or []):
+                continue
+            if file_path.stat().st_size == 0 or self.is_binary(file_path):
+                skipped.append(relative)
+                continue
+            files.append((relative, file_path))
+        return files, skipped
+    
+    async def append_context(self, content: str = None, context_id: str = None,
+                             path: str = None) -> dict:
+        """
+        Append text to an existing context without re-chunking all of it.
+        
+        Only the tail is processed: the chunks emitted by the end of the
+        content are re-opened (their postings are dropped and the chunker
+        resumes from its saved state with the new text), new chunks are
+        indexed, the content file is extended and the re-opened chunks'
+        records in the chunks file are replaced in place. The result is the
+        one a full reload gives. Cost is proportional to the appended bytes
+        plus the re-opened chunks, not the context size.
+        """
+        if (content is None) == (path is None):
+            return {"error": "Provide exactly one of 'content' or 'path'."}
+        if path is not None:
+            file_path = Path(path).expanduser()
+            if not file_path.is_file():
+                return {"error": f"File not found: {path}"}
+            pieces = self.stream_file(file_path)
+        else:
+            pieces = (content[i:i + READ_BLOCK_SIZE] for i in range(0, len(content), READ_BLOCK_SIZE))
+        
+        context = await self.run_blocking(self.get_context, context_id)
+        if context is None:
+            return {"error": "No context loaded."}
+        
+        return await self.run_blocking(self.extend_context, context, pieces)
+    
+    def extend_context(self, context: ContextStore, pieces: Iterable[str]) -> dict:
+        """The body of append_context, run in the executor under the context lock."""
+        with context.lock:
+            self.hydrate(context)
+            first_new, added_tokens = self.extend_chunks(context, pieces)
+            with self.lock:
+                self.drop_cursors(context.id)
+                cached = {key: self.cache.peek(key) for key in self.cache.keys_for(context.id)}
+            stale = [key for key, results in cached.items()
+                     if not self.survives_append(context, key, results, first_new)]
+            context.measure()
+        
+        with self.lock:
+            for key in stale:
+                self.cache.discard(key)
+        self.enforce_memory_budget(keep=context.id)
+        
+        return {
+            "success": True,
+            "context_id": context.id,
+            "appended_tokens": added_tokens,
+            "token_estimate": context.token_estimate,
+            "chunk_count": len(context.chunks),
+            "rechunked": [first_new, len(context.chunks) - 1],
+            "message": f"Appended ~{added_tokens:,} tokens; chunks {first_new}-{len(context.chunks) - 1} were (re)indexed."
+        }
+    
+    def survives_append(self, context: ContextStore, key: tuple,
+                        results: list[SearchResult], first_new: int) -> bool:
+        """
+        Whether cached results are still exact after an append that rebuilt
+        chunks from `first_new` on.
+        
+        BM25 entries never are (IDF and average length change). Keyword
+        entries are kept when no rebuilt chunk contains a keyword; regex and
+        section entries when the trigram index rules out the rebuilt chunks
+        and the one before them (a match may run on into the new text).
+        In both cases no cached result may point at a rebuilt chunk.
+        """
+        _, query, search_type = key[:3]
+        if search_type == "keyword":
+            if any(r.chunk_id >= first_new for r in results):
+                return False
+            return not any(chunk_id >= first_new
+                           for kw in self.split_keywords(query)
+                           for chunk_id in self.match_keyword(context, kw))
+        if search_type in ("regex", "section"):
+            if any(r.chunk_id >= first_new - 1 for r in results):
+                return False
+            if search_type == "regex":
+                candidates = self.regex_candidates(context, query, re.IGNORECASE)
+            else:
+                candidates = self.regex_candidates(context, self.section_regex(query),
+                                                   re.MULTILINE | re.IGNORECASE)
+            return candidates is not None and not any(c >= first_new - 1 for c in candidates)
+        return False
+    
+    def extend_chunks(self, context: ContextStore,
+                      pieces: Iterable[str]) -> tuple[int, int]:
+        """
+        Append text to a context's content, chunks and indexes. Returns the
+        first (re)built chunk id and the number of tokens added.
+        
+        The chunker resumes from the state saved just before the end of the
+        content (`{id}.tail.json`): the chunks that ending emitted are
+        dropped and rebuilt together with the new text, so the result is
+        the one a single load of the whole text gives. Contexts saved
+        without that state re-open their last chunk only.
+        """
+        outline = self.context_outline(context)
+        settings = self.chunk_settings(context.metadata)
+        tail = self.load_tail(context.id)
+        first_new = tail["next_id"] if tail is not None else len(context.chunks) - 1
+        reopened = context.chunks[first_new:]
+        del context.chunks[first_new:]
+        context._starts = []
+        
+        chunks_file = self.data_dir / f"{context.id}.chunks.jsonl"
+        texts = [context.chunk_text(chunk) for chunk in reopened]
+        for chunk, text in zip(reversed(reopened), reversed(texts)):
+            context.index.remove_chunk(chunk["id"], Counter(tokenize(text)))
+            if context.trigrams is not None:
+                context.trigrams.remove_last_chunk(chunk["id"], text)
+            if context.positions is not None:
+                context.positions.remove_chunk(chunk["id"], text)
+            truncate_last_line(chunks_file)
+        # Every IDF shifts, so the vectors are rebuilt on the next vector search
+        context.vectors = None
+        
+        file_id = reopened[0].get("file")
+        if tail is not None:
+            outline.truncate(context.chunks[-1]["end_char"] if context.chunks else 0)
+            builder = ChunkBuilder.resume(settings["chunk_size"], settings["overlap"], tail)
+            emitted = []
+        else:
+            last, last_text = reopened[0], texts[0]
+            # The old last line may be continued by the appended text
+            outline.truncate(last["start_char"] + last_text.rfind("\n") + 1)
+            label = context.metadata["files"][file_id]["path"] if file_id is not None else context.name
+            builder = ChunkBuilder(settings["chunk_size"], settings["overlap"], first_id=last["id"],
+                                   start=last["start"], start_char=last["start_char"],
+                                   strategy=resolve_strategy(settings["strategy"], label),
+                                   # older records stored a character offset here
+                                   start_line=last["start_line"] if "end_line" in last else 1)
+            emitted = builder.feed(last_text)
         
-        # Save content separately (large file)
-        content_file = self.data_dir / f"{context_id}.txt"
-        with open(content_file, 'w') as f:
-            f.write(content)
+        context.close()  # the mapping is re-created at the new size
+        with open(context.path, 'ab') as out, open(chunks_file, 'a') as chunk_out:
+            def store(emitted: list[tuple[dict, str]]):
+                self.store_chunks(emitted, context.index, context.trigrams,
+                                  context.chunks, chunk_out, file_id)
+                for chunk, text in emitted:
+                    outline.add_chunk(chunk, text)
+                    if context.positions is not None:
+                        context.positions.add_chunk(chunk["id"], text)
+            
+            store(emitted)
+            for piece in pieces:
+                out.write(piece.encode("utf-8", errors="replace"))
+                store(builder.feed(piece))
+            tail = builder.state()
+            store(builder.end_segment())
+        self.save_tail(context.id, tail)
         
-        return {
-            "success": True,
-            "context_id": context_id,
-            "name": name,
-            "token_estimate": context.token_estimate,
-            "chunk_count": len(chunks),
-            "message": f"Context loaded successfully. Use search tools to query {context.token_estimate:,} tokens across {len(chunks)} chunks."
-        }
+        if file_id is not None:
+            entry = context.metadata["files"][file_id]
+            entry["end"] = builder.position - 1
+            entry["chunks"][1] = builder.next_id - 1
+        
+        added_tokens = (builder.char_position - 1) // 4 - context.token_estimate
+        context.token_estimate += added_tokens
+        self.save_manifest(context)
+        self.save_outline(context.id, outline)
+        return first_new, added_tokens
     
     async def search_context(self, query: str, context_id: str = None,
                             search_type: str = "auto", top_k: int = 5,
-                            parent_query_id: str = None) -> dict:
+                            parent_query_id: str = None,
+                            file_pattern: str = None,
+                            view: Optional[ContextView] = None,
+                            snippets: bool = False,
+                            snippet_radius: int = SNIPPET_RADIUS,
+                            snippet_tokens: int = SNIPPET_TOKENS,
+                            force: bool = False) -> dict:
         """
         Search through a loaded context.
         
         Search types:
         - auto: Automatically determine best search strategy
         - regex: Use regex pattern matching
+        - bm25: Rank chunks by BM25 relevance (default for plain text)
+        - vector: Rank chunks by TF-IDF cosine similarity
+        - boolean: AND/OR/NOT, quoted phrases, NEAR/n and file:/ext: filters
         - keyword: Search for keywords
         - section: Find semantic sections (chapters, functions, etc.)
         
+        `file_pattern` restricts results to chunks from matching files
+        (contexts loaded with rlm_load_file / rlm_load_directory). `view`
+        restricts the search to a recursive selection of chunks. With
+        `snippets`, results carry windows of `snippet_radius` characters
+        around each match instead of the chunk content.
+        
+        Regex scans stop after RLM_REGEX_TIMEOUT_MS, returning what they
+        found with `timed_out` set. Patterns with nested quantifiers are
+        refused unless `force` is set.
+        
         This is the core RLM search operation.
         """
-        context_id = context_id or self.active_session
-        if not context_id or context_id not in self.contexts:
+        context = await self.run_blocking(self.get_context, context_id)
+        if context is None:
             return {"error": "No context loaded. Use rlm_load first."}
+        context_id = context.id
+        if top_k < 1:
+            return {"error": "top_k must be >= 1."}
+        if snippets and (snippet_radius < 0 or snippet_tokens < 1):
+            return {"error": "snippet_radius must be >= 0 and snippet_tokens >= 1."}
+        snippet_options = (snippet_radius, snippet_tokens) if snippets else None
         
-        context = self.contexts[context_id]
-        
-        # Determine search depth
-        depth = 0
-        if parent_query_id and parent_query_id in self.queries:
-            depth = self.queries[parent_query_id].depth + 1
-            if depth > self.max_depth:
-                return {
-                    "error": f"Maximum recursion depth ({self.max_depth}) reached.",
-                    "suggestion": "Try a different search strategy or broaden your query."
-                }
-        
-        # Create query record
-        query_id = f"q_{len(self.queries)}_{self.generate_id(query)[:6]}"
-        query_record = RecursiveQuery(
-            query_id=query_id,
-            parent_id=parent_query_id,
-            depth=depth,
-            query=query,
-            context_id=context_id,
-            timestamp=datetime.now().isoformat()
-        )
+        with self.lock:
+            # Determine search depth
+            depth = 0
+            if parent_query_id and parent_query_id in self.queries:
+                depth = self.queries[parent_query_id].depth + 1
+                if depth > self.max_depth:
+                    return {
+                        "error": f"Maximum recursion depth ({self.max_depth}) reached.",
+                        "suggestion": "Try a different search strategy or broaden your query."
+                    }
         
-        # Auto-detect search type
+        asked = query
+        plan = None
         if search_type == "auto":
-            if re.search(r'[*+?\\.\[\]{}()^$|]', query):
-                search_type = "regex"
-            elif any(kw in query.lower() for kw in ['chapter', 'section', 'function', 'class', 'def']):
-                search_type = "section"
-            else:
-                search_type = "keyword"
+            search_type, query, plan = await self.run_blocking(self.plan_query, context, query)
+        if error := self.check_query(query, search_type, force):
+            return {"error": error}
         
-        # Execute search
-        if search_type == "regex":
-            results = self.search_regex(context, query)
-        elif search_type == "section":
-            results = self.search_semantic_sections(context, query)
-        else:
-            keywords = [kw.strip() for kw in query.split() if len(kw.strip()) > 2]
-            results = self.search_keyword(context, keywords)
+        with self.lock:
+            # Create query record (stored now so concurrent searches get distinct ids)
+            query_id = f"q_{len(self.queries)}_{self.generate_id(asked)[:6]}"
+            query_record = RecursiveQuery(
+                query_id=query_id,
+                parent_id=parent_query_id,
+                depth=depth,
+                query=asked,
+                context_id=context_id,
+                timestamp=datetime.now().isoformat()
+            )
+            self.queries[query_id] = query_record
         
-        # Limit results
-        results = results[:top_k]
+        budget = self.scan_budget()
+        results, rest = await self.run_blocking(
+            self.run_search, context, query, search_type, top_k, file_pattern, view, budget)
+        # A cached page may have more behind it; the cursor finds out on use
+        next_cursor = None
+        if rest or (rest is None and len(results) == top_k):
+            next_cursor = self.open_cursor(context, query_id, query, search_type, file_pattern,
+                                           view, top_k, len(results), rest, snippet_options)
         
-        # Calculate tokens used
-        tokens_used = sum(self.estimate_tokens(r.content) for r in results)
+        entries, tokens_used = self.format_results(results, query, search_type, snippet_options)
         query_record.tokens_used = tokens_used
         query_record.results = [asdict(r) for r in results]
         
-        # Store query
-        self.queries[query_id] = query_record
-        self.stats["total_queries"] += 1
-        self.stats["total_tokens_processed"] += tokens_used
-        self.stats["max_depth_reached"] = max(self.stats["max_depth_reached"], depth)
-        
-        # Link to parent
-        if parent_query_id and parent_query_id in self.queries:
-            self.queries[parent_query_id].sub_queries.append(query_id)
+        with self.lock:
+            self.stats["total_queries"] += 1
+            self.stats["total_tokens_processed"] += tokens_used
+            self.stats["max_depth_reached"] = max(self.stats["max_depth_reached"], depth)
+            
+            # Link to parent
+            if parent_query_id and parent_query_id in self.queries:
+                self.queries[parent_query_id].sub_queries.append(query_id)
         
-        return {
+        response = {
             "query_id": query_id,
             "search_type": search_type,
             "depth": depth,
             "result_count": len(results),
             "tokens_returned": tokens_used,
-            "results": [
-                {
-                    "chunk_id": r.chunk_id,
-                    "relevance": round(r.relevance_score, 3),
-                    "match_count": r.match_count,
-                    "content": r.content[:2000] + "..." if len(r.content) > 2000 else r.content,
-                    "position": {"start": r.start_char, "end": r.end_char}
-                }
-                for r in results
-            ],
+            "results": entries,
+            "next_cursor": next_cursor,
             "can_search_deeper": depth < self.max_depth,
             "hint": "Use 'rlm_search_recursive' on specific chunks to go deeper into relevant sections."
         }
+        if plan:
+            response["plan"] = plan
+        return self.note_timeout(response, budget)
+    
+    async def search_next(self, cursor: str, page_size: int = None) -> dict:
+        """
+        Return the next page of a search from its cursor.
+        
+        The remaining results are kept server-side, so nothing is scanned
+        again and no result is repeated. A cursor expires RLM_CURSOR_TTL
+        seconds after its last use, and when its context is reloaded,
+        appended to or cleared.
+        """
+        if page_size is not None and page_size < 1:
+            return {"error": "page_size must be >= 1."}
+        with self.lock:
+            self.expire_cursors()
+            state = self.cursors.get(cursor)
+            if state is not None:
+                self.cursors.move_to_end(cursor)
+        if state is None:
+            return {"error": "Unknown or expired cursor.",
+                    "suggestion": "Run rlm_search again to get a new cursor."}
+        
+        context = await self.run_blocking(self.get_context, state.context_id)
+        if context is None:
+            return {"error": "The cursor's context is no longer loaded."}
+        budget = self.scan_budget()
+        results = await self.run_blocking(
+            self.advance_cursor, context, state, page_size or state.page_size, budget)
+        
+        entries, tokens_used = self.format_results(results, state.query, state.search_type,
+                                                   state.snippets)
+        with self.lock:
+            if state.heap:
+                state.expires = time.monotonic() + self.cursor_ttl
+            else:
+                self.cursors.pop(cursor, None)
+            self.stats["total_tokens_processed"] += tokens_used
+            record = self.queries.get(state.query_id)
+            if record is not None:
+                record.tokens_used += tokens_used
+                record.results.extend(asdict(r) for r in results)
+        
+        return self.note_timeout({
+            "query_id": state.query_id,
+            "search_type": state.search_type,
+            "result_count": len(results),
+            "results_returned": state.returned,
+            "remaining": len(state.heap),
+            "tokens_returned": tokens_used,
+            "results": entries,
+            "next_cursor": cursor if state.heap else None
+        }, budget)
+    
+    async def search_all(self, query: str, context_ids: list[str] = None,
+                         search_type: str = "auto", top_k: int = 5,
+                         file_pattern: str = None, force: bool = False) -> dict:
+        """
+        Search every loaded context (or `context_ids`) in one call.
+        
+        The per-context searches run concurrently in the executor, each
+        returning its own top_k (cached as usual); the ranked lists are then
+        merged with a heap into a global top_k. Relevance scores are those
+        of each context, so BM25 scores reflect each context's own term
+        statistics.
+        """
+        if top_k < 1:
+            return {"error": "top_k must be >= 1."}
+        with self.lock:
+            if context_ids is None:
+                targets = list(self.contexts)
+            else:
+                targets = [cid for cid in dict.fromkeys(context_ids) if cid in self.contexts]
+        missing = [cid for cid in context_ids or [] if cid not in targets]
+        if not targets:
+            return {"error": "No matching contexts loaded.", "missing_contexts": missing}
+        search_type, query = self.resolve_search_type(query, search_type)
+        if error := self.check_query(query, search_type, force):
+            return {"error": error}
+        budgets = {cid: self.scan_budget() for cid in targets}
+        
+        def search_one(context_id: str) -> tuple[Optional[ContextStore], list[SearchResult]]:
+            context = self.get_context(context_id)
+            if context is None:  # cleared meanwhile
+                return None, []
+            return context, self.run_search(context, query, search_type, top_k, file_pattern,
+                                            budget=budgets[context_id])[0]
+        
+        searched = await asyncio.gather(*(self.run_blocking(search_one, cid) for cid in targets))
+        ranked = [
+            [(context, r) for r in results]
+            for context, results in searched if context is not None
+        ]
+        merged = list(itertools.islice(
+            heapq.merge(*ranked, key=lambda item: -item[1].relevance_score), top_k))
+        
+        tokens_used = sum(self.estimate_tokens(r.content) for _, r in merged)
+        with self.lock:
+            query_id = f"q_{len(self.queries)}_{self.generate_id(query)[:6]}"
+            self.queries[query_id] = RecursiveQuery(
+                query_id=query_id,
+                parent_id=None,
+                depth=0,
+                query=query,
+                context_id="*",
+                results=[asdict(r) for _, r in merged],
+                tokens_used=tokens_used,
+                timestamp=datetime.now().isoformat()
+            )
+            self.stats["total_queries"] += 1
+            self.stats["total_tokens_processed"] += tokens_used
+        
+        results = []
+        for context, r in merged:
+            entry = self.format_result(r)
+            entry["context_id"] = context.id
+            entry["context_name"] = context.name
+            results.append(entry)
+        response = {
+            "query_id": query_id,
+            "search_type": search_type,
+            "contexts_searched": len(ranked),
+            "result_count": len(results),
+            "tokens_returned": tokens_used,
+            "results": results,
+            "hint": "Pass a result's context_id to rlm_search_recursive to go deeper."
+        }
+        if missing:
+            response["missing_contexts"] = missing
+        timed_out = [cid for cid, budget in budgets.items() if budget and budget.timed_out]
+        if timed_out:
+            response["timed_out_contexts"] = timed_out
+        return self.note_timeout(response, *budgets.values())
+    
+    async def multi_search(self, patterns: list[str], context_id: str = None,
+                           case_sensitive: bool = False, max_hits: int = MULTI_HITS,
+                           file_pattern: str = None) -> dict:
+        """
+        Look up many literal strings at once (rlm_multi_search).
+        
+        The trigram index narrows each pattern to candidate chunks and their
+        union is decoded once for all of them (see scan_literals), so a batch
+        of synonyms or identifiers costs a fraction of separate searches.
+        Returns per-pattern counts, the chunks with the most hits and the
+        first `max_hits` hits with their line.
+        """
+        patterns = list(dict.fromkeys(p for p in patterns if p))
+        if not patterns:
+            return {"error": "Provide at least one non-empty pattern."}
+        if len(patterns) > MAX_MULTI_PATTERNS:
+            return {"error": f"At most {MAX_MULTI_PATTERNS} patterns per call."}
+        if max_hits < 1:
+            return {"error": "max_hits must be >= 1."}
+        context = await self.run_blocking(self.get_context, context_id)
+        if context is None:
+            return {"error": "No context loaded. Use rlm_load first."}
+        
+        entries, scanned = await self.run_blocking(
+            self.run_multi_search, context, patterns, case_sensitive, max_hits, file_pattern)
+        tokens_used = sum(self.estimate_tokens(hit["text"]) for e in entries for hit in e["hits"])
+        with self.lock:
+            self.stats["total_queries"] += 1
+            self.stats["total_tokens_processed"] += tokens_used
+        
+        return {
+            "context_id": context.id,
+            "pattern_count": len(patterns),
+            "chunks_scanned": scanned,
+            "tokens_returned": tokens_used,
+            "patterns": entries,
+            "not_found": [e["pattern"] for e in entries if not e["count"]]
+        }
+    
+    def run_multi_search(self, context: ContextStore, patterns: list[str], case_sensitive: bool,
+                         max_hits: int, file_pattern: Optional[str]) -> tuple[list[dict], int]:
+        """Scan for the patterns and shape one entry per pattern; also returns the chunks scanned."""
+        flags = 0 if case_sensitive else re.IGNORECASE
+        with context.lock:
+            self.hydrate(context)
+            candidates: Optional[set[int]] = set()
+            for pattern in patterns:
+                matched = self.regex_candidates(context, re.escape(pattern), flags)
+                if matched is None:
+                    candidates = None
+                    break
+                candidates |= matched
+            if file_pattern:
+                candidates = self.restrict(self.chunks_in_files(context, file_pattern), candidates)
+            found = self.scan_literals(context, patterns, case_sensitive, candidates)
+            
+            texts: dict[int, str] = {}
+            entries = []
+            for pattern, hits in zip(patterns, found):
+                ordered = sorted(hits.items(), key=lambda item: (-len(item[1]), item[0]))
+                listed = []
+                for chunk_id in sorted(hits):
+                    for position in hits[chunk_id]:
+                        if len(listed) == max_hits:
+                            break
+                        listed.append(self.describe_hit(context, chunk_id, position, texts))
+                entries.append({
+                    "pattern": pattern,
+                    "count": sum(len(positions) for positions in hits.values()),
+                    "chunk_count": len(hits),
+                    "top_chunks": [[chunk_id, len(positions)] for chunk_id, positions in ordered[:max_hits]],
+                    "hits": listed
+                })
+        scanned = len(context.chunks) if candidates is None else len(candidates)
+        return entries, scanned
+    
+    def describe_hit(self, context: ContextStore, chunk_id: int, position: int,
+                     texts: dict[int, str]) -> dict:
+        """A literal hit with its line number and (truncated) line text."""
+        chunk = context.chunks[chunk_id]
+        if chunk_id not in texts:
+            texts[chunk_id] = context.chunk_text(chunk)
+        text = texts[chunk_id]
+        offset = position - chunk["start_char"]
+        line_start = text.rfind("\n", 0, offset) + 1
+        line_end = text.find("\n", offset)
+        line = text[line_start:line_end if line_end >= 0 else len(text)]
+        hit = {"chunk_id": chunk_id, "position": position, "text": line[:200]}
+        # older records stored a character offset as start_line
+        if "end_line" in chunk:
+            hit["line"] = chunk["start_line"] + text.count("\n", 0, offset)
+        file_path = self.chunk_file(context, chunk)
+        if file_path:
+            hit["file"] = file_path
+        return hit
+    
+    @staticmethod
+    def classify_query(query: str) -> tuple[str, str]:
+        """
+        The shape of a query for `auto` and the text to look for:
+        "boolean", "regex", "section", "words" or "literal".
+        
+        Punctuation alone does not make a regex: `config.yaml`, `foo()`,
+        `[ERROR]` or `c++` are literals, and so is a pattern that only
+        escapes them (`foo\.bar` looks for "foo.bar"). Several words stay
+        words whatever their punctuation ("error: connection refused"),
+        unless they carry regex syntax that prose does not.
+        """
+        stripped = query.strip()
+        if boolean_structure(query):
+            return "boolean", query
+        literal = regex_literal(stripped)
+        if literal is not None and literal != stripped:
+            return "literal", literal
+        several = len(stripped.split()) > 1
+        if (STRONG_REGEX_SIGNAL if several else REGEX_SIGNAL).search(stripped):
+            try:
+                re.compile(stripped)
+                return "regex", query
+            except re.error:
+                if not several:
+                    return "literal", stripped
+        if SECTION_QUERY.fullmatch(stripped):
+            return "section", stripped
+        if several or WORDS_QUERY.fullmatch(stripped):
+            return "words", query
+        return "literal", stripped
+    
+    @classmethod
+    def resolve_search_type(cls, query: str, search_type: str) -> tuple[str, str]:
+        """
+        Strategy and query to run from the shape of the query alone; used
+        where no single context's statistics apply (rlm_search_all). Literal
+        strings run as escaped regexes.
+        """
+        if search_type != "auto":
+            return search_type, query
+        shape, text = cls.classify_query(query)
+        if shape == "literal":
+            return "regex", re.escape(text)
+        return {"words": "bm25"}.get(shape, shape), text
+    
+    def plan_query(self, context: ContextStore, query: str) -> tuple[str, str, dict]:
+        """
+        Choose the cheapest correct strategy for an `auto` search.
+        
+        The query's shape (classify_query) decides which strategies answer
+        it correctly; their costs are then estimated from the indexes (see
+        plan_options) and the cheapest runs. Returns (search_type, query to
+        run, plan) with the plan reported in the response.
+        """
+        shape, text = self.classify_query(query)
+        with context.lock:
+            self.hydrate(context)
+            options = self.plan_options(context, shape, text)
+        cost, search_type, run_query = min(options, key=itemgetter(0))
+        plan = {
+            "shape": shape,
+            "search_type": search_type,
+            "query": run_query,
+            "estimated_cost": round(cost),
+            "considered": {option[1]: round(option[0]) for option in options}
+        }
+        return search_type, run_query, plan
+    
+    def plan_options(self, context: ContextStore, shape: str,
+                     text: str) -> list[tuple[float, str, str]]:
+        """
+        (estimated cost, search_type, query) for each strategy that answers a
+        query of this shape (hold the context lock).
+        
+        Index-based strategies cost the posting entries they read. Scans
+        cost the chunks the trigram index cannot rule out, times their
+        size. A literal string can run as an escaped regex or, if keyword
+        search keeps it whole (one whitespace-free token of three or more
+        characters, unlike `$5` or `C#`), as a keyword: a word reads the
+        postings of the terms containing it, anything else checks the
+        substring on the trigram candidates. Words that are not indexed at
+        all fall back to a substring scan.
+        """
+        def postings(terms: Iterable[str]) -> int:
+            return sum(len(context.index.lookup(t)) for t in terms)
+        
+        if shape == "boolean":
+            try:
+                terms = self.query_terms(context, " ".join(boolean_terms(parse_boolean_query(text))))
+            except ValueError:
+                terms = []  # reported by check_query
+            return [(postings(terms) * PLAN_POSTING_COST, "boolean", text)]
+        if shape == "regex":
+            return [(self.scan_cost(context, text, re.IGNORECASE), "regex", text)]
+        if shape == "section":
+            pattern = self.section_regex(text)
+            return [(self.scan_cost(context, pattern, re.MULTILINE | re.IGNORECASE), "section", text)]
+        if shape == "words":
+            terms = self.query_terms(context, text)
+            if terms:
+                return [(postings(terms) * PLAN_POSTING_COST, "bm25", text)]
+            text = text.strip()
+        
+        escaped = re.escape(text)
+        options = [(self.scan_cost(context, escaped, re.IGNORECASE), "regex", escaped)]
+        if shape == "literal" and self.split_keywords(text) == [text.strip()]:
+            if tokenize(text) == [text.lower()]:
+                cost = (len(context.index.postings)
+                        + postings(context.index.containing(text.lower()))) * PLAN_POSTING_COST
+            else:
+                cost = options[0][0] / PLAN_SCAN_COST * PLAN_VERIFY_COST
+            options.append((cost, "keyword", text))
+        return options
+    
+    def scan_cost(self, context: ContextStore, pattern: str, flags: int) -> float:
+        """Estimated cost of a regex scan: candidate chunks times their size."""
+        query = regex_trigram_query(pattern, flags)
+        chunks = len(context.chunks)
+        if query is not None and context.trigrams is not None:
+            candidates = context.trigrams.candidates(query)
+            if candidates is not None:
+                chunks = len(candidates)
+        return chunks * self.chunk_kb(context) * PLAN_SCAN_COST
+    
+    @staticmethod
+    def chunk_kb(context: ContextStore) -> float:
+        """Average chunk size in KB."""
+        if not context.chunks:
+            return 0.0
+        return context.chunks[-1]["end"] / len(context.chunks) / 1000
+    
+    @staticmethod
+    def check_query(query: str, search_type: str, force: bool = False) -> Optional[str]:
+        """
+        An error message if a boolean query does not parse, or if a regex
+        (or section name, which is matched as one) nests quantifiers and
+        `force` is not set.
+        """
+        if search_type == "boolean":
+            try:
+                parse_boolean_query(query)
+            except ValueError as e:
+                return f"Invalid boolean query: {e}"
+        elif search_type in ("regex", "section") and not force and nested_quantifier(query):
+            return (f"Pattern {query!r} nests quantifiers, which can backtrack catastrophically. "
+                    "Rewrite it without the nesting, or pass force=true to run it within "
+                    "the regex time budget.")
+        return None
+    
+    def note_timeout(self, response: dict, *budgets: Optional[ScanBudget]) -> dict:
+        """Flag a response whose regex scans ran out of time (partial results)."""
+        if any(budget is not None and budget.timed_out for budget in budgets):
+            response["timed_out"] = True
+            response["warning"] = (f"Regex scanning stopped after {int(self.regex_timeout * 1000)} ms "
+                                   "(RLM_REGEX_TIMEOUT_MS); results are partial.")
+        return response
+    
+    @staticmethod
+    def split_keywords(query: str) -> list[str]:
+        return [kw.strip() for kw in query.split() if len(kw.strip()) > 2]
+    
+    @staticmethod
+    def normalize_query(query: str, search_type: str) -> str:
+        """
+        Canonical form of a query for cache keys. Word-based searches ignore
+        case and spacing; patterns are kept verbatim.
+        """
+        if search_type in ("bm25", "vector", "keyword"):
+            return " ".join(query.lower().split())
+        if search_type == "boolean":
+            return " ".join(query.split())
+        return query
+    
+    def run_search(self, context: ContextStore, query: str, search_type: str,
+                   top_k: int, file_pattern: Optional[str] = None,
+                   view: Optional[ContextView] = None,
+                   budget: Optional[ScanBudget] = None) -> tuple[list[SearchResult], Optional[list]]:
+        """
+        Execute one search strategy and materialise the top_k results, or
+        return them from the query cache.
+        
+        Returns (page, rest): `rest` is the heap of the results ranked below
+        the page (None on a cache hit), for a search cursor. Ranking heapifies
+        the matches and pops the page, so no full sort is done. Results of a
+        scan that ran out of `budget` are partial and not cached.
+        """
+        query = self.normalize_query(query, search_type)
+        key = (context.id, query, search_type, top_k, file_pattern, view and view.id)
+        with context.lock:
+            with self.lock:
+                cached = self.cache.get(key)
+            if cached is not None:
+                return cached, None
+            
+            self.hydrate(context)
+            ranked = self.rank_results(
+                self.collect_results(context, query, search_type, file_pattern, view, budget))
+            results = self.next_page(context, ranked, top_k)
+            
+            if budget is None or not budget.timed_out:
+                with self.lock:
+                    self.cache.put(key, results)
+            return results, ranked
+    
+    def collect_results(self, context: ContextStore, query: str, search_type: str,
+                        file_pattern: Optional[str] = None,
+                        view: Optional[ContextView] = None,
+                        budget: Optional[ScanBudget] = None) -> list[SearchResult]:
+        """
+        All matches of one search strategy, unranked (hold the context lock).
+        
+        With a view, regex and section scans only cover the view's chunks;
+        index-based searches are ranked over the whole context (its term
+        statistics) and filtered to them. Regex and section scans are
+        bounded by `budget`.
+        """
+        chunk_ids = view.chunk_ids if view else None
+        if search_type == "regex":
+            results = self.search_regex(context, query, chunk_ids=chunk_ids, budget=budget)
+        elif search_type == "section":
+            results = self.search_semantic_sections(context, query, chunk_ids=chunk_ids,
+                                                    budget=budget)
+        elif search_type == "bm25":
+            results = self.search_bm25(context, query)
+        elif search_type in ("vector", "boolean"):
+            allowed = self.chunks_in_files(context, file_pattern) if file_pattern else None
+            search = self.search_vector if search_type == "vector" else self.search_boolean
+            results = search(context, query, self.restrict(allowed, chunk_ids))
+        else:
+            results = self.search_keyword(context, self.split_keywords(query))
+        
+        if file_pattern:
+            allowed = self.chunks_in_files(context, file_pattern)
+            results = [r for r in results if r.chunk_id in allowed]
+        if chunk_ids is not None:
+            results = [r for r in results if r.chunk_id in chunk_ids]
+        return results
+    
+    @staticmethod
+    def rank_results(results: list[SearchResult]) -> list:
+        """Heap of (rank key, result); keys are unique since chunk ids are."""
+        ranked = [(rank_key(r), r) for r in results]
+        heapq.heapify(ranked)
+        return ranked
+    
+    def next_page(self, context: ContextStore, ranked: list, count: int) -> list[SearchResult]:
+        """
+        Pop the next `count` results off a ranked heap and materialise their
+        text and file (hold the context lock: they are formatted without it).
+        """
+        page = [heapq.heappop(ranked)[1] for _ in range(min(count, len(ranked)))]
+        for r in page:
+            chunk = context.chunks[r.chunk_id]
+            r.content = context.chunk_text(chunk)
+            r.file = self.chunk_file(context, chunk)
+        return page
+    
+    def open_cursor(self, context: ContextStore, query_id: str, query: str,
+                    search_type: str, file_pattern: Optional[str],
+                    view: Optional[ContextView], page_size: int, returned: int,
+                    heap: Optional[list], snippets: Optional[tuple[int, int]] = None) -> str:
+        """Keep the rest of a search for rlm_search_next; returns the cursor id."""
+        cursor = SearchCursor(
+            id=f"c_{uuid.uuid4().hex[:12]}",
+            context_id=context.id,
+            query_id=query_id,
+            query=query,
+            search_type=search_type,
+            file_pattern=file_pattern,
+            view=view,
+            page_size=page_size,
+            returned=returned,
+            heap=heap,
+            expires=time.monotonic() + self.cursor_ttl,
+            snippets=snippets
+        )
+        with self.lock:
+            self.expire_cursors()
+            self.cursors[cursor.id] = cursor
+            while len(self.cursors) > MAX_CURSORS:
+                self.cursors.popitem(last=False)
+        return cursor.id
+    
+    def expire_cursors(self):
+        """Drop cursors idle for longer than the TTL (hold `lock`)."""
+        now = time.monotonic()
+        for cursor_id in [c.id for c in self.cursors.values() if c.expires <= now]:
+            del self.cursors[cursor_id]
+    
+    def advance_cursor(self, context: ContextStore, cursor: SearchCursor, count: int,
+                       budget: Optional[ScanBudget] = None) -> list[SearchResult]:
+        """Take the next page of a cursor, re-running its search if it has no heap yet."""
+        with context.lock:
+            self.hydrate(context)
+            if cursor.heap is None:
+                cursor.heap = self.rank_results(self.collect_results(
+                    context, self.normalize_query(cursor.query, cursor.search_type),
+                    cursor.search_type, cursor.file_pattern, cursor.view, budget))
+                for _ in range(min(cursor.returned, len(cursor.heap))):
+                    heapq.heappop(cursor.heap)
+            page = self.next_page(context, cursor.heap, count)
+            cursor.returned += len(page)
+            return page
+    
+    def format_results(self, results: list[SearchResult], query: str, search_type: str,
+                       snippets: Optional[tuple[int, int]] = None) -> tuple[list[dict], int]:
+        """
+        Shape a page of results; returns the entries and their token estimate.
+        
+        In snippet mode (`snippets` = (radius, token budget)) each entry has
+        `snippets` instead of `content`. Regex and section results are cut
+        around their match offsets, keyword and BM25 results around the
+        query terms found in the chunk.
+        """
+        if snippets is None:
+            return ([self.format_result(r) for r in results],
+                    sum(self.estimate_tokens(r.content) for r in results))
+        
+        radius, budget = snippets
+        pattern = None if search_type in ("regex", "section") else self.highlight_pattern(query, search_type)
+        entries = []
+        tokens_used = 0
+        for r in results:
+            entry = self.format_result(r)
+            del entry["content"]
+            if r.matches:
+                spans = [(start - r.start_char, end - r.start_char) for start, end in r.matches]
+            elif pattern is not None:
+                spans = [m.span() for m in pattern.finditer(r.content)]
+            else:
+                spans = []
+            cut, truncated = build_snippets(r.content, r.start_char, spans or [(0, 0)],
+                                            radius, budget * 4)
+            entry["snippets"] = cut
+            if truncated:
+                entry["snippets_truncated"] = True
+            tokens_used += sum(self.estimate_tokens(s["text"]) for s in cut)
+            entries.append(entry)
+        return entries, tokens_used
+    
+    def highlight_pattern(self, query: str, search_type: str) -> Optional[re.Pattern]:
+        """
+        A pattern for the query's words in a chunk, as the keyword (any
+        substring) and BM25 (term prefix) searches match them.
+        """
+        if search_type == "keyword":
+            words = [re.escape(kw) for kw in self.split_keywords(query)]
+        else:
+            if search_type == "boolean":
+                query = " ".join(boolean_terms(parse_boolean_query(query)))
+            words = [r"\b" + re.escape(term) + r"\w*" for term in dict.fromkeys(tokenize(query))]
+        if not words:
+            return None
+        return re.compile("|".join(sorted(words, key=len, reverse=True)), re.IGNORECASE)
+    
+    def format_result(self, r: SearchResult) -> dict:
+        """
+        Shape a search result for the tool response. Only the result is read,
+        never the context: a concurrent spill may drop its chunks meanwhile.
+        """
+        entry = {
+            "chunk_id": r.chunk_id,
+            "relevance": round(r.relevance_score, 3),
+            "match_count": r.match_count,
+            "content": r.content[:2000] + "..." if len(r.content) > 2000 else r.content,
+            "position": {"start": r.start_char, "end": r.end_char}
+        }
+        if r.matches:
+            entry["matches"] = [list(m) for m in r.matches[:MAX_RESULT_MATCHES]]
+        if r.file:
+            entry["file"] = r.file
+        return entry
     
     async def search_recursive(self, query: str, chunk_ids: list[int],
                               context_id: str = None, 
-                              parent_query_id: str = None) -> dict:
+                              parent_query_id: str = None,
+                              force: bool = False) -> dict:
         """
         Perform recursive sub-search on specific chunks.
         
         This is the key RLM innovation: the model can recursively dive into
         sections it found relevant, searching deeper for specific information.
+        The selection is searched in place as a ContextView; result chunk ids
+        refer to the parent context.
         """
-        context_id = context_id or self.active_session
-        if not context_id or context_id not in self.contexts:
+        context = await self.run_blocking(self.get_context, context_id)
+        if context is None:
             return {"error": "No context loaded."}
         
-        context = self.contexts[context_id]
-        
-        # Get the specified chunks
-        selected_chunks = [c for c in context.chunks if c["id"] in chunk_ids]
-        if not selected_chunks:
+        view, view_tokens = await self.run_blocking(self.select_view, context, chunk_ids)
+        if view is None:
             return {"error": "No valid chunks found with given IDs."}
         
-        # Combine chunks into a sub-context
-        combined_content = '\n\n---CHUNK_BOUNDARY---\n\n'.join(
-            c["content"] for c in selected_chunks
-        )
-        
-        # Create temporary sub-context
-        sub_context_id = f"sub_{context_id}_{self.generate_id(combined_content)[:6]}"
-        sub_chunks = self.chunk_content(combined_content)
-        
-        sub_context = ContextStore(
-            id=sub_context_id,
-            name=f"sub-context of {context.name}",
-            content=combined_content,
-            token_estimate=self.estimate_tokens(combined_content),
-            created_at=datetime.now().isoformat(),
-            metadata={"parent_context": context_id, "source_chunks": chunk_ids},
-            chunks=sub_chunks
-        )
-        
-        self.contexts[sub_context_id] = sub_context
-        
-        # Perform search on sub-context
+        # Perform search on the selected chunks
         result = await self.search_context(
             query=query,
-            context_id=sub_context_id,
-            parent_query_id=parent_query_id
+            context_id=context.id,
+            parent_query_id=parent_query_id,
+            view=view,
+            force=force
         )
         
         result["recursive_info"] = {
-            "source_chunks": chunk_ids,
-            "sub_context_tokens": sub_context.token_estimate,
+            "source_chunks": sorted(view.chunk_ids),
+            "view_id": view.id,
+            "sub_context_tokens": view_tokens,
             "is_recursive": True
         }
         
         return result
     
+    def select_view(self, context: ContextStore,
+                    chunk_ids: list[int]) -> tuple[Optional[ContextView], int]:
+        """
+        The memoized view over the valid ids in `chunk_ids` (None if there
+        are none) and the tokens it covers.
+        """
+        with context.lock:
+            self.hydrate(context)
+            selected = frozenset(c for c in chunk_ids
+                                 if isinstance(c, int) and 0 <= c < len(context.chunks))
+            tokens = sum(context.chunks[c]["tokens"] for c in selected)
+        if not selected:
+            return None, 0
+        
+        key = (context.id, selected)
+        with self.lock:
+            view = self.views.get(key)
+            if view is None:
+                digest = hashlib.sha256(",".join(map(str, sorted(selected))).encode()).hexdigest()
+                view = self.views[key] = ContextView(
+                    id=f"sub_{context.id}_{digest[:6]}",
+                    context_id=context.id,
+                    chunk_ids=selected
+                )
+                while len(self.views) > MAX_VIEWS:
+                    self.views.popitem(last=False)
+            else:
+                self.views.move_to_end(key)
+            return view, tokens
+    
     async def get_chunk(self, chunk_id: int, context_id: str = None,
                        with_context: bool = True) -> dict:
         """
@@ -485,135 +4029,243 @@ class RLMServer:
         
         Useful for examining specific sections found during search.
         """
-        context_id = context_id or self.active_session
-        if not context_id or context_id not in self.contexts:
+        context = await self.run_blocking(self.get_context, context_id)
+        if context is None:
             return {"error": "No context loaded."}
-        
-        context = self.contexts[context_id]
-        
-        if chunk_id < 0 or chunk_id >= len(context.chunks):
-            return {"error": f"Invalid chunk ID. Valid range: 0-{len(context.chunks)-1}"}
-        
-        chunk = context.chunks[chunk_id]
-        
-        result = {
-            "chunk_id": chunk_id,
-            "content": chunk["content"],
-            "tokens": chunk["tokens"],
-            "position": {
-                "start_char": chunk["start_char"],
-                "end_char": chunk["end_char"]
+        return await self.run_blocking(self.read_chunk, context, chunk_id, with_context)
+    
+    def read_chunk(self, context: ContextStore, chunk_id: int, with_context: bool) -> dict:
+        """The body of get_chunk, run in the executor under the context lock."""
+        with context.lock:
+            self.hydrate(context)
+            if chunk_id < 0 or chunk_id >= len(context.chunks):
+                return {"error": f"Invalid chunk ID. Valid range: 0-{len(context.chunks)-1}"}
+            
+            chunk = context.chunks[chunk_id]
+            
+            result = {
+                "chunk_id": chunk_id,
+                "content": context.chunk_text(chunk),
+                "tokens": chunk["tokens"],
+                "position": {
+                    "start_char": chunk["start_char"],
+                    "end_char": chunk["end_char"]
+                }
             }
-        }
-        
-        if with_context:
-            if chunk_id > 0:
-                result["previous_chunk_preview"] = context.chunks[chunk_id - 1]["content"][-500:]
-            if chunk_id < len(context.chunks) - 1:
-                result["next_chunk_preview"] = context.chunks[chunk_id + 1]["content"][:500]
-        
-        return result
+            file_path = self.chunk_file(context, chunk)
+            if file_path:
+                result["file"] = file_path
+            
+            if with_context:
+                if chunk_id > 0:
+                    result["previous_chunk_preview"] = context.chunk_text(context.chunks[chunk_id - 1])[-500:]
+                if chunk_id < len(context.chunks) - 1:
+                    result["next_chunk_preview"] = context.chunk_text(context.chunks[chunk_id + 1])[:500]
+            
+            return result
     
     async def list_contexts(self) -> dict:
         """List all loaded contexts."""
-        return {
-            "contexts": [
-                {
-                    "id": ctx.id,
-                    "name": ctx.name,
-                    "tokens": ctx.token_estimate,
-                    "chunks": len(ctx.chunks),
-                    "created_at": ctx.created_at
-                }
-                for ctx in self.contexts.values()
-            ],
-            "active_session": self.active_session,
-            "stats": self.stats
-        }
+        with self.lock:
+            return {
+                "contexts": [
+                    {
+                        "id": ctx.id,
+                        "name": ctx.name,
+                        "tokens": ctx.token_estimate,
+                        "chunks": ctx.chunk_count,
+                        "created_at": ctx.created_at,
+                        "loaded": ctx.loaded
+                    }
+                    for ctx in self.contexts.values()
+                ],
+                "active_session": self.active_session,
+                "stats": dict(self.stats)
+            }
     
-    async def get_outline(self, context_id: str = None, max_depth: int = 3) -> dict:
+    async def get_outline(self, context_id: str = None, max_depth: int = 3,
+                          offset: int = 0, limit: int = OUTLINE_PAGE_SIZE,
+                          parent_id: int = None, types: list[str] = None) -> dict:
         """
         Generate a structural outline of the context.
         
-        Identifies headers, sections, and logical divisions to help
-        navigate large documents.
+        Served from the heading index built at load time, so calls do not
+        rescan content. Entries are numbered in document order; `parent_id`
+        restricts the outline to one entry's subtree and `offset`/`limit`
+        page through long outlines.
         """
-        context_id = context_id or self.active_session
-        if not context_id or context_id not in self.contexts:
+        context = await self.run_blocking(self.get_context, context_id)
+        if context is None:
             return {"error": "No context loaded."}
+        if limit < 1:
+            return {"error": "limit must be >= 1."}
         
-        context = self.contexts[context_id]
+        outline = await self.run_blocking(self.load_outline, context)
+        if parent_id is not None and not 0 <= parent_id < len(outline.entries):
+            return {"error": f"Invalid parent_id. Valid range: 0-{len(outline.entries) - 1}"}
         
-        # Extract structure indicators
-        outline = []
-        header_patterns = [
-            (r'^#{1,6}\s+(.+)$', 'markdown'),
-            (r'^(Chapter|Section|Part)\s+(\d+):?\s*(.+)$', 'book'),
-            (r'^(def|class|async def)\s+(\w+)', 'code'),
-            (r'^<h[1-6][^>]*>(.+)</h[1-6]>', 'html'),
+        scope = range(len(outline.entries)) if parent_id is None else outline.subtree(parent_id)
+        selected = [
+            i for i in scope
+            if outline.entries[i][1] <= max_depth and (not types or outline.entries[i][2] in types)
         ]
-        
-        for chunk in context.chunks:
-            for pattern, pattern_type in header_patterns:
-                matches = re.finditer(pattern, chunk["content"], re.MULTILINE)
-                for match in matches:
-                    level = 1
-                    if pattern_type == 'markdown':
-                        level = len(match.group(0).split()[0])
-                    
-                    if level <= max_depth:
-                        outline.append({
-                            "title": match.group(1)[:100] if match.groups() else match.group(0)[:100],
-                            "type": pattern_type,
-                            "level": level,
-                            "chunk_id": chunk["id"],
-                            "position": chunk["start_char"] + match.start()
-                        })
+        offset = max(offset, 0)
+        page = selected[offset:offset + limit]
+        next_offset = offset + len(page)
         
         return {
-            "context_id": context_id,
+            "context_id": context.id,
             "context_name": context.name,
             "total_tokens": context.token_estimate,
-            "outline_items": len(outline),
-            "outline": outline[:100]  # Limit for response size
+            "outline_items": len(selected),
+            "offset": offset,
+            "next_offset": next_offset if next_offset < len(selected) else None,
+            "outline": [self.format_outline_entry(context, outline, i) for i in page]
+        }
+    
+    def load_outline(self, context: ContextStore) -> Outline:
+        with context.lock:
+            self.hydrate(context)
+            return self.context_outline(context)
+    
+    def format_outline_entry(self, context: ContextStore, outline: Outline, i: int) -> dict:
+        position, level, kind, title, chunk_id, file_id = outline.entries[i]
+        entry = {
+            "id": i,
+            "parent": outline.parents[i],
+            "title": title,
+            "type": kind,
+            "level": level,
+            "chunk_id": chunk_id,
+            "position": position
         }
+        if file_id is not None:
+            entry["file"] = context.metadata["files"][file_id]["path"]
+        return entry
     
     async def get_statistics(self) -> dict:
         """Get RLM session statistics."""
-        query_depths = defaultdict(int)
-        for q in self.queries.values():
-            query_depths[q.depth] += 1
+        with self.lock:
+            query_depths = defaultdict(int)
+            for q in self.queries.values():
+                query_depths[q.depth] += 1
+            contexts = list(self.contexts.values())
+            stats = dict(self.stats)
+            cache = self.cache.stats()
+        
+        resident = [c for c in contexts if c.loaded]
+        spilled = [c for c in contexts if not c.loaded]
         
         return {
-            "session_stats": self.stats,
+            "session_stats": stats,
+            "query_cache": cache,
+            "memory": {
+                "budget_bytes": self.max_memory or None,
+                "resident_contexts": len(resident),
+                "resident_bytes": sum(c.resident_bytes for c in resident),
+                "spilled_contexts": len(spilled),
+                "spilled_bytes": sum(self.stored_bytes(c.id) for c in spilled)
+            },
             "query_depth_distribution": dict(query_depths),
-            "active_contexts": len(self.contexts),
-            "total_tokens_in_memory": sum(c.token_estimate for c in self.contexts.values()),
+            "active_contexts": len(contexts),
+            "total_tokens_in_memory": sum(c.token_estimate for c in contexts),
             "configuration": {
                 "max_depth": self.max_depth,
                 "chunk_size": self.chunk_size,
-                "overlap": self.overlap
+                "overlap": self.overlap,
+                "chunk_strategy": self.chunk_strategy,
+                "vector_backend": "numpy" if NUMPY_AVAILABLE else "python",
+                "lsa_dims": self.lsa_dims if NUMPY_AVAILABLE and SCIPY_AVAILABLE else 0,
+                "regex_timeout_ms": int(self.regex_timeout * 1000)
             }
         }
     
+    def stored_bytes(self, context_id: str) -> int:
+        """Size of a context's content and chunk records on disk."""
+        size = 0
+        for suffix in (".txt", ".chunks.jsonl"):
+            try:
+                size += (self.data_dir / f"{context_id}{suffix}").stat().st_size
+            except OSError:
+                pass
+        return size
+    
+    def delete_persisted(self, context_id: str):
+        """Remove a context's files from the data directory."""
+        for suffix in (".json", ".txt", ".chunks.jsonl", ".outline.json", ".tail.json"):
+            (self.data_dir / f"{context_id}{suffix}").unlink(missing_ok=True)
+    
     async def clear_context(self, context_id: str = None) -> dict:
-        """Clear a specific context or all contexts."""
-        if context_id:
-            if context_id in self.contexts:
-                del self.contexts[context_id]
+        """
+        Clear a specific context or all contexts.
+        
+        Persisted files are removed as well, otherwise cleared contexts would
+        be restored on the next server start.
+        """
+        with self.lock:
+            if context_id:
+                if context_id not in self.contexts:
+                    return {"error": "Context not found."}
+                cleared = [self.contexts.pop(context_id)]
+                self.forget_context(context_id)
                 if self.active_session == context_id:
                     self.active_session = None
-                return {"success": True, "cleared": context_id}
-            return {"error": "Context not found."}
-        else:
-            count = len(self.contexts)
-            self.contexts.clear()
-            self.active_session = None
-            return {"success": True, "cleared_count": count}
+            else:
+                cleared = list(self.contexts.values())
+                self.contexts.clear()
+                for context in cleared:
+                    self.forget_context(context.id)
+                self.active_session = None
+        
+        await self.run_blocking(self.release_contexts, cleared)
+        if context_id:
+            return {"success": True, "cleared": context_id}
+        return {"success": True, "cleared_count": len(cleared)}
+    
+    def release_contexts(self, contexts: list[ContextStore]):
+        """Close cleared contexts (waiting for searches using them) and delete their files."""
+        for context in contexts:
+            with context.lock:
+                context.close()
+            self.delete_persisted(context.id)
 
 
 # === MCP Protocol Implementation ===
 
+def json_size(value: Any, limit: int) -> int:
+    """Rough JSON size of a value (string lengths, item counts), counted until it exceeds `limit`."""
+    size = 0
+    stack = [value]
+    while stack and size <= limit:
+        item = stack.pop()
+        if isinstance(item, str):
+            size += len(item) + 2
+        elif isinstance(item, dict):
+            size += len(item)
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            size += len(item)
+            stack.extend(item)
+        else:
+            size += 8
+    return size
+
+
+async def decode_request(server: RLMServer, line: bytes) -> dict:
+    """Parse a JSON-RPC line, in the executor when it is large."""
+    if len(line) > OFFLOAD_JSON_BYTES:
+        return await server.run_blocking(json.loads, line)
+    return json.loads(line)
+
+
+async def encode_json(server: RLMServer, value: Any, **options) -> str:
+    """json.dumps, in the executor when the value is large."""
+    if json_size(value, OFFLOAD_JSON_BYTES) > OFFLOAD_JSON_BYTES:
+        return await server.run_blocking(json.dumps, value, **options)
+    return json.dumps(value, **options)
+
+
 async def handle_request(server: RLMServer, request: dict) -> dict:
     """Handle incoming MCP requests."""
     method = request.get("method", "")
@@ -651,26 +4303,123 @@ async def handle_request(server: RLMServer, request: dict) -> dict:
                                 "properties": {
                                     "content": {"type": "string", "description": "The full content to load (can be millions of tokens)"},
                                     "name": {"type": "string", "description": "Name for this context", "default": "default"},
-                                    "metadata": {"type": "object", "description": "Optional metadata about the content"}
+                                    "metadata": {"type": "object", "description": "Optional metadata about the content"},
+                                    "chunk_size": {"type": "integer", "description": "Target chunk size in characters (defaults to RLM_CHUNK_SIZE)"},
+                                    "strategy": {"type": "string", "enum": ["auto", "lines", "prose", "code", "cdc"], "description": "Chunk boundaries: 'prose' breaks at headings/paragraphs, 'code' at top-level definitions, 'lines' anywhere, 'cdc' content-defined (cheap reloads of edited versions); 'auto' picks by file extension", "default": "auto"},
+                                    "keep_previous": {"type": "boolean", "description": "Keep the context previously loaded under this name instead of replacing it", "default": False}
                                 },
                                 "required": ["content"]
                             }
                         },
+                        {
+                            "name": "rlm_load_file",
+                            "description": "Load a file from disk into RLM storage. The file is streamed and chunked/indexed on the fly, so large files never pass through the tool call.",
+                            "inputSchema": {
+                                "type": "object",
+                                "properties": {
+                                    "path": {"type": "string", "description": "Path of the file to load"},
+                                    "name": {"type": "string", "description": "Name for this context (defaults to the file name)"},
+                                    "metadata": {"type": "object", "description": "Optional metadata about the content"},
+                                    "chunk_size": {"type": "integer", "description": "Target chunk size in characters (defaults to RLM_CHUNK_SIZE)"},
+                                    "strategy": {"type": "string", "enum": ["auto", "lines", "prose", "code", "cdc"], "description": "Chunk boundaries: 'prose' breaks at headings/paragraphs, 'code' at top-level definitions, 'lines' anywhere, 'cdc' content-defined (cheap reloads of edited versions); 'auto' picks by file extension", "default": "auto"},
+                                    "keep_previous": {"type": "boolean", "description": "Keep the context previously loaded under this name instead of replacing it", "default": False}
+                                },
+                                "required": ["path"]
+                            }
+                        },
+                        {
+                            "name": "rlm_load_directory",
+                            "description": "Load all text files under a directory (filtered by glob patterns) into one RLM context. Files are streamed from disk; each chunk keeps its source file so searches can be filtered by file.",
+                            "inputSchema": {
+                                "type": "object",
+                                "properties": {
+                                    "path": {"type": "string", "description": "Directory to load"},
+                                    "patterns": {"type": "array", "items": {"type": "string"}, "description": "Glob patterns relative to the directory", "default": ["**/*"]},
+                                    "exclude": {"type": "array", "items": {"type": "string"}, "description": "Glob patterns of relative paths to skip"},
+                                    "name": {"type": "string", "description": "Name for this context (defaults to the directory name)"},
+                                    "metadata": {"type": "object", "description": "Optional metadata about the content"},
+                                    "chunk_size": {"type": "integer", "description": "Target chunk size in characters (defaults to RLM_CHUNK_SIZE)"},
+                                    "strategy": {"type": "string", "enum": ["auto", "lines", "prose", "code", "cdc"], "description": "Chunk boundaries: 'prose' breaks at headings/paragraphs, 'code' at top-level definitions, 'lines' anywhere, 'cdc' content-defined (cheap reloads of edited versions); 'auto' picks by file extension", "default": "auto"},
+                                    "keep_previous": {"type": "boolean", "description": "Keep the context previously loaded under this name instead of replacing it", "default": False}
+                                },
+                                "required": ["path"]
+                            }
+                        },
+                        {
+                            "name": "rlm_append",
+                            "description": "Append text (or a file's content) to an existing context, e.g. a growing log. Only the tail is re-chunked and re-indexed.",
+                            "inputSchema": {
+                                "type": "object",
+                                "properties": {
+                                    "content": {"type": "string", "description": "Text to append"},
+                                    "path": {"type": "string", "description": "File whose content to append (instead of content)"},
+                                    "context_id": {"type": "string", "description": "Context to extend (uses active session if not specified)"}
+                                }
+                            }
+                        },
                         {
                             "name": "rlm_search",
-                            "description": "Search through loaded context. Supports regex, keyword, and semantic section search. Returns relevant chunks without loading entire context into model.",
+                            "description": "Search through loaded context. Supports BM25-ranked, TF-IDF vector, boolean (AND/OR/NOT, quoted phrases, NEAR/n, file:/ext: filters), regex, keyword, and semantic section search. Returns relevant chunks without loading entire context into model.",
                             "inputSchema": {
                                 "type": "object",
                                 "properties": {
                                     "query": {"type": "string", "description": "Search query (keywords, regex pattern, or section name)"},
                                     "context_id": {"type": "string", "description": "Context to search (uses active session if not specified)"},
-                                    "search_type": {"type": "string", "enum": ["auto", "regex", "keyword", "section"], "default": "auto"},
+                                    "search_type": {"type": "string", "enum": ["auto", "bm25", "vector", "boolean", "regex", "keyword", "section"], "default": "auto"},
                                     "top_k": {"type": "integer", "description": "Number of results to return", "default": 5},
-                                    "parent_query_id": {"type": "string", "description": "ID of parent query for recursive searching"}
+                                    "parent_query_id": {"type": "string", "description": "ID of parent query for recursive searching"},
+                                    "file_pattern": {"type": "string", "description": "Only return chunks from files matching this glob (file/directory loads)"},
+                                    "snippets": {"type": "boolean", "description": "Return windows around each match (with highlight offsets) instead of whole chunks", "default": False},
+                                    "snippet_radius": {"type": "integer", "description": "Characters shown on each side of a match in snippet mode", "default": SNIPPET_RADIUS},
+                                    "snippet_tokens": {"type": "integer", "description": "Token budget for the snippets of one result", "default": SNIPPET_TOKENS},
+                                    "force": {"type": "boolean", "description": "Run a regex with nested quantifiers (normally refused as catastrophic-backtracking prone); it still stops at the time budget", "default": False}
+                                },
+                                "required": ["query"]
+                            }
+                        },
+                        {
+                            "name": "rlm_search_next",
+                            "description": "Get the next page of an rlm_search from its next_cursor, without re-running the search or repeating results.",
+                            "inputSchema": {
+                                "type": "object",
+                                "properties": {
+                                    "cursor": {"type": "string", "description": "next_cursor returned by rlm_search (or a previous rlm_search_next)"},
+                                    "page_size": {"type": "integer", "description": "Results in this page (defaults to the original top_k)"}
+                                },
+                                "required": ["cursor"]
+                            }
+                        },
+                        {
+                            "name": "rlm_search_all",
+                            "description": "Search all loaded contexts (or a subset) concurrently in one call. Per-context results are merged into one global top-k; each result carries its context_id.",
+                            "inputSchema": {
+                                "type": "object",
+                                "properties": {
+                                    "query": {"type": "string", "description": "Search query (keywords, regex pattern, or section name)"},
+                                    "context_ids": {"type": "array", "items": {"type": "string"}, "description": "Contexts to search (all loaded contexts if not specified)"},
+                                    "search_type": {"type": "string", "enum": ["auto", "bm25", "vector", "boolean", "regex", "keyword", "section"], "default": "auto"},
+                                    "top_k": {"type": "integer", "description": "Number of results to return across all contexts", "default": 5},
+                                    "file_pattern": {"type": "string", "description": "Only return chunks from files matching this glob (file/directory loads)"},
+                                    "force": {"type": "boolean", "description": "Run a regex with nested quantifiers (normally refused as catastrophic-backtracking prone); it still stops at the time budget", "default": False}
                                 },
                                 "required": ["query"]
                             }
                         },
+                        {
+                            "name": "rlm_multi_search",
+                            "description": "Look up many literal strings (synonyms, identifiers, error codes) in one pass over a context. Returns per-pattern hit counts, the chunks with the most hits and the first hits with their line.",
+                            "inputSchema": {
+                                "type": "object",
+                                "properties": {
+                                    "patterns": {"type": "array", "items": {"type": "string"}, "description": f"Literal strings to find (at most {MAX_MULTI_PATTERNS})"},
+                                    "context_id": {"type": "string", "description": "Context ID (uses active context if not specified)"},
+                                    "case_sensitive": {"type": "boolean", "description": "Match case exactly", "default": False},
+                                    "max_hits": {"type": "integer", "description": "Hits and top chunks listed per pattern", "default": MULTI_HITS},
+                                    "file_pattern": {"type": "string", "description": "Only search chunks from files matching this glob (file/directory loads)"}
+                                },
+                                "required": ["patterns"]
+                            }
+                        },
                         {
                             "name": "rlm_search_recursive",
                             "description": "Perform recursive sub-search on specific chunks. This is the key RLM feature - dive deeper into relevant sections found in initial search.",
@@ -680,7 +4429,8 @@ async def handle_request(server: RLMServer, request: dict) -> dict:
                                     "query": {"type": "string", "description": "What to search for within the selected chunks"},
                                     "chunk_ids": {"type": "array", "items": {"type": "integer"}, "description": "IDs of chunks to search within"},
                                     "context_id": {"type": "string", "description": "Context ID"},
-                                    "parent_query_id": {"type": "string", "description": "ID of the search that found these chunks"}
+                                    "parent_query_id": {"type": "string", "description": "ID of the search that found these chunks"},
+                                    "force": {"type": "boolean", "description": "Run a regex with nested quantifiers (normally refused as catastrophic-backtracking prone); it still stops at the time budget", "default": False}
                                 },
                                 "required": ["query", "chunk_ids"]
                             }
@@ -705,7 +4455,11 @@ async def handle_request(server: RLMServer, request: dict) -> dict:
                                 "type": "object",
                                 "properties": {
                                     "context_id": {"type": "string", "description": "Context ID"},
-                                    "max_depth": {"type": "integer", "description": "Maximum heading depth to include", "default": 3}
+                                    "max_depth": {"type": "integer", "description": "Maximum heading depth to include", "default": 3},
+                                    "offset": {"type": "integer", "description": "Skip this many outline entries (paging)", "default": 0},
+                                    "limit": {"type": "integer", "description": "Maximum entries to return", "default": OUTLINE_PAGE_SIZE},
+                                    "parent_id": {"type": "integer", "description": "Only return the subtree under this outline entry id"},
+                                    "types": {"type": "array", "items": {"type": "string", "enum": ["markdown", "book", "code", "html"]}, "description": "Only include these heading types"}
                                 }
                             }
                         },
@@ -721,7 +4475,7 @@ async def handle_request(server: RLMServer, request: dict) -> dict:
                         },
                         {
                             "name": "rlm_clear",
-                            "description": "Clear loaded contexts to free memory.",
+                            "description": "Clear loaded contexts to free memory. Also deletes their persisted copies so they are not restored on restart.",
                             "inputSchema": {
                                 "type": "object",
                                 "properties": {
@@ -739,8 +4493,20 @@ async def handle_request(server: RLMServer, request: dict) -> dict:
             
             if tool_name == "rlm_load":
                 result = await server.load_context(**tool_args)
+            elif tool_name == "rlm_load_file":
+                result = await server.load_file(**tool_args)
+            elif tool_name == "rlm_load_directory":
+                result = await server.load_directory(**tool_args)
+            elif tool_name == "rlm_append":
+                result = await server.append_context(**tool_args)
             elif tool_name == "rlm_search":
                 result = await server.search_context(**tool_args)
+            elif tool_name == "rlm_search_next":
+                result = await server.search_next(**tool_args)
+            elif tool_name == "rlm_search_all":
+                result = await server.search_all(**tool_args)
+            elif tool_name == "rlm_multi_search":
+                result = await server.multi_search(**tool_args)
             elif tool_name == "rlm_search_recursive":
                 result = await server.search_recursive(**tool_args)
             elif tool_name == "rlm_get_chunk":
@@ -760,7 +4526,7 @@ async def handle_request(server: RLMServer, request: dict) -> dict:
                 "jsonrpc": "2.0",
                 "id": request_id,
                 "result": {
-                    "content": [{"type": "text", "text": json.dumps(result, indent=2)}]
+                    "content": [{"type": "text", "text": await encode_json(server, result, indent=2)}]
                 }
             }
         
@@ -788,7 +4554,7 @@ async def main():
     server = RLMServer()
     logger.info("RLM MCP Server starting...")
     
-    reader = asyncio.StreamReader()
+    reader = asyncio.StreamReader(limit=MAX_REQUEST_BYTES)
     protocol = asyncio.StreamReaderProtocol(reader)
     await asyncio.get_event_loop().connect_read_pipe(lambda: protocol, sys.stdin)
     
@@ -797,24 +4563,49 @@ async def main():
     )
     writer = asyncio.StreamWriter(writer_transport, writer_protocol, None, asyncio.get_event_loop())
     
-    while True:
-        try:
-            line = await reader.readline()
-            if not line:
+    # Each request runs as its own task and encodes its own response;
+    # responses go through one writer so lines from concurrent requests
+    # never interleave
+    responses: asyncio.Queue = asyncio.Queue()
+    
+    async def write_responses():
+        while True:
+            response = await responses.get()
+            if response is None:
                 break
-            
-            request = json.loads(line.decode())
+            writer.write(response)
+            await writer.drain()
+    
+    async def dispatch(line: bytes):
+        try:
+            request = await decode_request(server, line)
             response = await handle_request(server, request)
-            
             if response:
-                response_bytes = (json.dumps(response) + "\n").encode()
-                writer.write(response_bytes)
-                await writer.drain()
-                
+                await responses.put((await encode_json(server, response) + "\n").encode())
         except json.JSONDecodeError as e:
             logger.error(f"JSON decode error: {e}")
+        except Exception as e:
+            logger.exception(f"Error handling request: {e}")
+    
+    writer_task = asyncio.create_task(write_responses())
+    pending = set()
+    while True:
+        try:
+            line = await reader.readline()
+            if not line:
+                break
+            task = asyncio.create_task(dispatch(line))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
         except Exception as e:
             logger.exception(f"Error in main loop: {e}")
+    
+    # Finish in-flight requests before shutting down
+    if pending:
+        await asyncio.gather(*pending)
+    await responses.put(None)
+    await writer_task
+    server.shutdown()
 
 
 if __name__ == "__main__":
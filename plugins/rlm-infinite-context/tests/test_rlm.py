@@ -5,13 +5,60 @@ Verifies core functionality works correctly.
 """
 
 import asyncio
+import json
+import math
+import re
 import sys
 import os
+import tempfile
+import time
+from collections import Counter
 
 # Add servers to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'servers'))
 
-from rlm_server import RLMServer
+from rlm_server import (ChunkBuilder, RLMServer, decode_request, encode_json, handle_request,
+                        tokenize)
+
+
+# Servers created by the helpers below, shut down after each test by run()
+servers: list[RLMServer] = []
+
+
+def start_server(data_dir, **env) -> RLMServer:
+    """Create a server on `data_dir` with the given environment overrides."""
+    saved = {key: os.environ.get(key) for key in ["RLM_DATA_DIR", *env]}
+    os.environ["RLM_DATA_DIR"] = str(data_dir)
+    os.environ.update({key: str(value) for key, value in env.items()})
+    try:
+        server = RLMServer()
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+    servers.append(server)
+    return server
+
+
+def make_server(**env) -> RLMServer:
+    """Create a server backed by a fresh temporary data directory."""
+    return start_server(tempfile.mkdtemp(prefix="rlm-test-"), **env)
+
+
+def restart_server(server: RLMServer) -> RLMServer:
+    """Start a new server on another server's data directory, as after a restart."""
+    return start_server(server.data_dir)
+
+
+def run(test):
+    """Run an async test, then stop the executors and guards of its servers."""
+    try:
+        asyncio.run(test())
+    finally:
+        while servers:
+            servers.pop().shutdown()
 
 
 async def test_basic_workflow():
@@ -145,5 +192,991 @@ Example usage:
     print("=" * 60)
 
 
+async def test_inverted_index():
+    """Keyword search walks postings instead of scanning chunks."""
+    print("\n[Index] Keyword search via inverted index...")
+    server = make_server(RLM_CHUNK_SIZE=200, RLM_OVERLAP=0)
+    lines = [f"line {i} filler text about topic{i % 7}" for i in range(200)]
+    lines[150] = "the authentication handler lives in auth_service.py"
+    await server.load_context("\n".join(lines), "index-test")
+    context = server.contexts[server.active_session]
+    
+    posting = context.index.lookup("authentication")
+    assert len(posting) == 1
+    chunk_id = next(iter(posting))
+    
+    # Prefix and multi-term keywords resolve through the index
+    results = await server.search_context("authent", search_type="keyword")
+    assert [r["chunk_id"] for r in results["results"]] == [chunk_id]
+    results = await server.search_context("auth_service.py", search_type="keyword")
+    assert [r["chunk_id"] for r in results["results"]] == [chunk_id]
+    
+    # Keywords match anywhere in a word, as a substring search would
+    code = make_server(RLM_CHUNK_SIZE=200, RLM_OVERLAP=0)
+    lines = [f"line {i} filler text about topic{i % 7}" for i in range(200)]
+    lines[40] = "refresh the access_token before it expires"
+    lines[90] = "handled by OAuth in rlm_search()"
+    await code.load_context("\n".join(lines), "infix-test")
+    for keyword, expected in [("token", ["access_token"]), ("auth", ["OAuth"]),
+                              ("search", ["rlm_search"]), ("m_search(", ["rlm_search()"])]:
+        results = await code.search_context(keyword, search_type="keyword")
+        found = [r["content"] for r in results["results"]]
+        assert len(found) == 1 and all(e in found[0] for e in expected), keyword
+    print(f"  ✓ Keyword hits resolved to chunk {chunk_id} from postings")
+
+
+async def test_bm25_ranking():
+    """BM25 separates chunks that plain keyword scoring ties."""
+    print("\n[BM25] Ranking chunks with BM25...")
+    server = make_server(RLM_CHUNK_SIZE=120, RLM_OVERLAP=0)
+    paragraphs = [
+        "cache layer notes: cache entries expire, cache misses fall through",
+        "the cache is mentioned once among many unrelated words here today",
+        "eviction policy for the cache uses lru eviction with a size cap",
+        "nothing relevant in this paragraph at all, just filler words",
+    ]
+    await server.load_context("\n\n".join(paragraphs), "bm25-test")
+    
+    results = await server.search_context("cache eviction")
+    assert results["search_type"] == "bm25"
+    ranked = [r["chunk_id"] for r in results["results"]]
+    scores = [r["relevance"] for r in results["results"]]
+    assert len(ranked) == 3 and scores == sorted(scores, reverse=True)
+    assert len(set(scores)) == len(scores)
+    assert ranked[0] == 2  # both terms, "eviction" twice
+    print(f"  ✓ Ranked chunks {ranked} with scores {scores}")
+
+
+async def test_offset_chunks():
+    """Chunks are byte ranges into the mapped content file."""
+    print("\n[Storage] Offset-based chunks over mmap...")
+    server = make_server(RLM_CHUNK_SIZE=80, RLM_OVERLAP=20)
+    content = "\n".join(f"ligne {i}: café naïve résumé — {i * 7}" for i in range(40))
+    result = await server.load_context(content, "offset-test")
+    context = server.contexts[result["context_id"]]
+    
+    assert "content" not in vars(context)
+    for chunk in context.chunks:
+        assert "content" not in chunk
+        assert context.chunk_text(chunk) == content[chunk["start_char"]:chunk["end_char"]]
+    assert context.content == content
+    
+    chunk = await server.get_chunk(3, context_id=result["context_id"])
+    assert chunk["content"] == context.chunk_text(context.chunks[3])
+    print(f"  ✓ {len(context.chunks)} chunks materialised from {context.path.name}")
+
+
+async def test_warm_restart():
+    """Persisted contexts are registered at startup and loaded lazily."""
+    print("\n[Restart] Restoring persisted contexts...")
+    server = make_server(RLM_CHUNK_SIZE=200)
+    content = "\n".join(f"record {i}: shard{i % 13} replicated" for i in range(300))
+    loaded = await server.load_context(content, "restart-test")
+    before = await server.search_context("shard7", search_type="keyword", top_k=50)
+    
+    restarted = restart_server(server)
+    
+    context = restarted.contexts[loaded["context_id"]]
+    assert not context.loaded and context.chunk_count == loaded["chunk_count"]
+    listing = await restarted.list_contexts()
+    assert listing["contexts"][0]["name"] == "restart-test"
+    
+    after = await restarted.search_context(
+        "shard7", context_id=loaded["context_id"], search_type="keyword", top_k=50
+    )
+    assert context.loaded
+    assert [r["chunk_id"] for r in after["results"]] == [r["chunk_id"] for r in before["results"]]
+    
+    await restarted.clear_context(loaded["context_id"])
+    assert not list(restarted.data_dir.iterdir())
+    print(f"  ✓ Restored {context.chunk_count} chunks on first access")
+
+
+async def test_load_directory():
+    """Directories stream into one context with per-file chunk metadata."""
+    print("\n[Files] Loading a directory from disk...")
+    server = make_server(RLM_CHUNK_SIZE=300)
+    root = tempfile.mkdtemp(prefix="rlm-src-")
+    os.makedirs(os.path.join(root, "pkg"))
+    sources = {
+        "README.md": "# Project\n\nSee pkg/auth.py for the token refresh flow.\n",
+        "pkg/auth.py": "".join(f"def refresh_token_{i}(session):\n    return session.renew()\n\n" for i in range(20)),
+        "pkg/db.py": "def connect():\n    return pool.acquire()\n",
+    }
+    for relative, text in sources.items():
+        with open(os.path.join(root, relative), "w") as f:
+            f.write(text)
+    with open(os.path.join(root, "blob.bin"), "wb") as f:
+        f.write(b"\x00\x01binary")
+    
+    result = await server.load_directory(root, patterns=["**/*"], exclude=["*.bin"])
+    assert result["success"] and result["file_count"] == 3
+    context = server.contexts[result["context_id"]]
+    for chunk in context.chunks:
+        entry = context.metadata["files"][chunk["file"]]
+        assert entry["start"] <= chunk["start"] <= chunk["end"] <= entry["end"]
+        assert context.chunk_text(chunk) in sources[entry["path"]]
+    
+    results = await server.search_context("refresh", search_type="keyword", top_k=50)
+    assert {r["file"] for r in results["results"]} == {"README.md", "pkg/auth.py"}
+    results = await server.search_context(
+        "refresh", search_type="keyword", top_k=50, file_pattern="pkg/*"
+    )
+    assert {r["file"] for r in results["results"]} == {"pkg/auth.py"}
+    
+    single = await server.load_file(os.path.join(root, "pkg", "db.py"))
+    assert single["success"] and single["name"] == "db.py"
+    print(f"  ✓ {result['file_count']} files in {result['chunk_count']} chunks, filtered by file")
+
+
+async def test_append():
+    """Appending re-chunks only the tail and matches a full reload."""
+    print("\n[Append] Extending a context incrementally...")
+    server = make_server(RLM_CHUNK_SIZE=150, RLM_OVERLAP=40)
+    head = "".join(f"2024-01-01 10:00:{i:02d} INFO request {i} ok\n" for i in range(40))
+    tail = "".join(f"2024-01-01 10:01:{i:02d} ERROR upstream timeout {i}\n" for i in range(25))
+    
+    loaded = await server.load_context(head + "partial li", "log")
+    chunk_count = loaded["chunk_count"]
+    appended = await server.append_context("ne continued\n" + tail)
+    assert appended["success"] and appended["rechunked"][0] == chunk_count - 1
+    context = server.contexts[loaded["context_id"]]
+    
+    reference = make_server(RLM_CHUNK_SIZE=150, RLM_OVERLAP=40)
+    full = await reference.load_context(head + "partial line continued\n" + tail, "log")
+    expected = reference.contexts[full["context_id"]]
+    assert context.chunks == expected.chunks
+    assert context.index.postings == expected.index.postings
+    assert context.content == expected.content
+    
+    results = await server.search_context("timeout", search_type="keyword", top_k=100)
+    assert results["result_count"] > 0
+    
+    # The persisted chunks file reflects the appended tail
+    restarted = restart_server(server)
+    restored = restarted.get_context(context.id)
+    assert restored.chunks == expected.chunks
+    print(f"  ✓ Re-indexed chunks {appended['rechunked']} of {appended['chunk_count']}")
+
+
+async def test_append_equivalence():
+    """Random appends split like a full reload with every strategy."""
+    print("\n[Append] Comparing appends with full reloads...")
+    import random
+    rng = random.Random(6)
+    words = "alpha beta gamma delta retry timeout error config handler".split()
+
+    def random_line(i):
+        kind = rng.random()
+        if kind < 0.1:
+            return ""
+        if kind < 0.2:
+            return "# Heading " + rng.choice(words)
+        if kind < 0.3:
+            return f"def {rng.choice(words)}_{i}(x):"
+        if kind < 0.35:
+            return "x" * rng.randint(50, 400)
+        return " ".join(rng.choice(words) for _ in range(rng.randint(1, 15)))
+
+    for strategy in ["lines", "prose", "code", "cdc"]:
+        for case in range(8):
+            settings = {"RLM_CHUNK_SIZE": rng.choice([60, 120, 200]),
+                        "RLM_OVERLAP": rng.choice([0, 20, 50])}
+            text = "\n".join(random_line(i) for i in range(rng.randint(5, 60)))
+            cuts = sorted(rng.sample(range(1, len(text)), 2))
+            server = make_server(**settings)
+            loaded = await server.load_context(text[:cuts[0]], "log", strategy=strategy)
+            for start, end in [(cuts[0], cuts[1]), (cuts[1], len(text))]:
+                await server.append_context(text[start:end], context_id=loaded["context_id"])
+            reference = make_server(**settings)
+            full = await reference.load_context(text, "log", strategy=strategy)
+            context = server.contexts[loaded["context_id"]]
+            expected = reference.contexts[full["context_id"]]
+            assert context.chunks == expected.chunks, (strategy, case)
+            assert context.index.postings == expected.index.postings, (strategy, case)
+            assert server.context_outline(context).entries == \
+                reference.context_outline(expected).entries, (strategy, case)
+    print("  ✓ Appended contexts match full reloads for lines, prose, code and cdc")
+
+
+async def test_regex_single_pass():
+    """Regex scans count overlap matches once and find boundary-crossing ones."""
+    print("\n[Regex] Whole-document scan with chunk attribution...")
+    server = make_server(RLM_CHUNK_SIZE=120, RLM_OVERLAP=60)
+    lines = [f"filler line number {i:03d}" for i in range(60)]
+    # Put the marker on the first line of chunk 3, which chunk 2 overlaps
+    overlapped = server.chunk_content("\n".join(lines))[3]["start_char"]
+    index = "\n".join(lines)[:overlapped].count("\n")
+    lines[index] = "marker ERROR code E42."  # same length keeps the chunking
+    content = "\n".join(lines)
+    await server.load_context(content, "regex-test")
+    context = server.contexts[server.active_session]
+    
+    holders = [c["id"] for c in context.chunks if "E42" in context.chunk_text(c)]
+    assert len(holders) > 1  # the line sits in an overlap region
+    results = await server.search_context(r"E\d+", search_type="regex", top_k=50)
+    assert sum(r["match_count"] for r in results["results"]) == 1
+    start, end = results["results"][0]["matches"][0]
+    assert content[start:end] == "E42"
+    
+    # A multi-line match spanning two chunks is still found
+    server = make_server(RLM_CHUNK_SIZE=120, RLM_OVERLAP=0)
+    lines = [f"filler line number {i:03d}" for i in range(60)]
+    await server.load_context("\n".join(lines), "boundary-test")
+    context = server.contexts[server.active_session]
+    boundary = context.chunks[1]["start_char"]
+    last_line = "\n".join(lines)[:boundary - 1].rsplit("\n", 1)[-1]
+    first_line = context.chunk_text(context.chunks[1]).split("\n", 1)[0]
+    pattern = re.escape(last_line) + r"\n" + re.escape(first_line)
+    results = await server.search_context(pattern, search_type="regex")
+    assert results["result_count"] == 1 and results["results"][0]["chunk_id"] == 0
+    print(f"  ✓ Overlap match counted once; boundary-crossing match found")
+
+
+async def test_trigram_prefilter():
+    """Trigram candidates never lose a match the full scan finds."""
+    print("\n[Trigram] Prefiltered regex search...")
+    server = make_server(RLM_CHUNK_SIZE=200, RLM_OVERLAP=40)
+    lines = [f"def handler_{i}(request): return status_{i % 7}" for i in range(200)]
+    lines[120] = "class TokenRefresher:  # OAuth2 refresh"
+    await server.load_context("\n".join(lines), "trigram-test")
+    context = server.contexts[server.active_session]
+    
+    candidates = server.regex_candidates(context, r"TokenRefresh\w+", re.IGNORECASE)
+    assert candidates is not None and len(candidates) < len(context.chunks) // 4
+    assert server.regex_candidates(context, r"\d+", re.IGNORECASE) is None
+    
+    patterns = [r"TokenRefresh\w+", r"handler_1\d\b", r"(status_3|oauth2)",
+                r"refresh(er)?:", r"return\s+status_6$", r"nomatchhere",
+                # Matches running across several chunks
+                r"TokenRefresher[\s\S]*?handler_140\(", r"handler_100\b[\s\S]*handler_140\b",
+                r"\s+class TokenRefresher"]
+    for pattern in patterns:
+        compiled = re.compile(pattern, re.IGNORECASE)
+        full = server.scan_regex(context, compiled)
+        filtered = server.scan_regex(
+            context, compiled, server.regex_candidates(context, pattern, re.IGNORECASE))
+        assert full == filtered, pattern
+    spanning = server.scan_regex(context, re.compile(r"handler_100\b[\s\S]*handler_140\b"))
+    (start, end), = [match for matches in spanning.values() for match in matches]
+    assert len([c for c in context.chunks if start < c["end_char"] and c["start_char"] < end]) > 3
+    print(f"  ✓ {len(candidates)} of {len(context.chunks)} chunks scanned; results unchanged")
+
+
+async def test_parallel_scan():
+    """Sharded process-pool scans return exactly the serial results."""
+    print("\n[Parallel] Regex scan across worker processes...")
+    server = make_server(RLM_WORKERS="2", RLM_CHUNK_SIZE=300, RLM_OVERLAP=50)
+    server.parallel_min_bytes = 0
+    lines = [f"record {i:05d} status={'FAIL' if i % 37 == 0 else 'ok'}" for i in range(3000)]
+    await server.load_context("\n".join(lines), "parallel-test")
+    context = server.contexts[server.active_session]
+    
+    for pattern in [r"status=FAIL", r"record 0\d{2}7[05]", r"\d{5} status"]:
+        compiled = re.compile(pattern, re.IGNORECASE)
+        parallel = server.scan_regex(context, compiled)
+        server.workers = 1
+        serial = server.scan_regex(context, compiled)
+        server.workers = 2
+        assert dict(parallel) == dict(serial) and list(parallel) == sorted(parallel), pattern
+    results = await server.search_context(r"status=FAIL", search_type="regex", top_k=100)
+    assert sum(r["match_count"] for r in results["results"]) == len(range(0, 3000, 37))
+    print(f"  ✓ {len(context.chunks)} chunks scanned in 2 workers; results match serial")
+
+
+async def test_concurrent_dispatch():
+    """Cheap calls are answered while a large load is still running."""
+    print("\n[Concurrency] rlm_list during an in-flight load...")
+    server = make_server()
+    content = "\n".join(f"log line {i} level=info message=request served" for i in range(60000))
+    
+    def call(request_id, tool, **arguments):
+        return handle_request(server, {"jsonrpc": "2.0", "id": request_id, "method": "tools/call",
+                                       "params": {"name": tool, "arguments": arguments}})
+    
+    load = asyncio.create_task(call(1, "rlm_load", content=content, name="big"))
+    await asyncio.sleep(0.05)
+    started = time.perf_counter()
+    listing = await call(2, "rlm_list")
+    elapsed = time.perf_counter() - started
+    assert not load.done() and listing["id"] == 2
+    
+    loaded = await load
+    assert '"success": true' in loaded["result"]["content"][0]["text"]
+    searches = await asyncio.gather(*(call(3 + i, "rlm_search", query=f"line {i}")
+                                      for i in range(4)))
+    assert [r["id"] for r in searches] == [3, 4, 5, 6]
+    assert len(server.queries) == 4  # concurrent searches get distinct query ids
+    
+    # Large request lines and responses are (de)serialised off the event loop
+    offloaded = []
+    run_blocking = server.run_blocking
+    async def recording(func, *args, **kwargs):
+        offloaded.append(func)
+        return await run_blocking(func, *args, **kwargs)
+    server.run_blocking = recording
+    big = {"jsonrpc": "2.0", "id": 9, "method": "tools/call",
+           "params": {"name": "rlm_load", "arguments": {"content": content}}}
+    assert await decode_request(server, json.dumps(big).encode()) == big
+    assert await encode_json(server, big) == json.dumps(big)
+    assert offloaded == [json.loads, json.dumps]
+    await decode_request(server, b'{"id": 10, "method": "tools/list"}')
+    await encode_json(server, {"id": 10, "result": {"tools": []}})
+    assert len(offloaded) == 2
+    server.run_blocking = run_blocking
+    print(f"  ✓ rlm_list answered in {elapsed * 1000:.1f}ms while loading")
+
+
+async def test_query_cache():
+    """Repeat searches hit the cache; appends drop only entries they change."""
+    print("\n[Cache] Query-result cache and invalidation...")
+    server = make_server(RLM_CHUNK_SIZE=200, RLM_OVERLAP=0)
+    lines = [f"entry {i:04d} widget assembly notes" for i in range(100)]
+    lines[10] = "entry 0010 gearbox failure detected"
+    await server.load_context("\n".join(lines), "cache-test")
+    
+    first = await server.search_context("Gearbox  FAILURE", search_type="keyword")
+    again = await server.search_context("gearbox failure", search_type="keyword")
+    assert first["results"] == again["results"]
+    await server.search_context(r"gearbox\s+failure", search_type="regex")
+    await server.search_context("widget", search_type="bm25")
+    stats = (await server.get_statistics())["query_cache"]
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 3, 3)
+    
+    # Unrelated text: keyword and regex entries stay, BM25 statistics changed
+    await server.append_context("\nentry 0100 widget calibration")
+    assert len(server.cache.entries) == 2
+    # Text matching the cached queries invalidates them
+    await server.append_context("\nentry 0101 gearbox failure again")
+    assert len(server.cache.entries) == 0
+    
+    for query, search_type in [("gearbox failure", "keyword"), (r"gearbox\s+failure", "regex")]:
+        cached = await server.search_context(query, search_type=search_type)
+        server.cache.entries.clear()
+        fresh = await server.search_context(query, search_type=search_type)
+        assert cached["results"] == fresh["results"] and cached["result_count"] == 2
+    
+    await server.clear_context()
+    assert server.cache.stats()["entries"] == 0
+    print(f"  ✓ {stats['hits']} hit, {stats['misses']} misses; appends invalidated precisely")
+
+
+async def test_recursive_views():
+    """Recursive search runs over parent chunk ids without copying them."""
+    print("\n[Views] Zero-copy recursive search...")
+    server = make_server(RLM_CHUNK_SIZE=200, RLM_OVERLAP=0)
+    lines = [f"section {i:03d} covers {'token rotation' if i % 10 == 0 else 'routine upkeep'}"
+             for i in range(200)]
+    await server.load_context("\n".join(lines), "view-test")
+    context = server.contexts[server.active_session]
+    
+    top = await server.search_context("token rotation", search_type="keyword", top_k=50)
+    selected = [r["chunk_id"] for r in top["results"]][:4]
+    deep = await server.search_recursive(r"section \d+0 covers", selected,
+                                         parent_query_id=top["query_id"])
+    found = [r["chunk_id"] for r in deep["results"]]
+    assert found and set(found) <= set(selected) and deep["depth"] == 1
+    assert list(server.contexts) == [context.id]  # nothing registered per selection
+    
+    # The same selection reuses its view id, so the repeat is a cache hit
+    hits = server.cache.hits
+    again = await server.search_recursive(r"section \d+0 covers", list(reversed(selected)))
+    assert again["recursive_info"]["view_id"] == deep["recursive_info"]["view_id"]
+    assert server.cache.hits == hits + 1 and len(server.views) == 1
+    
+    # Result ids feed a deeper level directly
+    deeper = await server.search_recursive("rotation", found[:1], parent_query_id=deep["query_id"])
+    assert deeper["depth"] == 2 and deeper["results"][0]["chunk_id"] == found[0]
+    print(f"  ✓ {len(found)} of {len(selected)} selected chunks matched at depth 1, in place")
+
+
+async def test_memory_budget():
+    """Contexts beyond RLM_MAX_MEMORY_MB spill in LRU order and come back on access."""
+    print("\n[Memory] LRU spill-to-disk...")
+    server = make_server(RLM_MAX_MEMORY_MB="1.6", RLM_CHUNK_SIZE=500, RLM_OVERLAP=0)
+    ids = []
+    for name in ["alpha", "beta", "gamma"]:
+        text = "\n".join(f"{name} record {i} with payload {i * 7919 % 10007}" for i in range(4000))
+        ids.append((await server.load_context(text, name))["context_id"])
+        if name == "beta":
+            before = await server.search_context("alpha record 123", context_id=ids[0])
+            server.cache.entries.clear()
+    
+    # alpha was used after beta was loaded, so beta is the one spilled
+    loaded = {c.id: c.loaded for c in server.contexts.values()}
+    assert loaded == {ids[0]: True, ids[1]: False, ids[2]: True}, loaded
+    memory = (await server.get_statistics())["memory"]
+    assert memory["spilled_contexts"] == 1 and memory["spilled_bytes"] > 0
+    assert memory["resident_bytes"] <= server.max_memory
+    
+    # Touching beta re-hydrates it and spills the now least recent context
+    await server.get_chunk(0, context_id=ids[1])
+    assert server.contexts[ids[1]].loaded and not server.contexts[ids[0]].loaded
+    after = await server.search_context("alpha record 123", context_id=ids[0])
+    assert after["results"] == before["results"]
+
+    # Another request may spill the context between a search and the
+    # formatting of its results, which must not read the dropped chunks
+    search = server.run_search
+    def search_then_spill(context, *args, **kwargs):
+        found = search(context, *args, **kwargs)
+        context.spill()
+        return found
+    server.run_search = search_then_spill
+    try:
+        raced = await server.search_context("alpha record 123", context_id=ids[0], snippets=True)
+    finally:
+        server.run_search = search
+    assert not server.contexts[ids[0]].loaded
+    assert [r["chunk_id"] for r in raced["results"]] == [r["chunk_id"] for r in before["results"]]
+    print(f"  ✓ {memory['resident_bytes']:,} bytes resident, {memory['spilled_bytes']:,} spilled")
+
+
+async def test_outline_index():
+    """The outline is built once at load, without overlap duplicates, and pages."""
+    print("\n[Outline] Precomputed heading index...")
+    server = make_server(RLM_CHUNK_SIZE=300, RLM_OVERLAP=150)
+    parts = []
+    for chapter in range(1, 31):
+        parts.append(f"# Chapter {chapter}")
+        for section in range(1, 4):
+            parts += [f"## Section {chapter}.{section}", "Body text for this section.", ""]
+    content = "\n".join(parts)
+    await server.load_context(content, "outline-test")
+    context = server.contexts[server.active_session]
+    
+    outline = await server.get_outline(max_depth=2, limit=50)
+    assert outline["outline_items"] == 120  # overlap regions are not reported twice
+    assert outline["next_offset"] == 50 and len(outline["outline"]) == 50
+    last_page = await server.get_outline(max_depth=2, offset=100, limit=50)
+    assert last_page["next_offset"] is None and len(last_page["outline"]) == 20
+    assert "error" in await server.get_outline(limit=0)
+    assert "error" in await server.get_outline(limit=-5)
+    entry = outline["outline"][4]
+    assert entry["title"] == "Chapter 2" and content[entry["position"]:].startswith("# Chapter 2")
+    
+    subtree = await server.get_outline(parent_id=entry["id"])
+    assert [e["title"] for e in subtree["outline"]] == ["Section 2.1", "Section 2.2", "Section 2.3"]
+    assert all(e["parent"] == entry["id"] for e in subtree["outline"])
+    
+    # Appends extend the index; a restart reads it back from disk
+    await server.append_context("\n# Chapter 31\n## Section 31.1")
+    restarted = restart_server(server)
+    reloaded = await restarted.get_outline(context_id=context.id, offset=120)
+    assert [e["title"] for e in reloaded["outline"]] == ["Chapter 31", "Section 31.1"]
+    print(f"  ✓ {outline['outline_items']} headings indexed at load, paged and filtered")
+
+
+async def test_structured_chunking():
+    """Chunks break at definitions/headings, carry line numbers and per-load settings."""
+    print("\n[Chunking] Structure-aware chunker...")
+    server = make_server(RLM_CHUNK_SIZE=4000, RLM_OVERLAP=0)
+    functions = [f"def handler_{i}(request):\n    value = request.get({i})\n"
+                 f"    if value is None:\n        return {i}\n    return value * {i}\n"
+                 for i in range(40)]
+    code = "\n".join(functions)
+    lines = code.split("\n")
+    
+    loaded = await server.load_context(code, "handlers.py", chunk_size=400)
+    context = server.contexts[loaded["context_id"]]
+    assert context.metadata["chunking"]["chunk_size"] == 400  # per-load size
+    for chunk in context.chunks:
+        text = context.chunk_text(chunk)
+        assert text.startswith("def handler_"), text[:40]
+        assert lines[chunk["start_line"] - 1:chunk["end_line"]] == text.split("\n")
+    
+    # The same text chunked line by line splits functions apart
+    plain = await server.load_context(code + "\n", "plain", chunk_size=400, strategy="lines")
+    plain_chunks = server.contexts[plain["context_id"]]
+    assert not all(plain_chunks.chunk_text(c).startswith("def ") for c in plain_chunks.chunks)
+    
+    # Prose breaks before headings; appends keep the context's settings
+    prose = "\n".join(f"# Topic {i}\n\n" + "Sentence about the topic. " * 6 + "\n" for i in range(20))
+    await server.load_context(prose, "notes", chunk_size=300, strategy="prose")
+    notes = server.contexts[server.active_session]
+    await server.append_context("\n# Topic 20\n\nAppended text.")
+    assert all(notes.chunk_text(c).startswith("# Topic") for c in notes.chunks)
+    reloaded = await server.load_context(prose + "\n# Topic 20\n\nAppended text.", "again",
+                                         chunk_size=300, strategy="prose")
+    assert server.contexts[reloaded["context_id"]].chunks == notes.chunks
+    
+    bad = await server.load_context("x", "bad", strategy="words")
+    assert "error" in bad
+    print(f"  ✓ {len(context.chunks)} code chunks start at definitions, line numbers exact")
+
+
+async def test_cdc_reload():
+    """Content-defined chunks survive an edit; a reload reuses them and the cache."""
+    print("\n[CDC] Content-defined chunking and reloads...")
+    server = make_server(RLM_CHUNK_SIZE=1000)
+    lines = [f"clause {i}: the service shall retain record {i * 7919 % 10007}" for i in range(3000)]
+    first = await server.load_context("\n".join(lines), "spec", strategy="cdc")
+    query = "2999"
+    cached = await server.search_context(query, search_type="keyword")
+    
+    # One inserted line at the top only touches the chunk around it
+    edited = ["Revision 2"] + lines
+    second = await server.load_context("\n".join(edited), "spec", strategy="cdc")
+    assert second["reused_chunks"] >= second["chunk_count"] - 1, second
+    assert second["reused_chunks"] < first["chunk_count"]
+    
+    hits = server.cache.hits
+    carried = await server.search_context(query, search_type="keyword",
+                                          context_id=second["context_id"])
+    assert server.cache.hits == hits + 1
+    server.cache.entries.clear()
+    fresh = await server.search_context(query, search_type="keyword",
+                                        context_id=second["context_id"])
+    assert carried["results"] == fresh["results"] != cached["results"]
+    
+    # The superseded version is retired unless asked to keep it
+    assert first["context_id"] not in server.contexts
+    assert not (server.data_dir / f"{first['context_id']}.txt").exists()
+    kept = await server.load_context("\n".join(lines), "spec", strategy="cdc", keep_previous=True)
+    assert {kept["context_id"], second["context_id"]} <= server.contexts.keys()
+    await server.clear_context(kept["context_id"])
+    
+    # Appending matches chunking the whole text at once
+    context = server.contexts[second["context_id"]]
+    await server.append_context("\n" + "\n".join(lines[:200]), context_id=context.id)
+    whole = await server.load_context("\n".join(edited + lines[:200]), "whole", strategy="cdc")
+    assert server.contexts[whole["context_id"]].chunks == context.chunks
+    
+    # A content-defined cut on the final line leaves nothing for the last chunk
+    small = make_server(RLM_CHUNK_SIZE=200)
+    for n in range(1, len(lines)):
+        builder = ChunkBuilder(200, small.overlap, strategy="cdc")
+        builder.feed("\n".join(lines[:n]) + "\n")
+        if not builder.lines:
+            break
+    text = "\n".join(lines[:n])
+    loaded = await small.load_context(text, "cut-at-end", strategy="cdc")
+    chunks = small.contexts[loaded["context_id"]].chunks
+    assert chunks[-1]["end_char"] == len(text)
+    await small.append_context("\n" + lines[n], context_id=loaded["context_id"])
+    print(f"  ✓ {second['reused_chunks']} of {second['chunk_count']} chunks reused after an edit")
+
+
+async def test_content_ids():
+    """Ids hash the full content, so a shared preamble does not collide."""
+    print("\n[Ids] Full-content context ids...")
+    server = make_server(RLM_CHUNK_SIZE=500, RLM_OVERLAP=0)
+    preamble = "\n".join(f"License clause {i}: redistribution permitted" for i in range(100))
+    first = await server.load_context(preamble + "\nrelease one notes", "v1")
+    second = await server.load_context(preamble + "\nrelease two notes", "v2")
+    assert first["context_id"] != second["context_id"]  # shared preamble, no collision
+    assert len(server.contexts) == 2
+    
+    # Clearing one context leaves the other's files intact
+    expected = await server.search_context("redistribution", context_id=second["context_id"],
+                                           search_type="bm25", top_k=20)
+    await server.clear_context(first["context_id"])
+    restarted = restart_server(server)
+    restored = await restarted.search_context("redistribution", context_id=second["context_id"],
+                                              search_type="bm25", top_k=20)
+    assert restored["results"] == expected["results"]
+    print(f"  ✓ {first['context_id']} and {second['context_id']} share a preamble without colliding")
+
+
+async def test_search_all():
+    """One call searches every context and merges a global top-k."""
+    print("\n[Fan-out] Searching all contexts...")
+    server = make_server(RLM_CHUNK_SIZE=300)
+    ids = {}
+    for name, hits in [("alpha", 3), ("beta", 9), ("gamma", 0)]:
+        text = "\n".join(f"{name} entry {i}: " + ("quorum lost" if i % 40 < hits else "steady")
+                         for i in range(400))
+        ids[name] = (await server.load_context(text, name))["context_id"]
+    
+    merged = await server.search_all("quorum lost", search_type="bm25", top_k=20)
+    assert merged["contexts_searched"] == 3 and merged["result_count"] == 20
+    scores = [r["relevance"] for r in merged["results"]]
+    assert scores == sorted(scores, reverse=True)
+    assert {r["context_id"] for r in merged["results"]} == {ids["alpha"], ids["beta"]}
+    
+    # Each context's slice matches a direct search of that context
+    for name in ["alpha", "beta"]:
+        direct = await server.search_context("quorum lost", context_id=ids[name],
+                                             search_type="bm25", top_k=20)
+        mine = [r["chunk_id"] for r in merged["results"] if r["context_id"] == ids[name]]
+        assert mine == [r["chunk_id"] for r in direct["results"]][:len(mine)]
+    
+    subset = await server.search_all("quorum", context_ids=[ids["gamma"], "missing"],
+                                     search_type="keyword")
+    assert subset["result_count"] == 0 and subset["missing_contexts"] == ["missing"]
+    assert "error" in await server.search_all("quorum lost", top_k=0)
+    assert "error" in await server.search_all("quorum lost", top_k=-2)
+    print(f"  ✓ {merged['result_count']} results merged from {merged['contexts_searched']} contexts")
+
+
+async def test_search_cursor():
+    """rlm_search_next pages through the retained results without repeats."""
+    print("\n[Cursor] Paginated search results...")
+    server = make_server(RLM_CHUNK_SIZE=200)
+    text = "\n".join(f"ticket {i}: " + ("timeout " * (1 + i % 4)) + "observed" for i in range(600))
+    await server.load_context(text, "tickets")
+    everything = await server.search_context("timeout observed", search_type="bm25", top_k=1000)
+    expected = [r["chunk_id"] for r in everything["results"]]
+    assert everything["next_cursor"] is None
+    
+    page = await server.search_context("timeout observed", search_type="bm25", top_k=7)
+    seen = [r["chunk_id"] for r in page["results"]]
+    cursor = page["next_cursor"]
+    while cursor:
+        page = await server.search_next(cursor, page_size=20)
+        seen += [r["chunk_id"] for r in page["results"]]
+        cursor = page["next_cursor"]
+    assert seen == expected and page["remaining"] == 0
+    
+    # A cursor over a cached first page re-runs the search once and skips it
+    repeat = await server.search_context("timeout observed", search_type="bm25", top_k=7)
+    assert server.cache.hits >= 1
+    second = await server.search_next(repeat["next_cursor"])
+    assert [r["chunk_id"] for r in second["results"]] == expected[7:14]
+    
+    # Page sizes below one are refused rather than returning empty pages
+    assert "error" in await server.search_context("timeout observed", top_k=0)
+    assert "error" in await server.search_context("timeout observed", top_k=-3)
+    assert "error" in await server.search_next(repeat["next_cursor"], page_size=0)
+    assert "error" in await server.search_next(repeat["next_cursor"], page_size=-1)
+    
+    # Appends and the TTL invalidate cursors
+    live = (await server.search_context("observed", search_type="keyword", top_k=3))["next_cursor"]
+    await server.append_context("\nticket 600: timeout observed")
+    assert "error" in await server.search_next(live)
+    server.cursor_ttl = 0
+    expired = (await server.search_context("ticket", search_type="keyword", top_k=3))["next_cursor"]
+    assert "error" in await server.search_next(expired)
+    print(f"  ✓ {len(seen)} results paged without repeats")
+
+
+async def test_snippets():
+    """Snippet mode returns merged windows around matches with highlights."""
+    print("\n[Snippets] Match-centred snippets...")
+    server = make_server()
+    lines = [f"log line {i}: heartbeat ok, latency {i % 97} ms, queue depth {i % 13}"
+             for i in range(3000)]
+    lines[1200] = "log line 1200: ERROR disk quota exceeded on volume 7"
+    lines[1202] = "log line 1202: ERROR disk quota exceeded on volume 9"
+    lines[2500] = "log line 2500: ERROR disk quota exceeded on volume 3"
+    await server.load_context("\n".join(lines), "logs")
+    
+    full = await server.search_context("quota exceeded", search_type="bm25", top_k=3)
+    cut = await server.search_context("quota exceeded", search_type="bm25", top_k=3,
+                                      snippets=True, snippet_radius=80)
+    assert [r["chunk_id"] for r in cut["results"]] == [r["chunk_id"] for r in full["results"]]
+    assert cut["tokens_returned"] * 5 <= full["tokens_returned"], (cut["tokens_returned"], full["tokens_returned"])
+    
+    for result in cut["results"]:
+        assert "content" not in result
+        for snippet in result["snippets"]:
+            for start, end in snippet["highlights"]:
+                assert snippet["text"][start:end].lower() in ("quota", "exceeded")
+    # The two nearby hits share one merged window
+    merged = next(r for r in cut["results"] if any("volume 7" in sn["text"] for sn in r["snippets"]))
+    window = next(sn for sn in merged["snippets"] if "volume 7" in sn["text"])
+    assert "volume 9" in window["text"] and len(window["highlights"]) == 4
+    
+    regex = await server.search_context(r"volume \d", search_type="regex", snippets=True,
+                                        snippet_radius=10, snippet_tokens=5)
+    snippet = regex["results"][0]["snippets"][0]
+    start, end = snippet["highlights"][0]
+    assert snippet["text"][start:end].startswith("volume ")
+    print(f"  ✓ {cut['tokens_returned']} tokens in snippets vs {full['tokens_returned']} as chunks")
+
+
+async def test_vector_search():
+    """Vector search ranks chunks by TF-IDF cosine similarity to the query."""
+    print("\n[Vector] TF-IDF cosine search...")
+    server = make_server(RLM_CHUNK_SIZE=300)
+    topics = ["replication lag on the standby", "certificate rotation schedule",
+              "garbage collection pause", "disk quota alert", "dns resolution failure"]
+    text = "\n".join(f"note {i}: {topics[i % 5]} " + "seen " * (i % 3) + topics[i * 7 % 5]
+                     for i in range(500))
+    context_id = (await server.load_context(text, "notes"))["context_id"]
+    context = server.contexts[context_id]
+    
+    # Reference: cosine over (1 + log tf) * idf chunk vectors and idf query weights
+    counts = [Counter(tokenize(context.chunk_text(c))) for c in context.chunks]
+    doc_freq = Counter(term for tf in counts for term in tf)
+    idf = {t: math.log((1 + len(counts)) / (1 + df)) + 1 for t, df in doc_freq.items()}
+    query = ["certificate", "rotation", "pause"]
+    expected = {}
+    for chunk_id, tf in enumerate(counts):
+        vector = {t: (1 + math.log(n)) * idf[t] for t, n in tf.items()}
+        dot = sum(vector.get(t, 0) * idf[t] for t in query)
+        if dot:
+            norm = math.sqrt(sum(w * w for w in vector.values()))
+            expected[chunk_id] = dot / norm / math.sqrt(sum(idf[t] ** 2 for t in query))
+    
+    found = await server.search_context("certificate rotation pause", search_type="vector",
+                                        top_k=len(expected))
+    assert found["result_count"] == len(expected)
+    for r in found["results"]:
+        assert abs(r["relevance"] - expected[r["chunk_id"]]) < 1e-3
+    scores = [r["relevance"] for r in found["results"]]
+    assert scores == sorted(scores, reverse=True) and scores[0] <= 1.0 + 1e-6
+    assert context.vectors is not None and context.resident_bytes > 0
+    
+    # Prefixes expand like BM25's; appends rebuild the vectors
+    assert (await server.search_context("certif", search_type="vector"))["result_count"] > 0
+    await server.append_context("\nnote 500: kerberos kerberos ticket expiry")
+    assert context.vectors is None
+    top = await server.search_context("kerberos expiry", search_type="vector", top_k=1)
+    assert "kerberos" in top["results"][0]["content"]
+    print(f"  ✓ {found['result_count']} cosine scores match a reference computation")
+
+
+async def test_boolean_query():
+    """Boolean queries combine postings, phrases, NEAR and file filters."""
+    print("\n[Boolean] Phrase, proximity and negation queries...")
+    server = make_server(RLM_CHUNK_SIZE=300)
+    root = tempfile.mkdtemp(prefix="rlm-bool-")
+    events = ["connection reset by peer", "reset the connection pool", "upstream timeout after retry",
+              "timeout waiting on the upstream", "retry scheduled", "disk full"]
+    sources = {
+        "app.log": "\n".join(f"event {i}: {events[i % 6] if i % 5 == 0 else 'heartbeat ok'}"
+                              for i in range(400)),
+        "runbook.md": "\n".join(f"step {i}: on {events[i * 5 % 6]} page the owner" for i in range(60)),
+    }
+    for name, text in sources.items():
+        with open(os.path.join(root, name), "w") as f:
+            f.write(text)
+    result = await server.load_directory(root, patterns=["*"])
+    context = server.contexts[result["context_id"]]
+    words = [tokenize(context.chunk_text(c)) for c in context.chunks]
+    files = [context.metadata["files"][c["file"]]["path"] for c in context.chunks]
+    
+    def phrase(terms, *wanted):
+        return any(terms[i:i + len(wanted)] == list(wanted) for i in range(len(terms)))
+    
+    def near(terms, a, b, distance):
+        return any(abs(i - j) - 1 <= distance for i, x in enumerate(terms) if x == a
+                   for j, y in enumerate(terms) if y == b)
+    
+    cases = {
+        '"connection reset"': lambda t, f: phrase(t, "connection", "reset"),
+        'connection reset NOT "connection reset"':
+            lambda t, f: "connection" in t and "reset" in t and not phrase(t, "connection", "reset"),
+        'timeout NEAR/1 upstream': lambda t, f: near(t, "timeout", "upstream", 1),
+        '(disk OR "retry scheduled") AND ext:md':
+            lambda t, f: f.endswith(".md") and ("disk" in t or phrase(t, "retry", "scheduled")),
+        'NOT retry* file:app.log': lambda t, f: f == "app.log" and "retry" not in t,
+    }
+    for query, predicate in cases.items():
+        expected = {i for i, (t, f) in enumerate(zip(words, files)) if predicate(t, f)}
+        found = await server.search_context(query, search_type="boolean", top_k=1000)
+        assert {r["chunk_id"] for r in found["results"]} == expected, query
+        assert expected, query
+    assert context.positions is not None
+    
+    # Syntax is detected by auto; malformed queries are reported
+    auto = await server.search_context('"disk full" NOT step', top_k=3)
+    assert auto["search_type"] == "boolean" and auto["result_count"] == 3
+    grouped = await server.search_context("(disk OR timeout) AND ext:md", top_k=3)
+    assert grouped["search_type"] == "boolean" and grouped["result_count"] == 3
+    # Uppercase prose is not operator syntax
+    status = make_server(RLM_CHUNK_SIZE=200, RLM_OVERLAP=0)
+    lines = [f"request {i} returned 200 OK" for i in range(200)]
+    lines[50] = "request 50 returned 404 NOT FOUND"
+    lines[120] = "request 120 returned 404 and was retried"
+    await status.load_context("\n".join(lines), "status")
+    plain = await status.search_context("404 NOT FOUND")
+    assert plain["search_type"] == "bm25" and plain["plan"]["shape"] == "words"
+    assert "404 NOT FOUND" in plain["results"][0]["content"]
+    for prose in ["REQUEST OR RETRY", "OK AND RETURNED"]:
+        assert (await status.search_context(prose))["search_type"] == "bm25", prose
+    assert "error" in await server.search_context("(disk OR", search_type="boolean")
+    
+    # Appends keep the positions current
+    await server.append_context("\nevent 400: kerberos ticket expired")
+    found = await server.search_context('"kerberos ticket"', search_type="boolean")
+    assert found["result_count"] == 1 and "kerberos ticket" in found["results"][0]["content"]
+    print(f"  ✓ {len(cases)} queries match a brute-force evaluation")
+
+
+async def test_multi_search():
+    """rlm_multi_search counts many literals in one prefiltered pass."""
+    print("\n[Multi] Batched literal lookups...")
+    server = make_server(RLM_CHUNK_SIZE=400)
+    lines = [f"line {i}: request served in {i % 89} ms by worker-{i % 7}" for i in range(4000)]
+    for i, code in [(120, "E_TIMEOUT"), (1999, "E_Timeout"), (2400, "E_QUOTA"), (3998, "ERR-42")]:
+        lines[i] = f"line {i}: failed with {code} on shard {i % 5}"
+    content = "\n".join(lines)
+    await server.load_context(content, "service")
+    
+    patterns = ["E_TIMEOUT", "e_quota", "ERR-42", "E_", "worker-3", "no such token"]
+    patterns += [f"served in {n} ms" for n in range(14)]
+    found = await server.multi_search(patterns)
+    assert found["pattern_count"] == 20 and found["not_found"] == ["no such token"]
+    lowered = content.lower()
+    for entry in found["patterns"]:
+        needle = entry["pattern"].lower()
+        assert entry["count"] == lowered.count(needle), entry["pattern"]
+        for hit in entry["hits"]:
+            assert needle in hit["text"].lower()
+            assert content.split("\n")[hit["line"] - 1] == hit["text"]
+    timeouts = found["patterns"][0]
+    assert timeouts["count"] == 2 and [h["line"] for h in timeouts["hits"]] == [121, 2000]
+    
+    # Rare literals only scan the chunks the trigram index points at
+    rare = await server.multi_search(["E_TIMEOUT", "ERR-42"], case_sensitive=True)
+    assert [e["count"] for e in rare["patterns"]] == [1, 1]
+    assert rare["chunks_scanned"] < len(server.contexts[found["context_id"]].chunks) / 10
+    assert "error" in await server.multi_search([""])
+    assert "error" in await server.multi_search(["retry"], max_hits=0)
+    assert "error" in await server.multi_search(["retry"], max_hits=-1)
+
+    # Occurrences do not overlap, whether or not lowercasing changes the
+    # length of the text ("İ" lowercases to two characters)
+    for prefix in ["plain", "İstanbul"]:
+        repeated = make_server(RLM_CHUNK_SIZE=400)
+        await repeated.load_context(f"{prefix} zzzz\nzzz then ZZZZZ\n", "repeats")
+        counted = await repeated.multi_search(["zz", "zzz"])
+        assert [e["count"] for e in counted["patterns"]] == [5, 3], (prefix, counted)
+    print(f"  ✓ {found['pattern_count']} patterns in one pass, {rare['chunks_scanned']} chunks for rare ones")
+
+
+async def test_query_planner():
+    """auto picks a strategy by query shape and index statistics, and reports it."""
+    print("\n[Planner] Cost-based auto search...")
+    server = make_server(RLM_CHUNK_SIZE=300)
+    lines = [f"worker {i}: loaded settings, {i % 50} handlers registered" for i in range(3000)]
+    lines[700] = "worker 700: [ERROR] could not read config.yaml (ConnectionTimeoutError)"
+    lines[2100] = "worker 2100: [ERROR] config.yaml rewritten by deploy"
+    lines[2500] = "worker 2500: C# build costs $5"
+    await server.load_context("\n".join(lines), "workers")
+    
+    # Literal punctuation is escaped, not run as a regex; without a trigram
+    # index the keyword path (postings, then a substring check) is cheaper
+    literal = await server.search_context("config.yaml", top_k=10)
+    plan = literal["plan"]
+    assert plan["shape"] == "literal" and plan["search_type"] == "keyword"
+    assert set(plan["considered"]) == {"keyword", "regex"} and plan["estimated_cost"] == plan["considered"]["keyword"]
+    exact = await server.search_context(re.escape("config.yaml"), search_type="regex", top_k=10)
+    assert {r["chunk_id"] for r in exact["results"]} <= {r["chunk_id"] for r in literal["results"]}
+    assert all("config.yaml" in r["content"] for r in literal["results"])
+    
+    # An escaped phrase runs as an escaped regex narrowed by trigrams
+    await server.search_context(r"worker \d+: \[", search_type="regex")
+    phrase = await server.search_context(r"\[ERROR\] config\.yaml", top_k=10)
+    assert phrase["plan"]["search_type"] == "regex" and phrase["plan"]["query"] == re.escape("[ERROR] config.yaml")
+    assert phrase["result_count"] >= 1
+    assert all("[ERROR] config.yaml" in r["content"] for r in phrase["results"])
+    
+    # Words stay with BM25 even when they mention "class"; unindexed words
+    # fall back to a substring scan
+    words = await server.search_context("which class registered handlers")
+    assert words["search_type"] == "bm25" and words["plan"]["shape"] == "words"
+    inner = await server.search_context("TimeoutError")
+    assert inner["plan"]["search_type"] == "regex" and inner["result_count"] >= 1
+    assert all("TimeoutError" in r["content"] for r in inner["results"])
+    assert (await server.search_context(r"handlers? registered$"))["search_type"] == "regex"
+    
+    # Literals too short for keyword search are scanned for instead
+    for short in ["$5", "C#"]:
+        found = await server.search_context(short)
+        assert found["plan"]["shape"] == "literal" and "keyword" not in found["plan"]["considered"]
+        assert found["result_count"] == 1 and short in found["results"][0]["content"], short
+        assert (await server.search_all(short))["result_count"] == 1, short
+    
+    # Several words with incidental punctuation are still ranked words
+    for question in ["settings, handlers", "error: could not read",
+                     "how do I read the config (yaml)?", "[ERROR] config.yaml"]:
+        asked = await server.search_context(question)
+        assert asked["plan"]["shape"] == "words" and asked["search_type"] == "bm25", question
+        assert asked["result_count"] >= 1, question
+        everywhere = await server.search_all(question)
+        assert everywhere["search_type"] == "bm25" and everywhere["result_count"] >= 1, question
+    print(f"  ✓ literal via {plan['search_type']} (cost {plan['estimated_cost']}), phrase via regex")
+
+
+async def test_regex_timeout():
+    """Regex scans run in killable guards under a time budget; nested quantifiers need force."""
+    print("\n[Regex guard] Time-budgeted regex scans...")
+    lines = [f"record {i}: token{i} ok" for i in range(3000)]
+    content = "\n".join(lines) + "\n" + "a" * 40 + "!\n"
+    guarded = make_server(RLM_CHUNK_SIZE=300, RLM_REGEX_TIMEOUT_MS=500)
+    plain = make_server(RLM_CHUNK_SIZE=300, RLM_REGEX_TIMEOUT_MS=0)
+    await guarded.load_context(content, "records")
+    await plain.load_context(content, "records")
+    
+    # Guarded scans find exactly what an in-process scan finds
+    for pattern in [r"token1\d\d\b", r"^record 29\d\d:", r"ok\na"]:
+        expected = await plain.search_context(pattern, search_type="regex", top_k=100)
+        result = await guarded.search_context(pattern, search_type="regex", top_k=100)
+        assert "timed_out" not in result
+        assert [r["chunk_id"] for r in result["results"]] == [r["chunk_id"] for r in expected["results"]]
+    
+    # Nested quantifiers are refused up front unless forced, leaving no query record
+    recorded = len(guarded.queries)
+    refused = await guarded.search_context(r"(a+)+$", search_type="regex")
+    assert "error" in refused and "force" in refused["error"]
+    assert len(guarded.queries) == recorded
+    assert "error" in await guarded.search_all(r"(\w+\s?)*$", search_type="regex")
+    assert "error" in await guarded.search_context(r"(\d+\s?)+", search_type="section")
+    assert "error" in await guarded.search_context(r"(.*:)+ token", search_type="regex")
+    # ...unless each iteration ends at a character the inner repeat cannot match
+    for pattern in [r"(\w+\.)+\w+", r"(\w+ )+12: token12\b", r"(\w+\s)+token7\b"]:
+        expected = await plain.search_context(pattern, search_type="regex", top_k=100)
+        result = await guarded.search_context(pattern, search_type="regex", top_k=100)
+        assert "error" not in result and "timed_out" not in result, pattern
+        assert result["result_count"] == expected["result_count"], pattern
+
+    # Concurrent scans share a bounded pool of guards, reusing idle ones
+    guarded.guard_limit = 2
+    patterns = [rf"token{i}\d\b" for i in range(1, 7)]
+    found = await asyncio.gather(*(guarded.search_context(p, search_type="regex", top_k=100)
+                                   for p in patterns))
+    expected = [await plain.search_context(p, search_type="regex", top_k=100) for p in patterns]
+    assert [r["results"] for r in found] == [r["results"] for r in expected]
+    assert guarded.live_guards <= 2 and len(guarded.guards) <= 2
+
+    # A forced catastrophic pattern is killed at the budget; the matches
+    # streamed back before that are returned, and nothing is cached
+    for _ in range(2):
+        started = time.time()
+        forced = await guarded.search_context(r"token\d+|(a+)+$", search_type="regex",
+                                              top_k=5, force=True)
+        elapsed = time.time() - started
+        assert forced["timed_out"] and "partial" in forced["warning"]
+        assert elapsed < 5, elapsed
+        assert forced["result_count"] == 5 and all("token" in r["content"] for r in forced["results"])
+    stats = await guarded.get_statistics()
+    assert stats["session_stats"]["regex_timeouts"] == 2
+    assert stats["configuration"]["regex_timeout_ms"] == 500
+    
+    # The killed guard is replaced on the next scan
+    after = await guarded.search_context(r"token2999\b", search_type="regex")
+    assert "timed_out" not in after and after["result_count"] == 1
+    print(f"  ✓ runaway pattern stopped after {elapsed:.2f}s with partial results")
+
+
 if __name__ == "__main__":
-    asyncio.run(test_basic_workflow())
+    run(test_basic_workflow)
+    run(test_inverted_index)
+    run(test_bm25_ranking)
+    run(test_offset_chunks)
+    run(test_warm_restart)
+    run(test_load_directory)
+    run(test_append)
+    run(test_append_equivalence)
+    run(test_regex_single_pass)
+    run(test_trigram_prefilter)
+    run(test_parallel_scan)
+    run(test_concurrent_dispatch)
+    run(test_query_cache)
+    run(test_recursive_views)
+    run(test_memory_budget)
+    run(test_outline_index)
+    run(test_structured_chunking)
+    run(test_cdc_reload)
+    run(test_content_ids)
+    run(test_search_all)
+    run(test_search_cursor)
+    run(test_snippets)
+    run(test_vector_search)
+    run(test_boolean_query)
+    run(test_multi_search)
+    run(test_query_planner)
+    run(test_regex_timeout)